@@ -0,0 +1,391 @@
+﻿from __future__ import annotations
+
+import asyncio
+import atexit
+import csv
+import io
+import json
+import logging
+from pathlib import Path
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable, Iterator
+
+from app.config import (
+    AUDIT_BATCH_SIZE,
+    AUDIT_FLUSH_INTERVAL_SECONDS,
+    AUDIT_JSONL_BACKUPS,
+    AUDIT_JSONL_MAX_BYTES,
+    AUDIT_LOG_PATH,
+    AUDIT_MAX_FIELD_CHARS,
+    AUDIT_QUEUE_POLICY,
+    AUDIT_QUEUE_SIZE,
+)
+
+FIELDS = (
+    "ts",
+    "session_id",
+    "priority",
+    "client",
+    "prompt",
+    "action",
+    "selected_tool",
+    "tool_input",
+    "fallback_reason",
+    "message",
+    "plan_ms",
+    "tool_ms",
+    "total_ms",
+    "error",
+)
+POLICIES = ("drop", "block")
+SQLITE_SUFFIXES = {".db", ".sqlite", ".sqlite3"}
+EXPORT_FORMATS = ("jsonl", "csv", "eval")
+
+logger = logging.getLogger(__name__)
+
+
+def audit_backend(path: str | Path) -> str:
+    """``sqlite`` for ``.db``/``.sqlite``/``.sqlite3`` paths, rotated ``jsonl`` otherwise."""
+    return "sqlite" if Path(path).suffix.lower() in SQLITE_SUFFIXES else "jsonl"
+
+
+class _SQLiteBackend:
+    def __init__(self, path: Path) -> None:
+        # Created on the writer thread; sqlite connections stay on the thread that opened them.
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{name} {_column_type(name)}" for name in FIELDS)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS audit (id INTEGER PRIMARY KEY, {columns})")
+        # Logs written by an older version lack the newer columns.
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(audit)")}
+        for name in FIELDS:
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE audit ADD COLUMN {name} {_column_type(name)}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS audit_ts ON audit (ts)")
+        self.conn.commit()
+
+    def write(self, records: list[dict[str, Any]]) -> None:
+        placeholders = ", ".join("?" for _ in FIELDS)
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO audit ({', '.join(FIELDS)}) VALUES ({placeholders})",
+                [tuple(_column_value(record.get(name)) for name in FIELDS) for record in records],
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class _JSONLBackend:
+    def __init__(self, path: Path, max_bytes: int, backups: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.fh = path.open("a", encoding="utf-8")
+
+    def write(self, records: list[dict[str, Any]]) -> None:
+        self.fh.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        self.fh.flush()
+        if self.max_bytes > 0 and self.fh.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        # audit.jsonl -> audit.jsonl.1 -> ... -> audit.jsonl.N (oldest is dropped).
+        self.fh.close()
+        for index in range(self.backups, 0, -1):
+            source = self.path if index == 1 else _rotated(self.path, index - 1)
+            if source.exists():
+                source.replace(_rotated(self.path, index))
+        if self.backups <= 0:
+            self.path.unlink(missing_ok=True)
+        self.fh = self.path.open("a", encoding="utf-8")
+
+    def close(self) -> None:
+        self.fh.close()
+
+
+def _rotated(path: Path, index: int) -> Path:
+    return path.with_name(f"{path.name}.{index}")
+
+
+def _clip(text: Any, limit: int) -> Any:
+    if not isinstance(text, str) or limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}...[{len(text) - limit} chars clipped]"
+
+
+def _column_type(name: str) -> str:
+    return "REAL" if name == "ts" or name.endswith("_ms") else "TEXT"
+
+
+def _column_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+class AuditSink:
+    """Record agent runs without adding write latency to the request.
+
+    ``put`` only enqueues; a background thread drains the queue in batches of up to
+    ``batch_size`` records (or whatever arrived within ``flush_interval`` seconds)
+    into SQLite in WAL mode or a size-rotated JSONL file. When the queue is full the
+    ``drop`` policy discards the record, while ``block`` waits up to
+    ``block_timeout`` seconds for room before discarding it (:meth:`aput` does that wait
+    off the event loop). Dropped records are counted. Prompts, messages and document
+    content are clipped to ``max_field_chars`` so a pasted document cannot bloat the log.
+    If the log cannot be opened the failure is logged and the sink disables itself:
+    ``put``/``aput`` then return False without queueing.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_queue: int = AUDIT_QUEUE_SIZE,
+        policy: str = AUDIT_QUEUE_POLICY,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL_SECONDS,
+        block_timeout: float = 1.0,
+        max_bytes: int = AUDIT_JSONL_MAX_BYTES,
+        backups: int = AUDIT_JSONL_BACKUPS,
+        max_field_chars: int = AUDIT_MAX_FIELD_CHARS,
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"audit queue policy must be one of {', '.join(POLICIES)}: {policy}")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.backend = audit_backend(self.path)
+        self.policy = policy
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.max_field_chars = max_field_chars
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._queue: queue.Queue[dict[str, Any] | None] = queue.Queue(maxsize=max_queue)
+        self._written = 0
+        self._dropped = 0
+        self._batches = 0
+        self._errors = 0
+        self._open_error: str | None = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, record: dict[str, Any]) -> bool:
+        if self._closed:
+            return False
+        record = self._clipped(record)
+        try:
+            if self.policy == "block":
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self._dropped += 1
+            return False
+
+    async def aput(self, record: dict[str, Any]) -> bool:
+        """:meth:`put` for the event loop: a ``block`` wait runs in the executor, not on the loop."""
+        if self._closed:
+            return False
+        record = self._clipped(record)
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            if self.policy != "block":
+                self._dropped += 1
+                return False
+        return await asyncio.get_running_loop().run_in_executor(None, self._put_waiting, record)
+
+    def _put_waiting(self, record: dict[str, Any]) -> bool:
+        try:
+            self._queue.put(record, timeout=self.block_timeout)
+            return True
+        except queue.Full:
+            self._dropped += 1
+            return False
+
+    def _clipped(self, record: dict[str, Any]) -> dict[str, Any]:
+        limit = self.max_field_chars
+        record = {**record, "prompt": _clip(record.get("prompt"), limit), "message": _clip(record.get("message"), limit)}
+        tool_input = record.get("tool_input")
+        if isinstance(tool_input, dict) and "content" in tool_input:
+            record["tool_input"] = {**tool_input, "content": _clip(tool_input["content"], limit)}
+        return record
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "backend": self.backend,
+            "policy": self.policy,
+            "queued": self._queue.qsize(),
+            "written": self._written,
+            "dropped": self._dropped,
+            "batches": self._batches,
+            "errors": self._errors,
+            "open_error": self._open_error,
+        }
+
+    def _open_backend(self):
+        if self.backend == "sqlite":
+            return _SQLiteBackend(self.path)
+        return _JSONLBackend(self.path, self._max_bytes, self._backups)
+
+    def _run(self) -> None:
+        try:
+            backend = self._open_backend()
+        except (OSError, sqlite3.Error) as exc:
+            logger.error("Audit log disabled: cannot open %s: %s", self.path, exc)
+            self._open_error = str(exc)
+            self._errors += 1
+            self._closed = True
+            self._discard_queued()
+            return
+        try:
+            while True:
+                batch, stop = self._next_batch()
+                if batch:
+                    try:
+                        backend.write(batch)
+                        self._written += len(batch)
+                        self._batches += 1
+                    except (OSError, sqlite3.Error):
+                        # Auditing never takes the agent down; the batch is counted as lost.
+                        self._errors += 1
+                        self._dropped += len(batch)
+                if stop:
+                    return
+        finally:
+            backend.close()
+
+    def _discard_queued(self) -> None:
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                self._dropped += 1
+
+    def _next_batch(self) -> tuple[list[dict[str, Any]], bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+
+def build_audit_sink(path: str = AUDIT_LOG_PATH) -> AuditSink | None:
+    if not path:
+        return None
+    sink = AuditSink(path)
+    # Short-lived CLI runs still flush what they recorded.
+    atexit.register(sink.close)
+    return sink
+
+
+default_audit_sink = build_audit_sink()
+
+
+def _jsonl_files(path: Path) -> list[Path]:
+    rotated = sorted(path.parent.glob(f"{path.name}.[0-9]*"), key=lambda item: int(item.suffix[1:]), reverse=True)
+    return [*rotated, path] if path.exists() else rotated
+
+
+def iter_records(path: str | Path) -> Iterator[dict[str, Any]]:
+    """All audit records in write order, from SQLite or from the JSONL file and its rotations."""
+    path = Path(path)
+    if not path.exists() and not _jsonl_files(path):
+        raise FileNotFoundError(f"Audit log not found: {path}")
+    if audit_backend(path) == "sqlite":
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            for row in conn.execute("SELECT * FROM audit ORDER BY id"):
+                record = {name: row[name] for name in FIELDS if name in row.keys()}
+                if record.get("tool_input"):
+                    record["tool_input"] = json.loads(record["tool_input"])
+                yield record
+        finally:
+            conn.close()
+        return
+    for file in _jsonl_files(path):
+        with file.open(encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def query_records(
+    path: str | Path,
+    tool: str | None = None,
+    fallback_only: bool = False,
+    since: float | None = None,
+    text: str | None = None,
+    limit: int = 50,
+) -> list[dict[str, Any]]:
+    """Most recent ``limit`` records matching the filters, oldest first."""
+    matches: list[dict[str, Any]] = []
+    for record in iter_records(path):
+        if tool and record.get("selected_tool") != tool:
+            continue
+        if fallback_only and not record.get("fallback_reason"):
+            continue
+        if since is not None and (record.get("ts") or 0) < since:
+            continue
+        if text and text not in (record.get("prompt") or ""):
+            continue
+        matches.append(record)
+    return matches[-limit:] if limit > 0 else matches
+
+
+def to_eval_case(record: dict[str, Any]) -> dict[str, Any] | None:
+    """A planner eval case (see ``planner_eval.load_cases``) from a run the LLM planned itself."""
+    if record.get("fallback_reason") or record.get("error") or not record.get("prompt"):
+        return None
+    if record.get("action") == "respond":
+        return {"prompt": record["prompt"], "expected": {"action": "respond"}}
+    arguments = {key: value for key, value in (record.get("tool_input") or {}).items() if key != "content"}
+    return {
+        "prompt": record["prompt"],
+        "expected": {"action": "use_tool", "tool_name": record.get("selected_tool"), "arguments": arguments},
+    }
+
+
+def export_records(records: Iterable[dict[str, Any]], format: str = "jsonl") -> str:
+    """Render records as JSONL, CSV, or planner eval cases (``eval``) to review and label."""
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"export format must be one of {', '.join(EXPORT_FORMATS)}")
+    if format == "csv":
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for record in records:
+            writer.writerow({name: _column_value(record.get(name)) for name in FIELDS})
+        return out.getvalue()
+    if format == "eval":
+        records = (case for case in map(to_eval_case, records) if case is not None)
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
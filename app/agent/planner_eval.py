@@ -0,0 +1,100 @@
+﻿from __future__ import annotations
+
+from dataclasses import dataclass, field
+import json
+from pathlib import Path
+import statistics
+import time
+from typing import Any
+
+DEFAULT_CASES_PATH = Path(__file__).with_name("planner_eval_cases.jsonl")
+
+
+@dataclass
+class EvalCase:
+    prompt: str
+    action: str
+    tool_name: str | None = None
+    arguments: dict[str, Any] = field(default_factory=dict)
+
+
+def load_cases(path: str | Path = DEFAULT_CASES_PATH) -> list[EvalCase]:
+    """Load labeled prompts from JSONL: ``{"prompt", "expected": {"action", "tool_name", "arguments"}}``.
+
+    ``arguments`` lists only the keys that must match; free-form fields such as
+    document content are usually left out.
+    """
+    cases = []
+    for line in Path(path).read_text(encoding="utf-8-sig").splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        expected = row.get("expected", {})
+        cases.append(
+            EvalCase(
+                prompt=row["prompt"],
+                action=expected.get("action", "use_tool"),
+                tool_name=expected.get("tool_name"),
+                arguments=dict(expected.get("arguments") or {}),
+            )
+        )
+    return cases
+
+
+def _same(actual: Any, expected: Any) -> bool:
+    if isinstance(expected, int) and not isinstance(expected, bool):
+        try:
+            return int(actual) == expected
+        except (TypeError, ValueError):
+            return False
+    if expected is None:
+        return actual in (None, "", "null")
+    return str(actual).strip().lower() == str(expected).strip().lower()
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def evaluate_planner(planner, cases: list[EvalCase]) -> dict[str, Any]:
+    """Run ``planner.plan`` on every case and score tool choice, arguments and latency."""
+    tool_hits = 0
+    arg_hits = 0
+    invalid = 0
+    latencies_ms: list[float] = []
+    failures: list[dict[str, Any]] = []
+
+    for case in cases:
+        started = time.perf_counter()
+        try:
+            decision = planner.plan(case.prompt)
+        except (ValueError, RuntimeError) as exc:
+            decision = {"error": str(exc)}
+            invalid += 1
+        latencies_ms.append((time.perf_counter() - started) * 1000)
+
+        tool_ok = decision.get("action") == case.action and (
+            case.action != "use_tool" or decision.get("tool_name") == case.tool_name
+        )
+        actual_args = decision.get("arguments") or {}
+        args_ok = tool_ok and all(_same(actual_args.get(key), value) for key, value in case.arguments.items())
+        tool_hits += tool_ok
+        arg_hits += args_ok
+        if not args_ok:
+            failures.append({"prompt": case.prompt, "decision": decision})
+
+    total = len(cases) or 1
+    return {
+        "cases": len(cases),
+        "tool_accuracy": round(tool_hits / total, 4),
+        "argument_accuracy": round(arg_hits / total, 4),
+        "invalid_outputs": invalid,
+        "latency_ms_mean": round(statistics.fmean(latencies_ms), 1) if latencies_ms else 0.0,
+        "latency_ms_p50": round(_percentile(latencies_ms, 50), 1),
+        "latency_ms_p95": round(_percentile(latencies_ms, 95), 1),
+        "failures": failures,
+    }
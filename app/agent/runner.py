@@ -1,19 +1,33 @@
 ﻿from __future__ import annotations
 
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextvars
 from dataclasses import dataclass
+import asyncio
+import threading
 import json
 import re
-from typing import Any, Protocol, TypedDict
-
-from app.llm.openvino_qwen import OpenVINOQwen
-from app.tools.document_create import create_document
-from app.tools.file_search import file_search
+import time
+from typing import Any, Iterable, Protocol, TypedDict
+
+from app.agent.audit import AuditSink, default_audit_sink
+from app.agent.sessions import SessionStore, build_turn, default_session_store
+from app.config import AGENT_SPECULATIVE_SEARCH
+from app.cancellation import CancellationToken, OperationCancelled, check_cancelled, current_token, use_token
+from app.llm.openvino_qwen import OpenVINOQwen, strip_reasoning
+from app.llm.prompt_budget import PromptBudget
+from app.llm.scheduler import DeadlineExceeded, SchedulerRejected, current_request
+from app.tools.document_create import create_document, create_document_stream
+from app.tools.federated_search import FederatedSearch
+from app.tools.registry import ToolRegistry, ToolSpec, default_tool_registry
+from app.tools.search_cache import SearchResultCache, default_search_cache
 
 
 @dataclass
 class AgentResult:
     message: str
     data: dict | list | None = None
+    etag: str | None = None
 
 
 class AgentState(TypedDict, total=False):
@@ -24,9 +38,76 @@ class AgentState(TypedDict, total=False):
     tool_output: dict[str, Any] | list[Any] | None
     message: str
     fallback_reason: str | None
+    session_id: str | None
+    history: list[dict[str, str]]
+    plan_ms: float
+    tool_ms: float
+    speculative_search: _Speculation | None
+    speculation: dict[str, Any] | None
+
+
+class _Speculation:
+    """A rule-predicted read-only tool call started while the LLM is still planning."""
+
+    def __init__(self, tool: ToolSpec, params: dict[str, Any]) -> None:
+        self.tool = tool
+        self.params = params
+        self.duration_ms = 0.0
+        self.future: Future | None = None
+        # Its own token, so a discarded guess stops walking; the request's token still applies.
+        self.token = CancellationToken(parent=current_token())
+
+    def run(self, agent: MVPAgent) -> AgentResult:
+        started = time.perf_counter()
+        try:
+            with use_token(self.token):
+                return self.tool.execute(agent, **self.params)
+        finally:
+            self.duration_ms = (time.perf_counter() - started) * 1000
+
+
+class SpeculationStats:
+    """Outcome of speculative searches across all agents (the API builds one agent per request)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+        self.wasted_ms = 0.0
+
+    def record_hit(self, saved_ms: float) -> None:
+        with self._lock:
+            self.hits += 1
+            self.saved_ms += saved_ms
+
+    def record_miss(self, wasted_ms: float) -> None:
+        with self._lock:
+            self.misses += 1
+            self.wasted_ms += wasted_ms
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "saved_ms_total": round(self.saved_ms, 3),
+                "wasted_ms_total": round(self.wasted_ms, 3),
+            }
+
+
+default_speculation_stats = SpeculationStats()
+# Speculative searches only read; a small shared pool keeps them from piling up under load.
+_speculation_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative-search")
 
 
 class Planner(Protocol):
+    """Planner contract. Planners may also define ``async aplan(user_prompt)``;
+    without it the async agent runs ``plan`` in a worker thread. For session
+    requests both are called with ``history=`` and ``session_id=`` keywords."""
+
     def plan(self, user_prompt: str) -> dict[str, Any]:
         ...
 
@@ -34,12 +115,73 @@ class Planner(Protocol):
 class LLMToolPlanner:
     """Use an LLM to choose one tool and generate its arguments as JSON."""
 
-    def __init__(self, llm: OpenVINOQwen | None = None) -> None:
+    # Placeholder the planner may use as document content when the request was
+    # too long to show in full; it is replaced by the original text after planning.
+    CONTENT_REF = "@user_request"
+    # The JSON answer never contains these; generation can end as soon as they appear.
+    STOP_SEQUENCES = ["```\n\n", "\n\n\n"]
+
+    def __init__(
+        self,
+        llm: OpenVINOQwen | None = None,
+        budget: PromptBudget | None = None,
+        enable_thinking: bool = False,
+        registry: ToolRegistry | None = None,
+    ) -> None:
         self.llm = llm or OpenVINOQwen()
+        self.enable_thinking = enable_thinking
+        self.budget = budget or PromptBudget(counter=getattr(self.llm, "count_tokens", None))
+        self.registry = registry or default_tool_registry
+        self._system_prompts: dict[tuple[int, bool], str] = {}
+
+    def plan(
+        self,
+        user_prompt: str,
+        history: list[dict[str, str]] | None = None,
+        session_id: str | None = None,
+    ) -> dict[str, Any]:
+        visible, truncated = self._fit_prompt(user_prompt)
+        raw = self.llm.invoke(f"User request: {visible}", **self._invoke_kwargs(truncated, history, session_id))
+        return self._parse_decision(raw, user_prompt, visible, truncated)
+
+    async def aplan(
+        self,
+        user_prompt: str,
+        history: list[dict[str, str]] | None = None,
+        session_id: str | None = None,
+    ) -> dict[str, Any]:
+        visible, truncated = await asyncio.to_thread(self._fit_prompt, user_prompt)
+        prompt = f"User request: {visible}"
+        kwargs = self._invoke_kwargs(truncated, history, session_id)
+        ainvoke = getattr(self.llm, "ainvoke", None)
+        if ainvoke is not None:
+            raw = await ainvoke(prompt, **kwargs)
+        else:
+            raw = await asyncio.to_thread(self.llm.invoke, prompt, **kwargs)
+        return self._parse_decision(raw, user_prompt, visible, truncated)
+
+    def _fit_prompt(self, user_prompt: str) -> tuple[str, bool]:
+        # excerpt() returns the prompt itself when it fits; one bounded pass either way.
+        visible = self.budget.excerpt(user_prompt)
+        return visible, visible is not user_prompt
+
+    def _invoke_kwargs(
+        self,
+        truncated: bool,
+        history: list[dict[str, str]] | None = None,
+        session_id: str | None = None,
+    ) -> dict[str, Any]:
+        kwargs: dict[str, Any] = {
+            "system": self._build_system_prompt(truncated=truncated),
+            "enable_thinking": self.enable_thinking,
+            "stop": self.STOP_SEQUENCES,
+        }
+        if session_id:
+            kwargs["history"] = history or []
+            kwargs["session_id"] = session_id
+        return kwargs
 
-    def plan(self, user_prompt: str) -> dict[str, Any]:
-        prompt = self._build_prompt(user_prompt)
-        raw = self.llm.invoke(prompt)
+    def _parse_decision(self, raw: str, user_prompt: str, visible: str, truncated: bool) -> dict[str, Any]:
         payload = self._extract_json(raw)
 
         try:
@@ -51,43 +193,68 @@ class LLMToolPlanner:
         if action not in {"use_tool", "respond"}:
             raise ValueError(f"Planner action must be 'use_tool' or 'respond': {data}")
 
+        # ``reply`` is the text the model generated; session history replays it verbatim.
         if action == "respond":
-            return {"action": "respond", "answer": str(data.get("answer", ""))}
+            return {"action": "respond", "answer": str(data.get("answer", "")), "reply": raw}
 
         tool_name = data.get("tool_name")
-        if tool_name not in {"file_search_tool", "document_create_tool"}:
+        tool = self.registry.get(tool_name) if isinstance(tool_name, str) else None
+        if tool is None:
             raise ValueError(f"Unsupported tool_name from planner: {tool_name}")
 
         arguments = data.get("arguments", {})
         if not isinstance(arguments, dict):
             raise ValueError("Planner arguments must be an object")
 
-        return {"action": "use_tool", "tool_name": tool_name, "arguments": arguments}
-
-    def _build_prompt(self, user_prompt: str) -> str:
+        if truncated and tool.content_arg:
+            arguments = self._resolve_content_ref(arguments, tool.content_arg, user_prompt, visible)
+
+        return {"action": "use_tool", "tool_name": tool_name, "arguments": arguments, "reply": raw}
+
+    def _resolve_content_ref(
+        self, arguments: dict[str, Any], content_arg: str, user_prompt: str, visible: str
+    ) -> dict[str, Any]:
+        content = str(arguments.get(content_arg, "")).strip()
+        if not content or self.CONTENT_REF in content or content in visible:
+            # The planner only saw an excerpt; hand the full text to the tool instead.
+            arguments = {**arguments, content_arg: user_prompt.strip()}
+        return arguments
+
+    def _build_system_prompt(self, truncated: bool = False) -> str:
+        """System prompt for the current tool set, built once per registry version."""
+        key = (self.registry.version, truncated)
+        prompt = self._system_prompts.get(key)
+        if prompt is None:
+            prompt = self._system_prompts[key] = self._render_system_prompt(truncated)
+        return prompt
+
+    def _render_system_prompt(self, truncated: bool) -> str:
+        note = ""
+        if truncated:
+            note = (
+                "The user request is a head/tail excerpt of a longer text.\n"
+                f"To save the full text as a document, set content to '{self.CONTENT_REF}'.\n"
+            )
         return (
-            "You are a tool planner. Output JSON only. No markdown.\\n"
-            "Choose exactly one action.\\n"
-            "Allowed actions:\\n"
-            "1) use_tool -> choose one tool and arguments\\n"
-            "2) respond -> direct answer when no tool is needed\\n"
-            "Tools:\\n"
-            "- file_search_tool arguments: root_path(str), pattern(str), max_results(int 1..200)\\n"
-            "- document_create_tool arguments: title(str), content(str), format('md'|'txt'), output_dir(str|null)\\n"
-            "If user mentions whole computer, use root_path='this_pc'.\\n"
-            "If user asks for python files, prefer pattern='*.py'.\\n"
-            "JSON schema:\\n"
-            "{\"action\":\"use_tool\",\"tool_name\":\"file_search_tool\",\"arguments\":{...}}\\n"
-            "or\\n"
-            "{\"action\":\"respond\",\"answer\":\"...\"}\\n"
-            f"User request: {user_prompt}"
+            "You are a tool planner. Output JSON only. No markdown.\n"
+            "Choose exactly one action.\n"
+            "Allowed actions:\n"
+            "1) use_tool -> choose one tool and arguments\n"
+            "2) respond -> direct answer when no tool is needed\n"
+            f"{self.registry.prompt_section()}"
+            "JSON schema:\n"
+            f"{{\"action\":\"use_tool\",\"tool_name\":\"{self.registry.names()[0]}\",\"arguments\":{{...}}}}\n"
+            "or\n"
+            "{\"action\":\"respond\",\"answer\":\"...\"}\n"
+            f"{note}"
         )
 
     def _extract_json(self, text: str) -> str:
+        text = strip_reasoning(text or "")
         if not text:
             raise ValueError("Planner returned empty response")
 
-        fenced = re.search(r"```(?:json)?\\s*(\{.*?\})\\s*```", text, re.DOTALL)
+        fenced = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL)
         if fenced:
             return fenced.group(1)
 
@@ -98,6 +265,10 @@ class LLMToolPlanner:
         raise ValueError(f"No JSON object found in planner output: {text}")
 
 
+def _error_text(error: BaseException) -> str:
+    return f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+
+
 class _InternalCompiledGraph:
     """Fallback graph executor used only when langgraph is unavailable."""
 
@@ -115,16 +286,45 @@ class _InternalCompiledGraph:
         state.update(self.agent._node_finalize(state))
         return state
 
+    async def ainvoke(self, initial_state: AgentState) -> AgentState:
+        state: AgentState = dict(initial_state)
+        state.update(await self.agent._anode_plan(state))
+        route = self.agent._route_from_plan(state)
+        if route == "use_tool":
+            state.update(await self.agent._anode_execute_tool(state))
+        else:
+            state.update(self.agent._node_respond(state))
+        state.update(self.agent._node_finalize(state))
+        return state
+
 
 class MVPAgent:
     """MVP agent with one-turn-one-tool LangGraph flow."""
 
-    def __init__(self, planner: Planner | None = None) -> None:
+    def __init__(
+        self,
+        planner: Planner | None = None,
+        search_cache: SearchResultCache | None = None,
+        session_store: SessionStore | None = None,
+        federation: FederatedSearch | None = None,
+        audit: AuditSink | None = None,
+        tools: ToolRegistry | None = None,
+        speculative: bool = AGENT_SPECULATIVE_SEARCH,
+        speculation_stats: SpeculationStats | None = None,
+    ) -> None:
         self.planner = planner or LLMToolPlanner()
+        self.search_cache = search_cache or default_search_cache
+        self.session_store = session_store or default_session_store
+        self.federation = federation
+        self.tools = tools or default_tool_registry
+        self.audit = audit or default_audit_sink
+        self.speculative = speculative
+        self.speculation_stats = speculation_stats or default_speculation_stats
         self._graph_backend = "langgraph"
         self._graph = self._build_graph()
+        self._agraph = None
 
-    def _build_graph(self):
+    def _build_graph(self, use_async: bool = False):
         try:
             from langgraph.graph import END, StateGraph
         except Exception:
@@ -132,8 +332,8 @@ class MVPAgent:
             return _InternalCompiledGraph(self)
 
         graph = StateGraph(AgentState)
-        graph.add_node("plan", self._node_plan)
-        graph.add_node("execute_tool", self._node_execute_tool)
+        graph.add_node("plan", self._anode_plan if use_async else self._node_plan)
+        graph.add_node("execute_tool", self._anode_execute_tool if use_async else self._node_execute_tool)
         graph.add_node("respond", self._node_respond)
         graph.add_node("finalize", self._node_finalize)
         graph.set_entry_point("plan")
@@ -152,14 +352,93 @@ class MVPAgent:
 
     def create_document(self, title: str, content: str, format: str = "md", output_dir: str | None = None) -> AgentResult:
         data = create_document(title=title, content=content, format=format, output_dir=output_dir)
+        self.search_cache.invalidate()
+        return AgentResult(message=f"Document created: {data['saved_path']}", data=data)
+
+    def create_document_stream(
+        self,
+        title: str,
+        chunks: Iterable[str | bytes],
+        format: str = "md",
+        output_dir: str | None = None,
+    ) -> AgentResult:
+        """Like :meth:`create_document` for content arriving in chunks (uploads, large files)."""
+        data = create_document_stream(title=title, chunks=chunks, format=format, output_dir=output_dir)
+        self.search_cache.invalidate()
         return AgentResult(message=f"Document created: {data['saved_path']}", data=data)
 
     def search_files(self, root_path: str = ".", pattern: str = "*.md", max_results: int = 20) -> AgentResult:
-        data = file_search(root_path=root_path, pattern=pattern, max_results=max_results)
-        return AgentResult(message=f"Found {len(data)} file(s)", data=data)
+        data, etag = self.search_cache.search(root_path=root_path, pattern=pattern, max_results=max_results)
+        return AgentResult(message=f"Found {len(data)} file(s)", data=data, etag=etag)
+
+    def search_file_records(self, root_path: str = ".", pattern: str = "*.md", max_results: int = 20) -> AgentResult:
+        """Like :meth:`search_files` but ``data`` holds typed :class:`FileRecord` objects."""
+        records, etag = self.search_cache.search_records(root_path=root_path, pattern=pattern, max_results=max_results)
+        return AgentResult(message=f"Found {len(records)} file(s)", data=records, etag=etag)
+
+    def search_files_federated(self, root_path: str = ".", pattern: str = "*.md", max_results: int = 20) -> AgentResult:
+        """Search this node and every configured peer; falls back to a local search without peers."""
+        if self.federation is None:
+            return self.search_files(root_path=root_path, pattern=pattern, max_results=max_results)
+
+        data, errors = self.federation.search(root_path=root_path, pattern=pattern, max_results=max_results)
+        nodes = len(self.federation.peers) + 1 - len(errors)
+        message = f"Found {len(data)} file(s) on {nodes} node(s)"
+        if errors:
+            message = f"{message}; unavailable: {', '.join(sorted(errors))}"
+        return AgentResult(message=message, data=data)
+
+    def run_prompt(self, prompt: str, session_id: str | None = None) -> AgentResult:
+        """Run one turn. With ``session_id``, earlier turns of that session are given to the planner."""
+        started = time.perf_counter()
+        state = self._initial_state(prompt, session_id)
+        error: BaseException | None = None
+        try:
+            state = self._graph.invoke(state)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            # Failed and cancelled runs are audited too, with what they got through.
+            if self.audit is not None:
+                self.audit.put(self._audit_record(state, started, error))
+        return self._result_from_state(state)
+
+    async def arun_prompt(self, prompt: str, session_id: str | None = None) -> AgentResult:
+        """Async variant of :meth:`run_prompt`; waiting on the LLM costs a coroutine, not a thread."""
+        if self._agraph is None:
+            self._agraph = self._build_graph(use_async=True)
+        started = time.perf_counter()
+        state = self._initial_state(prompt, session_id)
+        error: BaseException | None = None
+        try:
+            state = await self._agraph.ainvoke(state)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            if self.audit is not None:
+                await self.audit.aput(self._audit_record(state, started, error))
+        return self._result_from_state(state)
+
+    def _initial_state(self, prompt: str, session_id: str | None) -> AgentState:
+        state: AgentState = {"prompt": prompt}
+        if session_id:
+            state["session_id"] = session_id
+            state["history"] = self.session_store.history(session_id)
+        return state
 
-    def run_prompt(self, prompt: str) -> AgentResult:
-        state = self._graph.invoke({"prompt": prompt})
+    def _planner_kwargs(self, state: AgentState) -> dict[str, Any]:
+        session_id = state.get("session_id")
+        if not session_id:
+            return {}
+        return {"history": state.get("history", []), "session_id": session_id}
+
+    def _result_from_state(self, state: AgentState) -> AgentResult:
+        session_id = state.get("session_id")
+        if session_id:
+            turn = build_turn(state.get("prompt", ""), state.get("decision"), state.get("tool_output"))
+            self.session_store.append(session_id, turn)
         return AgentResult(
             message=state["message"],
             data={
@@ -168,19 +447,128 @@ class MVPAgent:
                 "tool_output": state.get("tool_output"),
                 "fallback_reason": state.get("fallback_reason"),
                 "graph_backend": self._graph_backend,
+                "session_id": session_id,
+                "speculation": state.get("speculation"),
             },
         )
 
+    def _audit_record(self, state: AgentState, started: float, error: BaseException | None = None) -> dict[str, Any]:
+        total_ms = (time.perf_counter() - started) * 1000
+        ctx = current_request()
+        return {
+            "ts": time.time(),
+            "session_id": state.get("session_id"),
+            "priority": ctx.priority,
+            "client": ctx.client,
+            "prompt": state.get("prompt", ""),
+            "action": state.get("decision", {}).get("action"),
+            "selected_tool": state.get("selected_tool"),
+            "tool_input": state.get("tool_input"),
+            "fallback_reason": state.get("fallback_reason"),
+            "message": state.get("message", ""),
+            "plan_ms": round(state.get("plan_ms", 0.0), 3),
+            "tool_ms": round(state.get("tool_ms", 0.0), 3),
+            "total_ms": round(total_ms, 3),
+            "error": None if error is None else _error_text(error),
+        }
+
     def _node_plan(self, state: AgentState) -> AgentState:
         prompt = state.get("prompt", "")
         fallback_reason = None
+        started = time.perf_counter()
+        speculation = self._start_speculation(prompt)
+        try:
+            decision = self.planner.plan(prompt, **self._planner_kwargs(state))
+        except (OperationCancelled, DeadlineExceeded, SchedulerRejected):
+            # Shed the whole request; falling back would still run the tool.
+            self._discard_speculation(speculation)
+            raise
+        except (ValueError, RuntimeError) as exc:
+            fallback_reason = str(exc)
+            decision = self._fallback_plan(prompt)
+
+        plan_ms = (time.perf_counter() - started) * 1000
+        return {
+            "decision": decision,
+            "fallback_reason": fallback_reason,
+            "plan_ms": plan_ms,
+            **self._resolve_speculation(speculation, decision),
+        }
+
+    async def _anode_plan(self, state: AgentState) -> AgentState:
+        prompt = state.get("prompt", "")
+        fallback_reason = None
+        started = time.perf_counter()
+        speculation = self._start_speculation(prompt)
         try:
-            decision = self.planner.plan(prompt)
+            kwargs = self._planner_kwargs(state)
+            aplan = getattr(self.planner, "aplan", None)
+            if aplan is not None:
+                decision = await aplan(prompt, **kwargs)
+            else:
+                decision = await asyncio.to_thread(self.planner.plan, prompt, **kwargs)
+        except (OperationCancelled, DeadlineExceeded, SchedulerRejected):
+            self._discard_speculation(speculation)
+            raise
         except (ValueError, RuntimeError) as exc:
             fallback_reason = str(exc)
             decision = self._fallback_plan(prompt)
 
-        return {"decision": decision, "fallback_reason": fallback_reason}
+        plan_ms = (time.perf_counter() - started) * 1000
+        return {
+            "decision": decision,
+            "fallback_reason": fallback_reason,
+            "plan_ms": plan_ms,
+            **self._resolve_speculation(speculation, decision),
+        }
+
+    def _start_speculation(self, prompt: str) -> _Speculation | None:
+        """Start the rule-predicted tool call now when that tool is read-only (never a write)."""
+        if not self.speculative:
+            return None
+        predicted = self._fallback_plan(prompt)
+        tool = self.tools.get(predicted["tool_name"])
+        if tool is None or not tool.read_only:
+            return None
+        try:
+            params = tool.prepare(predicted["arguments"])
+        except ValueError:
+            # The rule guess is unusable; the planned call validates its own arguments.
+            return None
+        speculation = _Speculation(tool, params)
+        # Copy the context so cancellation and request scheduling hints reach the tool.
+        context = contextvars.copy_context()
+        speculation.future = _speculation_pool.submit(context.run, speculation.run, self)
+        return speculation
+
+    def _resolve_speculation(self, speculation: _Speculation | None, decision: dict[str, Any]) -> AgentState:
+        if speculation is None:
+            return {}
+        arguments = decision.get("arguments")
+        if (
+            decision.get("action") == "use_tool"
+            and decision.get("tool_name") == speculation.tool.name
+            and isinstance(arguments, dict)
+            and self._same_arguments(speculation, arguments)
+        ):
+            return {"speculative_search": speculation}
+        self._discard_speculation(speculation)
+        return {"speculative_search": None, "speculation": {"status": "miss", **self.speculation_stats.snapshot()}}
+
+    def _same_arguments(self, speculation: _Speculation, arguments: dict[str, Any]) -> bool:
+        try:
+            return speculation.tool.prepare(arguments) == speculation.params
+        except ValueError:
+            return False
+
+    def _discard_speculation(self, speculation: _Speculation | None) -> None:
+        if speculation is None or speculation.future is None:
+            return
+        # A search that has not started yet costs nothing; a running one stops at its next
+        # cancellation checkpoint and is counted once it ends.
+        speculation.future.cancel()
+        speculation.token.cancel("discarded")
+        speculation.future.add_done_callback(lambda _: self.speculation_stats.record_miss(speculation.duration_ms))
 
     def _route_from_plan(self, state: AgentState) -> str:
         decision = state.get("decision", {})
@@ -189,29 +577,49 @@ class MVPAgent:
         return "respond"
 
     def _node_execute_tool(self, state: AgentState) -> AgentState:
+        check_cancelled()
+        started = time.perf_counter()
         decision = state.get("decision", {})
         tool_name = str(decision.get("tool_name", ""))
         args = decision.get("arguments", {})
         if not isinstance(args, dict):
             args = {}
 
-        if tool_name == "file_search_tool":
-            params = self._normalize_search_args(args)
-            tool_result = self.search_files(**params)
-        elif tool_name == "document_create_tool":
-            params = self._normalize_create_args(args)
-            tool_result = self.create_document(**params)
-        else:
+        tool = self.tools.get(tool_name)
+        speculation = state.get("speculative_search")
+        speculation_info = state.get("speculation")
+        if tool is None:
             params = {}
             tool_result = AgentResult(message="Unsupported tool", data=None)
+        elif speculation is not None and speculation.tool is tool:
+            params = speculation.params
+            waited = time.perf_counter()
+            tool_result = speculation.future.result()
+            saved_ms = max(0.0, speculation.duration_ms - (time.perf_counter() - waited) * 1000)
+            self.speculation_stats.record_hit(saved_ms)
+            speculation_info = {"status": "hit", "saved_ms": round(saved_ms, 3), **self.speculation_stats.snapshot()}
+        else:
+            try:
+                params = tool.prepare(args)
+            except ValueError as exc:
+                params = args
+                tool_result = AgentResult(message=f"Invalid arguments for {tool_name}: {exc}", data=None)
+            else:
+                tool_result = tool.execute(self, **params)
 
         return {
             "selected_tool": tool_name,
             "tool_input": params,
             "tool_output": tool_result.data,
             "message": tool_result.message,
+            "tool_ms": (time.perf_counter() - started) * 1000,
+            "speculation": speculation_info,
         }
 
+    async def _anode_execute_tool(self, state: AgentState) -> AgentState:
+        # Tools do blocking file I/O; keep it off the event loop.
+        return await asyncio.to_thread(self._node_execute_tool, state)
+
     def _node_respond(self, state: AgentState) -> AgentState:
         decision = state.get("decision", {})
         answer = str(decision.get("answer", "")).strip() or "No action needed."
@@ -305,31 +713,3 @@ class MVPAgent:
     def _derive_title(self, prompt: str) -> str:
         cleaned = re.sub(r"\s+", " ", prompt).strip()
         return cleaned[:40] if cleaned else "Agent_Note"
-
-    def _normalize_search_args(self, args: dict[str, Any]) -> dict[str, str | int]:
-        root_path = str(args.get("root_path", "."))
-        pattern = str(args.get("pattern", "*.md"))
-
-        raw_max = args.get("max_results", 20)
-        try:
-            max_results = int(raw_max)
-        except (TypeError, ValueError):
-            max_results = 20
-        max_results = max(1, min(200, max_results))
-
-        return {"root_path": root_path, "pattern": pattern, "max_results": max_results}
-
-    def _normalize_create_args(self, args: dict[str, Any]) -> dict[str, str | None]:
-        title = str(args.get("title", "Agent_Note")).strip() or "Agent_Note"
-        content = str(args.get("content", "")).strip() or "(empty)"
-        fmt = str(args.get("format", "md")).lower().strip()
-        if fmt not in {"md", "txt"}:
-            fmt = "md"
-
-        output_dir = args.get("output_dir")
-        if output_dir is None:
-            out = None
-        else:
-            out = str(output_dir)
-
-        return {"title": title, "content": content, "format": fmt, "output_dir": out}
@@ -0,0 +1,145 @@
+﻿from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import json
+import threading
+import time
+from typing import Any, Callable
+
+from app.config import SESSION_MAX_SESSIONS, SESSION_MAX_TURNS, SESSION_TTL_SECONDS
+
+# Messages are replayed to the planner on later turns; cap what each one costs.
+MAX_MESSAGE_CHARS = 2000
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    turns: list[list[dict[str, str]]] = field(default_factory=list)
+    created: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+def _clip(text: str) -> str:
+    return text if len(text) <= MAX_MESSAGE_CHARS else text[:MAX_MESSAGE_CHARS] + "...(truncated)"
+
+
+def build_turn(prompt: str, decision: dict[str, Any] | None, tool_output: Any) -> list[dict[str, str]]:
+    """Chat messages recorded for one agent turn: user prompt, planner decision, tool result.
+
+    The user message uses the same wording as the planner's request message, and the
+    assistant message is the planner's raw ``reply`` when it has one, so the rendered
+    history shares its token prefix with what the model saw and generated last turn.
+    """
+    messages = [{"role": "user", "content": _clip(f"User request: {prompt}")}]
+    if decision:
+        reply = decision.get("reply")
+        if not isinstance(reply, str):
+            reply = json.dumps({k: v for k, v in decision.items() if k != "reply"}, ensure_ascii=False)
+        messages.append({"role": "assistant", "content": reply})
+    if tool_output is not None:
+        messages.append({"role": "tool", "content": _clip(json.dumps(tool_output, ensure_ascii=False))})
+    return messages
+
+
+class SessionStore:
+    """In-memory chat sessions with LRU eviction, idle TTL and a per-session turn cap.
+
+    ``on_drop`` is called with the id of every session that is deleted, evicted or
+    expired, so per-session state kept elsewhere (the model's KV snapshots) goes too.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        max_turns: int = SESSION_MAX_TURNS,
+        on_drop: Callable[[str], None] | None = None,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.on_drop = on_drop
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+        self._lock = threading.Lock()
+        self._evictions = 0
+        self._expirations = 0
+
+    def history(self, session_id: str) -> list[dict[str, str]]:
+        """Return the retained messages of a session (empty for new or expired ones)."""
+        with self._lock:
+            dropped = self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._sessions.move_to_end(session_id)
+                messages = [dict(message) for turn in session.turns for message in turn]
+            else:
+                messages = []
+        self._dropped(dropped)
+        return messages
+
+    def append(self, session_id: str, turn: list[dict[str, str]]) -> None:
+        dropped = []
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession(session_id=session_id)
+                self._sessions[session_id] = session
+            session.turns.append(turn)
+            del session.turns[: max(0, len(session.turns) - self.max_turns)]
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                dropped.append(self._sessions.popitem(last=False)[0])
+                self._evictions += 1
+        self._dropped(dropped)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._sessions.pop(session_id, None) is not None
+        if deleted:
+            self._dropped([session_id])
+        return deleted
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            dropped = self._expire()
+            stats = {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "max_turns": self.max_turns,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+        self._dropped(dropped)
+        return stats
+
+    def _expire(self) -> list[str]:
+        # Caller holds self._lock. Oldest sessions sit at the front of the LRU order.
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = []
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used >= cutoff:
+                break
+            del self._sessions[session_id]
+            self._expirations += 1
+            expired.append(session_id)
+        return expired
+
+    def _dropped(self, session_ids: list[str]) -> None:
+        # Called without self._lock: the hook may talk to the model server.
+        if self.on_drop is None:
+            return
+        for session_id in session_ids:
+            try:
+                self.on_drop(session_id)
+            except Exception:
+                # Best effort: KV snapshots also expire on their own TTL.
+                pass
+
+
+default_session_store = SessionStore()
@@ -0,0 +1,200 @@
+﻿from __future__ import annotations
+
+import base64
+import json
+from pathlib import Path
+import queue
+import threading
+import time
+from typing import Any
+
+from app.api.profiling import DEBUG_TOKEN_HEADER
+from app.config import REQUEST_CAPTURE_MAX_BODY_BYTES, REQUEST_CAPTURE_QUEUE_SIZE, REQUEST_CAPTURE_REDACT_FIELDS
+
+REDACTED = "[redacted]"
+# Credentials never reach the capture file; the replay tool does not resend them.
+SENSITIVE_HEADERS = {
+    "authorization",
+    "proxy-authorization",
+    "cookie",
+    "set-cookie",
+    "x-api-key",
+    DEBUG_TOKEN_HEADER.lower(),
+}
+# Per-connection headers that must not be replayed verbatim.
+SKIPPED_HEADERS = {"host", "content-length", "connection", "transfer-encoding"}
+SKIPPED_PATHS = {"/v1/health"}
+
+
+def sanitize_headers(headers: list[tuple[bytes, bytes]]) -> dict[str, str]:
+    sanitized = {}
+    for raw_name, raw_value in headers:
+        name = raw_name.decode("latin-1").lower()
+        if name in SKIPPED_HEADERS:
+            continue
+        sanitized[name] = REDACTED if name in SENSITIVE_HEADERS else raw_value.decode("latin-1")
+    return sanitized
+
+
+def parse_fields(spec: str) -> frozenset[str]:
+    return frozenset(name.strip() for name in spec.split(",") if name.strip())
+
+
+def _redact(value: Any, fields: frozenset[str]) -> Any:
+    if isinstance(value, dict):
+        return {key: REDACTED if key in fields else _redact(item, fields) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_redact(item, fields) for item in value]
+    return value
+
+
+def encode_body(body: bytes, redact_fields: frozenset[str] = frozenset()) -> dict[str, Any]:
+    """Capture fields for a request body.
+
+    UTF-8 bodies are stored as text; JSON keys named in ``redact_fields`` are masked
+    at any depth (``body_redacted``). Other bodies are stored base64-encoded with
+    ``body_encoding: "base64"`` so replay resends the exact bytes.
+    """
+    try:
+        text = body.decode("utf-8")
+    except UnicodeDecodeError:
+        return {"body": base64.b64encode(body).decode("ascii"), "body_encoding": "base64"}
+    if redact_fields and text:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return {"body": text}
+        redacted = _redact(data, redact_fields)
+        if redacted != data:
+            return {"body": json.dumps(redacted, ensure_ascii=False), "body_redacted": True}
+    return {"body": text}
+
+
+class CaptureWriter:
+    """Append request records to a JSONL file from a background thread.
+
+    ``put`` never blocks the request path: when the queue is full the record is
+    dropped and counted instead.
+    """
+
+    def __init__(self, path: str | Path, max_queue: int = REQUEST_CAPTURE_QUEUE_SIZE) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue: queue.Queue[dict[str, Any] | None] = queue.Queue(maxsize=max_queue)
+        self._written = 0
+        self._dropped = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="request-capture", daemon=True)
+        self._thread.start()
+
+    def put(self, record: dict[str, Any]) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self._dropped += 1
+            return False
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "written": self._written,
+            "dropped": self._dropped,
+            "queued": self._queue.qsize(),
+        }
+
+    def _run(self) -> None:
+        with self.path.open("a", encoding="utf-8") as handle:
+            while True:
+                record = self._queue.get()
+                batch = [record]
+                # Drain whatever else is waiting so a burst costs one flush.
+                while record is not None:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    batch.append(record)
+                for item in batch:
+                    if item is not None:
+                        handle.write(json.dumps(item, ensure_ascii=False) + "\n")
+                        self._written += 1
+                handle.flush()
+                if batch[-1] is None:
+                    return
+
+
+class RequestCaptureMiddleware:
+    """ASGI middleware recording method, path, sanitized headers, body, status and latency.
+
+    Bodies larger than ``max_body_bytes`` are cut and flagged ``body_truncated``;
+    such records are skipped on replay. Bodies are recorded as sent, prompts
+    included, unless their JSON fields are listed in ``redact_fields``
+    (comma-separated, ``REQUEST_CAPTURE_REDACT_FIELDS``).
+    """
+
+    def __init__(
+        self,
+        app,
+        writer: CaptureWriter,
+        max_body_bytes: int = REQUEST_CAPTURE_MAX_BODY_BYTES,
+        redact_fields: str = REQUEST_CAPTURE_REDACT_FIELDS,
+    ) -> None:
+        self.app = app
+        self.writer = writer
+        self.max_body_bytes = max_body_bytes
+        self.redact_fields = parse_fields(redact_fields)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["path"] in SKIPPED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        body = bytearray()
+        truncated = False
+        status = 500
+
+        async def capture_receive():
+            nonlocal truncated
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                room = self.max_body_bytes - len(body)
+                if len(chunk) > room:
+                    truncated = True
+                body.extend(chunk[: max(0, room)])
+            return message
+
+        async def capture_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        ts = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            self.writer.put(
+                {
+                    "ts": ts,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "headers": sanitize_headers(scope.get("headers", [])),
+                    **encode_body(bytes(body), self.redact_fields),
+                    "body_truncated": truncated,
+                    "status": status,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                }
+            )
@@ -0,0 +1,168 @@
+﻿from __future__ import annotations
+
+from collections import Counter, OrderedDict
+import cProfile
+import io
+import marshal
+from pathlib import Path
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from typing import Any, Callable
+import uuid
+
+from app.config import DEBUG_PROFILE_KEEP
+
+# Credential for the debug endpoints; request capture redacts it.
+DEBUG_TOKEN_HEADER = "X-Debug-Token"
+
+# One capture at a time: overlapping samplers or tracemalloc sessions skew each other.
+_capture_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when another profile or allocation capture is already running."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> Counter[str]:
+    """Sample every thread's stack for ``seconds`` and count identical stacks.
+
+    Keys are collapsed stacks (``thread;outer;...;inner``), the input format of
+    flamegraph.pl and speedscope. The sampling thread itself is left out.
+    """
+    if not _capture_lock.acquire(blocking=False):
+        raise ProfilerBusy("another profile is already running")
+    try:
+        own = threading.get_ident()
+        stacks: Counter[str] = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _capture_lock.release()
+
+
+def render_collapsed(stacks: Counter[str]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def allocation_diff(seconds: float, limit: int = 30, frames: int = 1) -> dict[str, Any]:
+    """Diff two tracemalloc snapshots taken ``seconds`` apart, grouped by allocation site.
+
+    Tracing is only switched on for the capture (it slows allocations down), unless
+    it was already running, e.g. with ``PYTHONTRACEMALLOC``.
+    """
+    if not _capture_lock.acquire(blocking=False):
+        raise ProfilerBusy("another profile is already running")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(frames)
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _capture_lock.release()
+
+    key_type = "traceback" if frames > 1 else "lineno"
+    diff = after.compare_to(before, key_type)
+    return {
+        "seconds": seconds,
+        "traced_bytes": traced,
+        "peak_bytes": peak,
+        "top": [
+            {
+                "site": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size_diff": stat.size_diff,
+                "size": stat.size,
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+            }
+            for stat in diff[:limit]
+        ],
+    }
+
+
+def dump_threads() -> str:
+    """Current stack of every thread, in the style of ``faulthandler``."""
+    names = {thread.ident: thread for thread in threading.enumerate()}
+    parts = []
+    for ident, frame in sys._current_frames().items():
+        thread = names.get(ident)
+        header = f"Thread {thread.name if thread else ident} (ident={ident}"
+        header += ", daemon)" if thread is not None and thread.daemon else ")"
+        parts.append(header + "\n" + "".join(traceback.format_stack(frame)))
+    return "\n".join(parts)
+
+
+def profile_call(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> tuple[Any, bytes]:
+    """Run ``fn`` under cProfile and return its result with the stats in ``.pstats`` file format.
+
+    Only the calling thread is profiled, so ``fn`` should be the synchronous code path.
+    """
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(fn, *args, **kwargs)
+    finally:
+        profiler.create_stats()
+    return result, marshal.dumps(profiler.stats)
+
+
+def pstats_text(data: bytes, limit: int = 40, sort: str = "cumulative") -> str:
+    """Human-readable top functions of a ``.pstats`` payload."""
+    stats = pstats.Stats(_StatsSource(marshal.loads(data)), stream=(out := io.StringIO()))
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+class _StatsSource:
+    """Feeds already-loaded raw stats to :class:`pstats.Stats` without a temporary file."""
+
+    def __init__(self, stats: dict) -> None:
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+class ProfileStore:
+    """Keeps the most recent per-request profiles so they can be downloaded afterwards."""
+
+    def __init__(self, keep: int = DEBUG_PROFILE_KEEP) -> None:
+        self.keep = keep
+        self._profiles: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, data: bytes) -> str:
+        profile_id = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._profiles[profile_id] = data
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> bytes | None:
+        with self._lock:
+            return self._profiles.get(profile_id)
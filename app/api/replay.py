@@ -0,0 +1,173 @@
+﻿from __future__ import annotations
+
+import base64
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+from pathlib import Path
+import threading
+import time
+from typing import Any
+from urllib.parse import urlsplit
+
+from app.api.capture import REDACTED
+
+
+def load_capture(path: str | Path) -> list[dict[str, Any]]:
+    """Read a capture file, skipping records whose body was truncated, in arrival order."""
+    records = []
+    for line in Path(path).read_text(encoding="utf-8-sig").splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get("body_truncated"):
+            continue
+        records.append(record)
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def record_body(record: dict[str, Any]) -> bytes | None:
+    """The request body bytes of a capture record (base64 bodies are decoded)."""
+    body = record.get("body")
+    if not body:
+        return None
+    if record.get("body_encoding") == "base64":
+        return base64.b64decode(body)
+    return body.encode("utf-8")
+
+
+def parse_speed(value: str) -> float:
+    """``1``, ``10x`` or ``max`` (0.0 means send everything without waiting)."""
+    value = value.strip().lower()
+    if value == "max":
+        return 0.0
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise ValueError("speed must be positive or 'max'")
+    return speed
+
+
+def schedule(records: list[dict[str, Any]], speed: float) -> list[float]:
+    """Send offsets in seconds from replay start, preserving the captured inter-arrival gaps."""
+    if not records:
+        return []
+    first = records[0]["ts"]
+    if speed <= 0:
+        return [0.0] * len(records)
+    return [(record["ts"] - first) / speed for record in records]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples: list[dict[str, Any]], elapsed: float) -> dict[str, Any]:
+    """Latency distribution and error rate per ``METHOD path`` plus an overall row."""
+    groups: dict[str, list[dict[str, Any]]] = {}
+    for sample in samples:
+        groups.setdefault(f"{sample['method']} {sample['path']}", []).append(sample)
+    groups["all"] = samples
+
+    report: dict[str, Any] = {"requests": len(samples), "elapsed_s": round(elapsed, 2), "paths": {}}
+    report["throughput_rps"] = round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0
+    for key, items in groups.items():
+        latencies = [item["latency_ms"] for item in items]
+        errors = sum(1 for item in items if item["status"] is None or item["status"] >= 500)
+        report["paths"][key] = {
+            "count": len(items),
+            "errors": errors,
+            "error_rate": round(errors / len(items), 4) if items else 0.0,
+            "client_errors": sum(1 for item in items if item["status"] is not None and 400 <= item["status"] < 500),
+            "p50_ms": round(_percentile(latencies, 50), 1),
+            "p90_ms": round(_percentile(latencies, 90), 1),
+            "p99_ms": round(_percentile(latencies, 99), 1),
+            "max_ms": round(max(latencies, default=0.0), 1),
+        }
+    return report
+
+
+class ReplayClient:
+    """Open-loop replay: requests leave at their scheduled time whether or not earlier ones finished.
+
+    Latency is measured from the *scheduled* send time, so time spent waiting for a
+    free worker counts against the server instead of silently slowing the load.
+    """
+
+    def __init__(self, base_url: str, max_workers: int = 64, timeout: float = 300.0) -> None:
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port
+        self.secure = parts.scheme == "https"
+        self.prefix = parts.path.rstrip("/")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def replay(self, records: list[dict[str, Any]], speed: float = 1.0) -> dict[str, Any]:
+        offsets = schedule(records, speed)
+        samples: list[dict[str, Any]] = []
+        lock = threading.Lock()
+        started = time.perf_counter()
+
+        def run(record: dict[str, Any], due: float) -> None:
+            sample = self._send(record, due)
+            with lock:
+                samples.append(sample)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="replay") as pool:
+            for record, offset in zip(records, offsets):
+                due = started + offset
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(run, record, due)
+        return summarize(samples, time.perf_counter() - started)
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _send(self, record: dict[str, Any], due: float) -> dict[str, Any]:
+        headers = {name: value for name, value in (record.get("headers") or {}).items() if value != REDACTED}
+        target = self.prefix + record["path"] + (f"?{record['query']}" if record.get("query") else "")
+        status: int | None = None
+        conn = self._connection()
+        try:
+            conn.request(record["method"], target, body=record_body(record), headers=headers)
+            res = conn.getresponse()
+            res.read()
+            status = res.status
+            if res.will_close:
+                conn.close()
+                self._local.conn = None
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+        return {
+            "method": record["method"],
+            "path": record["path"],
+            "status": status,
+            "latency_ms": (time.perf_counter() - due) * 1000,
+        }
+
+
+def render_summary(report: dict[str, Any]) -> str:
+    lines = [
+        f"{report['requests']} requests in {report['elapsed_s']}s ({report['throughput_rps']} req/s)",
+        f"{'path':<32} {'count':>6} {'err%':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}",
+    ]
+    for key, row in report["paths"].items():
+        lines.append(
+            f"{key:<32} {row['count']:>6} {row['error_rate'] * 100:>5.1f}% "
+            f"{row['p50_ms']:>8} {row['p90_ms']:>8} {row['p99_ms']:>8} {row['max_ms']:>8}"
+        )
+    return "\n".join(lines)
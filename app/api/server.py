@@ -1,29 +1,68 @@
 ﻿from __future__ import annotations
 
-from typing import Any
+import asyncio
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import hashlib
+import hmac
+import time
+from typing import Any, AsyncIterator, Iterator
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 
-from app.agent.runner import MVPAgent
+from app.agent.runner import LLMToolPlanner, MVPAgent
+from app.agent.sessions import default_session_store
+from app.api.capture import CaptureWriter, RequestCaptureMiddleware
+from app.api.profiling import (
+    DEBUG_TOKEN_HEADER,
+    ProfilerBusy,
+    ProfileStore,
+    allocation_diff,
+    dump_threads,
+    profile_call,
+    pstats_text,
+    render_collapsed,
+    sample_stacks,
+)
+from app.cancellation import CancellationToken, OperationCancelled, cancellation_scope
+from app.config import (
+    DEBUG_MAX_PROFILE_SECONDS,
+    DEBUG_TOKEN,
+    DOCUMENT_WRITE_BUFFER_BYTES,
+    MODEL_SERVER_ADDRESS,
+    REQUEST_CAPTURE_PATH,
+    REQUEST_TIMEOUT_SECONDS,
+    SCHEDULER_BATCH_TIMEOUT_SECONDS,
+    SCHEDULER_INTERACTIVE_TIMEOUT_SECONDS,
+    SCHEDULER_MAX_CONCURRENT,
+    SCHEDULER_RETRY_AFTER_SECONDS,
+)
+from app.llm.lifecycle import ModelLifecycleManager
+from app.llm.model_server import ModelClient
 from app.llm.openvino_qwen import OpenVINOQwen
+from app.llm.replicas import build_replica_pool
+from app.llm.scheduler import PRIORITIES, DeadlineExceeded, LLMScheduler, SchedulerRejected, request_context
+from app.tools.document_create import DocumentCreateInput
+from app.tools.federated_search import FederatedSearch, build_federated_search
+from app.tools.file_search import FileRecord, FileSearchInput
+from app.tools.registry import default_tool_registry
+from app.tools.result_formats import MSGPACK_MEDIA_TYPES, negotiate_format, pack_msgpack, to_columns
+from app.tools.search_cache import default_search_cache
 
 
 class ChatRequest(BaseModel):
     prompt: str = Field(min_length=1)
+    session_id: str | None = Field(default=None, min_length=1, max_length=128)
 
 
-class CreateRequest(BaseModel):
-    title: str = Field(min_length=1, max_length=200)
-    content: str = Field(min_length=1)
-    format: str = Field(default="md", pattern="^(md|txt)$")
-    output_dir: str | None = None
+# Request bodies reuse the tools' input models so limits are declared once.
+CreateRequest = DocumentCreateInput
 
 
-class SearchRequest(BaseModel):
-    root_path: str = "."
-    pattern: str = "*.md"
-    max_results: int = Field(default=20, ge=1, le=200)
+class SearchRequest(FileSearchInput):
+    federated: bool = False
 
 
 class AgentResponse(BaseModel):
@@ -31,24 +70,191 @@ class AgentResponse(BaseModel):
     data: dict[str, Any] | list[Any] | None
 
 
-def get_agent() -> MVPAgent:
-    return MVPAgent()
+@lru_cache(maxsize=1)
+def get_llm() -> LLMScheduler:
+    """Process-wide model handle so the weights are loaded at most once per worker.
 
+    With MODEL_SERVER_ADDRESS set, all workers share the model owned by
+    ``python -m app.main serve-model`` instead of loading their own copy.
+    Calls go through a scheduler so interactive requests are not stuck behind batch work.
+    Sessions that end in the session store release their KV snapshots on this handle.
+    """
+    if MODEL_SERVER_ADDRESS:
+        llm = LLMScheduler(ModelClient(MODEL_SERVER_ADDRESS))
+    elif (pool := build_replica_pool()) is not None:
+        # Let the scheduler keep every replica busy.
+        llm = LLMScheduler(
+            ModelLifecycleManager(pool),
+            max_concurrent=max(SCHEDULER_MAX_CONCURRENT, len(pool.replicas)),
+        )
+    else:
+        llm = LLMScheduler(ModelLifecycleManager(OpenVINOQwen()))
+    default_session_store.on_drop = llm.drop_session
+    return llm
 
-def create_app() -> FastAPI:
-    app = FastAPI(title="OpenVINO LangGraph Agent API", version="1.0.0")
+
+def client_id(request: Request, api_key: str | None) -> str:
+    """Fair-share key: a digest of the API key, else the peer address (keys never reach stats)."""
+    if api_key:
+        return "key-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return request.client.host if request.client else "anonymous"
+
+
+@lru_cache(maxsize=1)
+def get_federation() -> FederatedSearch | None:
+    """Shared peer fan-out (and its keep-alive connections) when SEARCH_PEERS is set."""
+    return build_federated_search(lambda root, pattern, limit: default_search_cache.search(root, pattern, limit)[0])
+
+
+async def watch_disconnect(request: Request, token: CancellationToken, interval: float = 0.25) -> None:
+    """Cancel ``token`` when the client hangs up so in-flight work stops at its next checkpoint."""
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel("client disconnected")
+            return
+        await asyncio.sleep(interval)
+
+
+def cancelled_response(exc: OperationCancelled, token: CancellationToken) -> HTTPException:
+    # 499 (client closed request) is only logged: nobody is left to read it.
+    return HTTPException(status_code=504 if token.timed_out else 499, detail=str(exc))
+
+
+def overloaded_response(exc: DeadlineExceeded | SchedulerRejected) -> HTTPException:
+    # 429: this client is over its queue share; 503: the model could not take the request in time.
+    status_code = 429 if isinstance(exc, SchedulerRejected) else 503
+    return HTTPException(
+        status_code=status_code,
+        detail=str(exc),
+        headers={"Retry-After": str(SCHEDULER_RETRY_AFTER_SECONDS)},
+    )
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """True if an If-None-Match list names ``etag`` (weak comparison) or is ``*``."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def iterate_in_thread(chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop) -> Iterator[bytes]:
+    """Consume an async byte stream from a worker thread, one chunk at a time."""
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(chunks.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+async def upload_chunks(upload, chunk_size: int) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(chunk_size):
+        yield chunk
+
+
+def attachment(body: str | bytes, filename: str, media_type: str) -> Response:
+    return Response(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@lru_cache(maxsize=1)
+def get_planner(llm: LLMScheduler = Depends(get_llm)) -> LLMToolPlanner:
+    """One planner per model handle, so its system prompts and token counts outlive a request."""
+    return LLMToolPlanner(llm=llm)
+
+
+def get_agent(
+    planner: LLMToolPlanner = Depends(get_planner),
+    federation: FederatedSearch | None = Depends(get_federation),
+) -> MVPAgent:
+    return MVPAgent(planner=planner, federation=federation)
+
+
+def create_app(capture_path: str = REQUEST_CAPTURE_PATH, debug_token: str = DEBUG_TOKEN) -> FastAPI:
+    # Opt-in traffic capture for `python -m app.main replay`.
+    capture = CaptureWriter(capture_path) if capture_path else None
+    profiles = ProfileStore()
+
+    def require_debug(x_debug_token: str | None = Header(default=None, alias=DEBUG_TOKEN_HEADER)) -> None:
+        # Debug endpoints do not exist unless DEBUG_TOKEN is set.
+        if not debug_token:
+            raise HTTPException(status_code=404, detail="Not Found")
+        if not x_debug_token or not hmac.compare_digest(x_debug_token.encode("utf-8"), debug_token.encode("utf-8")):
+            raise HTTPException(status_code=403, detail=f"Invalid {DEBUG_TOKEN_HEADER}")
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        if capture is not None:
+            capture.close()
+
+    app = FastAPI(title="OpenVINO LangGraph Agent API", version="1.0.0", lifespan=lifespan)
+    app.state.capture = capture
+    if capture is not None:
+        app.add_middleware(RequestCaptureMiddleware, writer=capture)
 
     @app.get("/v1/health")
     def health() -> dict[str, str]:
         return {"status": "ok"}
 
     @app.post("/v1/agent/chat", response_model=AgentResponse)
-    def chat(req: ChatRequest, agent: MVPAgent = Depends(get_agent)) -> AgentResponse:
-        try:
-            result = agent.run_prompt(req.prompt)
-            return AgentResponse(message=result.message, data=result.data)
-        except Exception as exc:
-            raise HTTPException(status_code=500, detail=str(exc)) from exc
+    async def chat(
+        req: ChatRequest,
+        request: Request,
+        response: Response,
+        agent: MVPAgent = Depends(get_agent),
+        x_priority: str = Header(default="interactive"),
+        x_api_key: str | None = Header(default=None),
+        x_request_timeout: float | None = Header(default=None, gt=0),
+        x_debug_token: str | None = Header(default=None, alias=DEBUG_TOKEN_HEADER),
+        profile: bool = Query(default=False),
+    ) -> AgentResponse:
+        """Run one agent turn. ``?profile=1`` (with X-Debug-Token) attaches a cProfile of the turn."""
+        if profile:
+            require_debug(x_debug_token)
+        if x_priority not in PRIORITIES:
+            raise HTTPException(status_code=400, detail=f"X-Priority must be one of {', '.join(PRIORITIES)}")
+        queue_timeout = x_request_timeout or (
+            SCHEDULER_INTERACTIVE_TIMEOUT_SECONDS if x_priority == "interactive" else SCHEDULER_BATCH_TIMEOUT_SECONDS
+        )
+        with (
+            request_context(x_priority, client_id(request, x_api_key), queue_timeout) as ctx,
+            cancellation_scope(x_request_timeout or REQUEST_TIMEOUT_SECONDS) as token,
+        ):
+            watcher = asyncio.create_task(watch_disconnect(request, token))
+            profile_id = None
+            try:
+                if profile:
+                    # cProfile follows a single thread, so profile the synchronous run_prompt path.
+                    result, stats = await asyncio.to_thread(
+                        profile_call, agent.run_prompt, req.prompt, session_id=req.session_id
+                    )
+                    profile_id = profiles.add(stats)
+                else:
+                    result = await agent.arun_prompt(req.prompt, session_id=req.session_id)
+            except OperationCancelled as exc:
+                raise cancelled_response(exc, token) from exc
+            except (DeadlineExceeded, SchedulerRejected) as exc:
+                raise overloaded_response(exc) from exc
+            except Exception as exc:
+                raise HTTPException(status_code=500, detail=str(exc)) from exc
+            finally:
+                watcher.cancel()
+        response.headers["Server-Timing"] = f"queue;dur={ctx.queue_wait_ms:.1f}, inference;dur={ctx.inference_ms:.1f}"
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
+            response.headers["Link"] = f'</v1/debug/profiles/{profile_id}>; rel="profile"'
+        return AgentResponse(message=result.message, data=result.data)
+
+    @app.get("/v1/agent/sessions")
+    def session_stats() -> dict[str, Any]:
+        return default_session_store.stats()
+
+    @app.delete("/v1/agent/sessions/{session_id}")
+    def delete_session(session_id: str) -> dict[str, Any]:
+        if not default_session_store.delete(session_id):
+            raise HTTPException(status_code=404, detail=f"Unknown session: {session_id}")
+        return {"deleted": session_id}
 
     @app.post("/v1/tools/create", response_model=AgentResponse)
     def create_doc(req: CreateRequest, agent: MVPAgent = Depends(get_agent)) -> AgentResponse:
@@ -65,19 +271,163 @@ def create_app() -> FastAPI:
         except Exception as exc:
             raise HTTPException(status_code=500, detail=str(exc)) from exc
 
-    @app.post("/v1/tools/search", response_model=AgentResponse)
-    def search(req: SearchRequest, agent: MVPAgent = Depends(get_agent)) -> AgentResponse:
+    @app.post("/v1/tools/create/stream", response_model=AgentResponse)
+    async def create_doc_stream(
+        request: Request,
+        title: str | None = Query(default=None, min_length=1, max_length=200),
+        format: str = Query(default="md", pattern="^(md|txt)$"),
+        output_dir: str | None = None,
+        agent: MVPAgent = Depends(get_agent),
+    ) -> AgentResponse:
+        """Create a document from a raw request body or a multipart ``file`` part.
+
+        The body is written to disk as it arrives, so memory use does not grow with
+        the document size. Raw bodies take ``title``/``format``/``output_dir`` from the
+        query string; multipart requests may also send them as form fields.
+        """
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            try:
+                # Starlette spools uploaded parts to temporary files (needs python-multipart).
+                form = await request.form()
+            except AssertionError as exc:
+                raise HTTPException(status_code=415, detail="multipart uploads need python-multipart") from exc
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="multipart request needs a 'file' part")
+            title = str(form.get("title") or title or "")
+            format = str(form.get("format") or format)
+            output_dir = str(form.get("output_dir") or output_dir or "") or None
+            chunks = upload_chunks(upload, DOCUMENT_WRITE_BUFFER_BYTES)
+        else:
+            chunks = request.stream()
+        if not title:
+            raise HTTPException(status_code=400, detail="title is required")
+
+        loop = asyncio.get_running_loop()
         try:
-            result = agent.search_files(
-                root_path=req.root_path,
-                pattern=req.pattern,
-                max_results=req.max_results,
+            result = await asyncio.to_thread(
+                agent.create_document_stream,
+                title=title,
+                chunks=iterate_in_thread(chunks, loop),
+                format=format,
+                output_dir=output_dir,
             )
-            return AgentResponse(message=result.message, data=result.data)
         except ValueError as exc:
             raise HTTPException(status_code=400, detail=str(exc)) from exc
         except Exception as exc:
             raise HTTPException(status_code=500, detail=str(exc)) from exc
+        return AgentResponse(message=result.message, data=result.data)
+
+    @app.post("/v1/tools/search", response_model=AgentResponse)
+    def search(
+        req: SearchRequest,
+        request: Request,
+        response: Response,
+        agent: MVPAgent = Depends(get_agent),
+        format: str | None = Query(default=None, pattern="^(rows|columns|msgpack)$"),
+        x_request_timeout: float | None = Header(default=None, gt=0),
+    ) -> AgentResponse | Response:
+        """Search files; results are JSON rows unless ``format`` or Accept asks for columns or msgpack.
+
+        ``columns`` returns ``{"path": [...], "size": [...], "mtime": [...]}`` with integer
+        sizes and mtimes; ``msgpack`` sends the same columns as a binary body.
+        """
+        fmt = negotiate_format(format, request.headers.get("accept", ""))
+        if req.federated:
+            search_files = agent.search_files_federated
+        else:
+            search_files = agent.search_files if fmt == "rows" else agent.search_file_records
+        try:
+            with cancellation_scope(x_request_timeout or REQUEST_TIMEOUT_SECONDS) as token:
+                result = search_files(
+                    root_path=req.root_path,
+                    pattern=req.pattern,
+                    max_results=req.max_results,
+                )
+        except OperationCancelled as exc:
+            raise cancelled_response(exc, token) from exc
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+        headers = {"Vary": "Accept"}
+        if result.etag:
+            # Each representation gets its own validator.
+            etag = result.etag if fmt == "rows" else f'{result.etag[:-1]}-{fmt}"'
+            if etag_matches(request.headers.get("if-none-match", ""), etag):
+                return Response(status_code=304, headers={**headers, "ETag": etag})
+            headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+
+        if fmt == "rows":
+            response.headers.update(headers)
+            return AgentResponse(message=result.message, data=result.data)
+
+        records = [item if isinstance(item, FileRecord) else FileRecord.from_row(item) for item in result.data]
+        payload = {"message": result.message, "data": to_columns(records)}
+        if fmt == "columns":
+            return JSONResponse(payload, headers=headers)
+        try:
+            return Response(pack_msgpack(payload), media_type=MSGPACK_MEDIA_TYPES[0], headers=headers)
+        except RuntimeError as exc:
+            raise HTTPException(status_code=406, detail=str(exc)) from exc
+
+    @app.get("/v1/tools")
+    def list_tools() -> list[dict[str, Any]]:
+        return default_tool_registry.describe()
+
+    @app.get("/v1/tools/search/cache")
+    def search_cache_stats() -> dict[str, Any]:
+        return default_search_cache.stats()
+
+    @app.get("/v1/model/status")
+    def model_status(llm: LLMScheduler = Depends(get_llm)) -> dict[str, Any]:
+        return llm.status()
+
+    @app.post("/v1/model/unload")
+    def unload_model(llm: LLMScheduler = Depends(get_llm)) -> dict[str, Any]:
+        return {"unloaded": llm.unload(), **llm.status()}
+
+    @app.get("/v1/debug/profile", dependencies=[Depends(require_debug)])
+    async def debug_profile(
+        seconds: float = Query(default=5.0, gt=0, le=DEBUG_MAX_PROFILE_SECONDS),
+        interval_ms: float = Query(default=5.0, ge=1, le=1000),
+    ) -> Response:
+        """Sample all threads for ``seconds``; returns collapsed stacks for flamegraph.pl/speedscope."""
+        try:
+            stacks = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000)
+        except ProfilerBusy as exc:
+            raise HTTPException(status_code=409, detail=str(exc)) from exc
+        return attachment(render_collapsed(stacks), f"profile-{int(time.time())}.collapsed", "text/plain; charset=utf-8")
+
+    @app.get("/v1/debug/allocations", dependencies=[Depends(require_debug)])
+    async def debug_allocations(
+        seconds: float = Query(default=5.0, gt=0, le=DEBUG_MAX_PROFILE_SECONDS),
+        limit: int = Query(default=30, ge=1, le=500),
+        frames: int = Query(default=1, ge=1, le=50),
+    ) -> dict[str, Any]:
+        """tracemalloc diff of allocations made during the next ``seconds``, largest growth first."""
+        try:
+            return await asyncio.to_thread(allocation_diff, seconds, limit, frames)
+        except ProfilerBusy as exc:
+            raise HTTPException(status_code=409, detail=str(exc)) from exc
+
+    @app.get("/v1/debug/threads", dependencies=[Depends(require_debug)])
+    def debug_threads() -> Response:
+        return Response(dump_threads(), media_type="text/plain; charset=utf-8")
+
+    @app.get("/v1/debug/profiles/{profile_id}", dependencies=[Depends(require_debug)])
+    def debug_request_profile(
+        profile_id: str,
+        format: str = Query(default="pstats", pattern="^(pstats|text)$"),
+    ) -> Response:
+        """Download a ``?profile=1`` chat profile (kept in memory by the worker that served it)."""
+        data = profiles.get(profile_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail=f"Unknown profile: {profile_id}")
+        if format == "text":
+            return Response(pstats_text(data), media_type="text/plain; charset=utf-8")
+        return attachment(data, f"chat-{profile_id}.pstats", "application/octet-stream")
 
     @app.post("/v1/model/download")
     def download_model() -> dict[str, str]:
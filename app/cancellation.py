@@ -0,0 +1,85 @@
+﻿from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+from typing import Iterator
+
+
+class OperationCancelled(RuntimeError):
+    """Raised at a cancellation checkpoint once the current request was cancelled."""
+
+
+class CancellationToken:
+    """Cooperative cancellation flag with an optional wall-clock deadline.
+
+    Long-running loops (token generation, directory walks) call
+    :func:`check_cancelled` between steps; nothing is interrupted forcibly.
+
+    A token with a ``parent`` is also cancelled when the parent is, so side work
+    can be stopped on its own without outliving the request.
+    """
+
+    def __init__(self, timeout: float | None = None, parent: CancellationToken | None = None) -> None:
+        self._event = threading.Event()
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.parent = parent
+        self.reason: str | None = None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.parent is not None and self.parent.cancelled:
+            self.cancel(self.parent.reason or "cancelled")
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("timed out")
+            return True
+        return False
+
+    @property
+    def timed_out(self) -> bool:
+        return self.cancelled and self.reason == "timed out"
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise OperationCancelled(f"Request {self.reason}")
+
+
+_current: ContextVar[CancellationToken | None] = ContextVar("cancellation_token", default=None)
+
+
+def current_token() -> CancellationToken | None:
+    return _current.get()
+
+
+def check_cancelled() -> None:
+    """Cancellation checkpoint; a no-op outside a :func:`cancellation_scope`."""
+    token = _current.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+@contextmanager
+def cancellation_scope(timeout: float | None = None) -> Iterator[CancellationToken]:
+    """Install a fresh token for the block; threads started via ``to_thread`` or copied contexts see it too."""
+    token = CancellationToken(timeout)
+    with use_token(token):
+        yield token
+
+
+@contextmanager
+def use_token(token: CancellationToken) -> Iterator[CancellationToken]:
+    """Make ``token`` the current one for the block."""
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
@@ -2,11 +2,54 @@
 
 from pathlib import Path
 import os
+import socket
 
 MODEL_ID = os.getenv("MODEL_ID", "OpenVINO/Qwen3-8B-int8-ov")
 MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "")
 OPENVINO_DEVICE = os.getenv("OPENVINO_DEVICE", "AUTO:NPU,GPU")
+OPENVINO_CACHE_DIR = os.getenv("OPENVINO_CACHE_DIR", "")
+MODEL_IDLE_UNLOAD_SECONDS = float(os.getenv("MODEL_IDLE_UNLOAD_SECONDS", "0"))
+MODEL_MEMORY_LIMIT_MB = int(os.getenv("MODEL_MEMORY_LIMIT_MB", "0"))
+MODEL_LOAD_POLICY = os.getenv("MODEL_LOAD_POLICY", "refuse")
+MODEL_LOAD_QUEUE_TIMEOUT_SECONDS = float(os.getenv("MODEL_LOAD_QUEUE_TIMEOUT_SECONDS", "30"))
+MODEL_KV_SESSION_SLOTS = int(os.getenv("MODEL_KV_SESSION_SLOTS", "4"))
+MODEL_KV_SESSION_MAX_MB = int(os.getenv("MODEL_KV_SESSION_MAX_MB", "2048"))
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "")
+MODEL_REPLICAS = os.getenv("MODEL_REPLICAS", "")
+SCHEDULER_MAX_CONCURRENT = int(os.getenv("SCHEDULER_MAX_CONCURRENT", "1"))
+SCHEDULER_MAX_QUEUED_PER_CLIENT = int(os.getenv("SCHEDULER_MAX_QUEUED_PER_CLIENT", "8"))
+SCHEDULER_INTERACTIVE_TIMEOUT_SECONDS = float(os.getenv("SCHEDULER_INTERACTIVE_TIMEOUT_SECONDS", "120"))
+SCHEDULER_BATCH_TIMEOUT_SECONDS = float(os.getenv("SCHEDULER_BATCH_TIMEOUT_SECONDS", "0"))
+SCHEDULER_RETRY_AFTER_SECONDS = int(os.getenv("SCHEDULER_RETRY_AFTER_SECONDS", "1"))
 ALLOWED_OUTPUT_ROOT = Path(os.getenv("ALLOWED_OUTPUT_ROOT", "workspace")).resolve()
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "256"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "30"))
+SEARCH_PEERS = os.getenv("SEARCH_PEERS", "")
+SEARCH_PEER_TIMEOUT_SECONDS = float(os.getenv("SEARCH_PEER_TIMEOUT_SECONDS", "5"))
+NODE_NAME = os.getenv("NODE_NAME", "") or socket.gethostname()
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "256"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "8"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "0"))
+REQUEST_CAPTURE_PATH = os.getenv("REQUEST_CAPTURE_PATH", "")
+REQUEST_CAPTURE_MAX_BODY_BYTES = int(os.getenv("REQUEST_CAPTURE_MAX_BODY_BYTES", str(64 * 1024)))
+REQUEST_CAPTURE_QUEUE_SIZE = int(os.getenv("REQUEST_CAPTURE_QUEUE_SIZE", "1024"))
+REQUEST_CAPTURE_REDACT_FIELDS = os.getenv("REQUEST_CAPTURE_REDACT_FIELDS", "")
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", "")
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "1024"))
+AUDIT_QUEUE_POLICY = os.getenv("AUDIT_QUEUE_POLICY", "drop")
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "100"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1"))
+AUDIT_JSONL_MAX_BYTES = int(os.getenv("AUDIT_JSONL_MAX_BYTES", str(64 * 1024 * 1024)))
+AUDIT_JSONL_BACKUPS = int(os.getenv("AUDIT_JSONL_BACKUPS", "5"))
+AUDIT_MAX_FIELD_CHARS = int(os.getenv("AUDIT_MAX_FIELD_CHARS", "4096"))
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+DEBUG_MAX_PROFILE_SECONDS = float(os.getenv("DEBUG_MAX_PROFILE_SECONDS", "60"))
+DEBUG_PROFILE_KEEP = int(os.getenv("DEBUG_PROFILE_KEEP", "16"))
+PLANNER_MAX_INPUT_TOKENS = int(os.getenv("PLANNER_MAX_INPUT_TOKENS", "1024"))
+AGENT_SPECULATIVE_SEARCH = os.getenv("AGENT_SPECULATIVE_SEARCH", "0").lower() in {"1", "true", "yes", "on"}
+DOCUMENT_WRITE_BUFFER_BYTES = int(os.getenv("DOCUMENT_WRITE_BUFFER_BYTES", str(1024 * 1024)))
 DEFAULT_DOC_FORMAT = os.getenv("DEFAULT_DOC_FORMAT", "md")
 
 SUPPORTED_FORMATS = {"md", "txt"}
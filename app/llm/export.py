@@ -0,0 +1,162 @@
+﻿from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+import json
+from pathlib import Path
+import re
+import time
+from typing import Any
+
+from app.agent.planner_eval import EvalCase, evaluate_planner
+from app.agent.runner import LLMToolPlanner
+from app.llm.lifecycle import process_rss_bytes
+from app.llm.openvino_qwen import OpenVINOQwen, OpenVINOQwenConfig
+
+# MODEL_ID usually points at an already-converted IR; export starts from the original weights.
+DEFAULT_SOURCE_MODEL = "Qwen/Qwen3-8B"
+DEFAULT_VARIANTS = ["int8", "int4_sym_g128", "int4_asym_g128", "int4_sym_g64"]
+
+_VARIANT = re.compile(r"^int(?P<bits>4|8)(?:_(?P<mode>sym|asym))?(?:_g(?P<group>-?\d+))?$")
+
+
+@dataclass(frozen=True)
+class QuantVariant:
+    name: str
+    bits: int
+    sym: bool
+    group_size: int
+
+    def quantization_config(self):
+        try:
+            from optimum.intel import OVWeightQuantizationConfig
+        except Exception as exc:  # pragma: no cover
+            raise RuntimeError("optimum-intel is required for export: pip install optimum-intel nncf") from exc
+        return OVWeightQuantizationConfig(bits=self.bits, sym=self.sym, group_size=self.group_size)
+
+
+def parse_variant(name: str) -> QuantVariant:
+    """Parse names like ``int8``, ``int4_sym_g128`` or ``int4_asym_g64``.
+
+    int8 defaults to asymmetric per-channel weights (group_size -1); int4 defaults
+    to symmetric weights in groups of 128.
+    """
+    match = _VARIANT.match(name.strip().lower())
+    if not match:
+        raise ValueError(f"Unsupported variant '{name}'; expected e.g. int8, int4_sym_g128, int4_asym_g64")
+    bits = int(match.group("bits"))
+    mode = match.group("mode") or ("asym" if bits == 8 else "sym")
+    group = int(match.group("group") or (-1 if bits == 8 else 128))
+    return QuantVariant(name=match.group(0), bits=bits, sym=mode == "sym", group_size=group)
+
+
+def _dir_size(path: Path) -> int:
+    return sum(item.stat().st_size for item in path.rglob("*") if item.is_file())
+
+
+def export_variant(model_id: str, variant: QuantVariant, output_root: str | Path) -> Path:
+    """Export ``model_id`` to OpenVINO IR with weight-only quantization; reuses an existing export."""
+    target = Path(output_root) / f"{model_id.replace('/', '--')}-{variant.name}"
+    if (target / "openvino_model.xml").exists():
+        return target
+
+    try:
+        from optimum.intel import OVModelForCausalLM
+        from transformers import AutoTokenizer
+    except Exception as exc:  # pragma: no cover
+        raise RuntimeError("Export needs optimum-intel, nncf and transformers installed") from exc
+
+    model = OVModelForCausalLM.from_pretrained(
+        model_id,
+        export=True,
+        compile=False,
+        trust_remote_code=True,
+        quantization_config=variant.quantization_config(),
+    )
+    target.mkdir(parents=True, exist_ok=True)
+    model.save_pretrained(target)
+    AutoTokenizer.from_pretrained(model_id, trust_remote_code=True).save_pretrained(target)
+    return target
+
+
+def evaluate_variant(model_dir: Path, cases: list[EvalCase], device: str) -> dict[str, Any]:
+    """Load one exported variant, run the planner evaluation and measure load time and memory."""
+    llm = OpenVINOQwen(OpenVINOQwenConfig(model_id=str(model_dir), device=device))
+    rss_before = process_rss_bytes()
+    started = time.perf_counter()
+    llm.load()
+    load_seconds = time.perf_counter() - started
+    try:
+        metrics = evaluate_planner(LLMToolPlanner(llm=llm), cases)
+        peak_rss = process_rss_bytes()
+    finally:
+        llm.unload()
+    return {
+        **metrics,
+        "load_seconds": round(load_seconds, 2),
+        "model_rss_mb": round(max(0, peak_rss - rss_before) / 2**20, 1),
+        "disk_mb": round(_dir_size(model_dir) / 2**20, 1),
+    }
+
+
+def compare_variants(
+    model_id: str,
+    variants: list[str],
+    cases: list[EvalCase],
+    output_root: str | Path,
+    device: str,
+) -> list[dict[str, Any]]:
+    rows = []
+    for name in variants:
+        variant = parse_variant(name)
+        row: dict[str, Any] = {"variant": variant.name, **asdict(variant)}
+        try:
+            model_dir = export_variant(model_id, variant, output_root)
+            row.update(model_dir=str(model_dir), **evaluate_variant(model_dir, cases, device))
+        except (RuntimeError, OSError, ValueError) as exc:
+            row["error"] = str(exc)
+        rows.append(row)
+    return rows
+
+
+def recommend(rows: list[dict[str, Any]], min_accuracy: float) -> dict[str, Any] | None:
+    """Smallest variant (on disk) whose argument accuracy reaches ``min_accuracy``."""
+    eligible = [row for row in rows if "error" not in row and row["argument_accuracy"] >= min_accuracy]
+    return min(eligible, key=lambda row: row["disk_mb"], default=None)
+
+
+def render_report(model_id: str, rows: list[dict[str, Any]], min_accuracy: float) -> str:
+    lines = [
+        f"# Planner quantization report: {model_id}",
+        "",
+        "| variant | disk MB | RSS MB | load s | tool acc | args acc | invalid | p50 ms | p95 ms |",
+        "|---|---:|---:|---:|---:|---:|---:|---:|---:|",
+    ]
+    for row in rows:
+        if "error" in row:
+            lines.append(f"| {row['variant']} | error: {row['error']} |||||||| ")
+            continue
+        lines.append(
+            f"| {row['variant']} | {row['disk_mb']} | {row['model_rss_mb']} | {row['load_seconds']} "
+            f"| {row['tool_accuracy']:.2%} | {row['argument_accuracy']:.2%} | {row['invalid_outputs']} "
+            f"| {row['latency_ms_p50']} | {row['latency_ms_p95']} |"
+        )
+
+    best = recommend(rows, min_accuracy)
+    lines.append("")
+    if best is None:
+        lines.append(f"No variant reached argument accuracy {min_accuracy:.0%}.")
+    else:
+        lines.append(
+            f"Recommended: `{best['variant']}` ({best['disk_mb']} MB, argument accuracy "
+            f"{best['argument_accuracy']:.2%}) -> set MODEL_ID={best.get('model_dir', '')}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_report(path: str | Path, model_id: str, rows: list[dict[str, Any]], min_accuracy: float) -> Path:
+    """Write the Markdown report to ``path`` and the raw rows next to it as JSON."""
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(render_report(model_id, rows, min_accuracy), encoding="utf-8")
+    target.with_suffix(".json").write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+    return target
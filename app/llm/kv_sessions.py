@@ -0,0 +1,183 @@
+﻿from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+from typing import Any
+
+from app.config import MODEL_KV_SESSION_MAX_MB, MODEL_KV_SESSION_SLOTS, SESSION_TTL_SECONDS
+
+
+class OpenVINOStateOps:
+    """Read, write and crop the KV-cache variables of a stateful OpenVINO infer request.
+
+    KV variables exported by optimum-intel are laid out as
+    ``[batch, kv_heads, seq_len, head_dim]``; cropping slices the sequence axis.
+    """
+
+    def read(self, request) -> tuple[list[Any], int]:
+        arrays = [state.state.data.copy() for state in request.query_state()]
+        return arrays, sum(int(array.nbytes) for array in arrays)
+
+    def write(self, request, arrays: list[Any]) -> None:
+        import openvino as ov
+
+        for state, array in zip(request.query_state(), arrays):
+            state.state = ov.Tensor(array)
+
+    def crop(self, request, length: int) -> None:
+        import numpy as np
+        import openvino as ov
+
+        for state in request.query_state():
+            state.state = ov.Tensor(np.ascontiguousarray(state.state.data[..., :length, :]))
+
+
+@dataclass
+class _Snapshot:
+    tokens: list[int]
+    arrays: list[Any]
+    nbytes: int
+    last_used: float
+
+
+def _common_prefix(a: list[int], b: list[int]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class SessionKVCache:
+    """Keep per-session KV caches of a stateful model so follow-up turns only prefill new tokens.
+
+    The infer request holds the KV state of one *resident* session. Switching to
+    another session parks the resident state in a memory-bounded LRU of host-side
+    snapshots and restores the target session's snapshot, if any.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MODEL_KV_SESSION_SLOTS,
+        max_bytes: int = MODEL_KV_SESSION_MAX_MB * 1024 * 1024,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        state_ops: Any | None = None,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.ops = state_ops or OpenVINOStateOps()
+        self._snapshots: OrderedDict[str, _Snapshot] = OrderedDict()
+        self._bytes = 0
+        self._resident: str | None = None
+        self._resident_tokens: list[int] = []
+        self._lock = threading.Lock()
+        self._reused_tokens = 0
+        self._prefilled_tokens = 0
+
+    def prepare(self, request, session_id: str, tokens: list[int]) -> int:
+        """Load ``session_id``'s KV into ``request`` and return how many leading tokens it covers.
+
+        Returns 0 when nothing can be reused; the caller must then start from a reset state.
+        """
+        with self._lock:
+            self._expire()
+            if self._resident != session_id:
+                self._park(request)
+                snapshot = self._snapshots.pop(session_id, None)
+                if snapshot is None:
+                    self._prefilled_tokens += len(tokens)
+                    return 0
+                self._bytes -= snapshot.nbytes
+                try:
+                    self.ops.write(request, snapshot.arrays)
+                except Exception:
+                    self._prefilled_tokens += len(tokens)
+                    return 0
+                self._resident = session_id
+                self._resident_tokens = snapshot.tokens
+
+            # At least one token must be fed to the model to produce logits.
+            reuse = min(_common_prefix(self._resident_tokens, tokens), len(tokens) - 1)
+            if reuse <= 0:
+                self._resident = None
+                self._prefilled_tokens += len(tokens)
+                return 0
+            if reuse < len(self._resident_tokens):
+                try:
+                    self.ops.crop(request, reuse)
+                except Exception:
+                    self._resident = None
+                    self._prefilled_tokens += len(tokens)
+                    return 0
+            self._reused_tokens += reuse
+            self._prefilled_tokens += len(tokens) - reuse
+            return reuse
+
+    def commit(self, session_id: str, cached_tokens: list[int]) -> None:
+        """Record that the request now holds the KV state for ``cached_tokens`` of ``session_id``."""
+        with self._lock:
+            self._resident = session_id
+            self._resident_tokens = list(cached_tokens)
+
+    def park(self, request) -> None:
+        """Snapshot the resident session before the request state is reused for something else."""
+        with self._lock:
+            self._park(request)
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            if self._resident == session_id:
+                self._resident = None
+                self._resident_tokens = []
+            snapshot = self._snapshots.pop(session_id, None)
+            if snapshot is not None:
+                self._bytes -= snapshot.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+            self._bytes = 0
+            self._resident = None
+            self._resident_tokens = []
+
+    @property
+    def snapshot_bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "resident_session": self._resident,
+                "resident_tokens": len(self._resident_tokens),
+                "parked_sessions": len(self._snapshots),
+                "parked_bytes": self._bytes,
+                "reused_tokens": self._reused_tokens,
+                "prefilled_tokens": self._prefilled_tokens,
+            }
+
+    def _park(self, request) -> None:
+        # Caller holds self._lock.
+        if self._resident is None or not self._resident_tokens or self.max_sessions <= 0:
+            self._resident = None
+            return
+        try:
+            arrays, nbytes = self.ops.read(request)
+        except Exception:
+            arrays, nbytes = None, 0
+        if arrays is not None and nbytes <= self.max_bytes:
+            self._snapshots[self._resident] = _Snapshot(self._resident_tokens, arrays, nbytes, time.monotonic())
+            self._bytes += nbytes
+            while len(self._snapshots) > self.max_sessions or self._bytes > self.max_bytes:
+                _, evicted = self._snapshots.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        self._resident = None
+        self._resident_tokens = []
+
+    def _expire(self) -> None:
+        # Caller holds self._lock.
+        cutoff = time.monotonic() - self.ttl_seconds
+        for session_id in [sid for sid, snap in self._snapshots.items() if snap.last_used < cutoff]:
+            self._bytes -= self._snapshots.pop(session_id).nbytes
@@ -0,0 +1,272 @@
+﻿from __future__ import annotations
+
+from concurrent.futures import Future
+from dataclasses import dataclass
+import asyncio
+import os
+import threading
+import time
+from typing import Any
+
+from app.config import (
+    MODEL_IDLE_UNLOAD_SECONDS,
+    MODEL_LOAD_POLICY,
+    MODEL_LOAD_QUEUE_TIMEOUT_SECONDS,
+    MODEL_MEMORY_LIMIT_MB,
+)
+from app.llm.openvino_qwen import OpenVINOQwen
+
+
+class ModelMemoryError(RuntimeError):
+    """Raised when loading the model would exceed the configured memory ceiling."""
+
+
+@dataclass
+class ModelLifecycleConfig:
+    idle_unload_seconds: float = MODEL_IDLE_UNLOAD_SECONDS
+    memory_limit_mb: int = MODEL_MEMORY_LIMIT_MB
+    load_policy: str = MODEL_LOAD_POLICY
+    queue_timeout_seconds: float = MODEL_LOAD_QUEUE_TIMEOUT_SECONDS
+    poll_interval_seconds: float = 0.5
+
+
+def process_rss_bytes() -> int:
+    """Return the resident set size of this process (0 if it cannot be measured)."""
+    try:
+        import psutil
+
+        return int(psutil.Process().memory_info().rss)
+    except Exception:
+        pass
+
+    try:
+        with open("/proc/self/statm", encoding="ascii") as fh:
+            resident_pages = int(fh.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return 0
+
+
+def available_memory_bytes() -> int | None:
+    """Return memory available to new allocations system-wide, or None if unknown."""
+    try:
+        import psutil
+
+        return int(psutil.virtual_memory().available)
+    except Exception:
+        pass
+
+    try:
+        with open("/proc/meminfo", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except Exception:
+        pass
+    return None
+
+
+class ModelLifecycleManager:
+    """Load the LLM on demand, unload it when idle and keep it under a memory ceiling.
+
+    Implements the same ``invoke`` contract as :class:`OpenVINOQwen`, so it can be
+    handed to ``LLMToolPlanner`` directly.
+    """
+
+    def __init__(self, llm: OpenVINOQwen | None = None, cfg: ModelLifecycleConfig | None = None) -> None:
+        self.llm = llm or OpenVINOQwen()
+        self.cfg = cfg or ModelLifecycleConfig()
+        if self.cfg.load_policy not in {"refuse", "queue"}:
+            raise ValueError(f"load_policy must be 'refuse' or 'queue': {self.cfg.load_policy}")
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._last_used = time.monotonic()
+        self._load_count = 0
+        self._unload_count = 0
+        self._last_load_seconds: float | None = None
+        self._model_rss_bytes = 0
+        self._watcher: threading.Thread | None = None
+        self._loading: Future | None = None
+
+    def invoke(self, prompt: str, **kwargs: Any) -> str:
+        self._acquire()
+        try:
+            return self.llm.invoke(prompt, **kwargs)
+        finally:
+            self._release()
+
+    def invoke_batch(self, prompts: list[str], **kwargs: Any) -> list[str]:
+        """Generate for several prompts in one call so ``serve-model`` batching reaches the model."""
+        self._acquire()
+        try:
+            invoke_batch = getattr(self.llm, "invoke_batch", None)
+            if invoke_batch is None:
+                return [self.llm.invoke(prompt, **kwargs) for prompt in prompts]
+            return invoke_batch(prompts, **kwargs)
+        finally:
+            self._release()
+
+    async def ainvoke(self, prompt: str, **kwargs: Any) -> str:
+        await self._aacquire()
+        try:
+            ainvoke = getattr(self.llm, "ainvoke", None)
+            if ainvoke is not None:
+                return await ainvoke(prompt, **kwargs)
+            return await asyncio.to_thread(self.llm.invoke, prompt, **kwargs)
+        finally:
+            # _release waits on the condition a load in progress holds; keep it off the loop,
+            # and let it finish even if this task is cancelled again meanwhile.
+            await asyncio.shield(asyncio.to_thread(self._release))
+
+    def count_tokens(self, text: str) -> int:
+        return self.llm.count_tokens(text)
+
+    def load(self) -> None:
+        with self._cond:
+            self._ensure_loaded()
+
+    def unload(self) -> bool:
+        """Unload the model now unless a request is using it. Returns True if unloaded."""
+        with self._cond:
+            if self._in_flight or not self.llm.is_loaded:
+                return False
+            self._unload_locked()
+            return True
+
+    def drop_session(self, session_id: str) -> None:
+        if hasattr(self.llm, "drop_session"):
+            self.llm.drop_session(session_id)
+
+    def status(self) -> dict[str, Any]:
+        with self._cond:
+            loaded = self.llm.is_loaded
+            return {
+                "loaded": loaded,
+                "in_flight": self._in_flight,
+                "load_count": self._load_count,
+                "unload_count": self._unload_count,
+                "last_load_seconds": self._last_load_seconds,
+                "idle_seconds": round(time.monotonic() - self._last_used, 3),
+                "idle_unload_seconds": self.cfg.idle_unload_seconds,
+                "memory_limit_mb": self.cfg.memory_limit_mb,
+                "load_policy": self.cfg.load_policy,
+                "process_rss_bytes": process_rss_bytes(),
+                "model_rss_bytes": self._model_rss_bytes,
+                "kv_cache_bytes": self.llm.kv_cache_bytes() if loaded else 0,
+                "kv_sessions": self.llm.kv_sessions.stats() if hasattr(self.llm, "kv_sessions") else None,
+                "replicas": self.llm.stats()["replicas"] if hasattr(self.llm, "replicas") else None,
+                "available_memory_bytes": available_memory_bytes(),
+            }
+
+    def _acquire(self) -> None:
+        with self._cond:
+            self._ensure_loaded()
+            self._in_flight += 1
+
+    async def _aacquire(self) -> None:
+        # Loading may block for seconds (or queue on memory). One loader thread does it
+        # while every async caller awaits its future, so waiting holds no executor thread.
+        # The lock is held for the whole load, so never block the event loop on it.
+        while True:
+            if not self._cond.acquire(blocking=False):
+                loading = self._loading
+                if loading is None:
+                    await asyncio.sleep(0.01)  # a short holder, or a synchronous caller loading
+                else:
+                    await asyncio.wrap_future(loading)
+                continue
+            try:
+                if self.llm.is_loaded:
+                    self._in_flight += 1
+                    return
+                loading = self._loading
+                if loading is None:
+                    loading = self._loading = Future()
+                    loading.set_running_or_notify_cancel()  # a departing waiter must not cancel the load
+                    threading.Thread(target=self._load_for_waiters, args=(loading,), name="model-load", daemon=True).start()
+            finally:
+                self._cond.release()
+            await asyncio.wrap_future(loading)
+
+    def _load_for_waiters(self, loading: Future) -> None:
+        error: Exception | None = None
+        with self._cond:
+            try:
+                self._ensure_loaded()
+            except Exception as exc:
+                error = exc
+            self._loading = None
+        if error is not None:
+            loading.set_exception(error)
+        else:
+            loading.set_result(None)
+
+    def _release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._last_used = time.monotonic()
+            self._cond.notify_all()
+        self._start_watcher()
+
+    def _ensure_loaded(self) -> None:
+        # Caller holds self._cond.
+        if self.llm.is_loaded:
+            return
+
+        required = self.llm.estimate_model_bytes()
+        limit = self.cfg.memory_limit_mb * 1024 * 1024
+        if limit and required > limit:
+            raise ModelMemoryError(
+                f"Model needs about {required // (1024 * 1024)} MB, above MODEL_MEMORY_LIMIT_MB={self.cfg.memory_limit_mb}"
+            )
+
+        deadline = time.monotonic() + self.cfg.queue_timeout_seconds
+        while not self._fits(required, limit):
+            if self.cfg.load_policy == "refuse" or time.monotonic() >= deadline:
+                raise ModelMemoryError(
+                    f"Not enough memory to load the model (needs about {required // (1024 * 1024)} MB)"
+                )
+            self._cond.wait(self.cfg.poll_interval_seconds)
+            if self.llm.is_loaded:
+                return
+
+        rss_before = process_rss_bytes()
+        started = time.perf_counter()
+        self.llm.load()
+        self._last_load_seconds = round(time.perf_counter() - started, 3)
+        self._model_rss_bytes = max(0, process_rss_bytes() - rss_before)
+        self._load_count += 1
+        self._last_used = time.monotonic()
+
+    def _fits(self, required: int, limit: int) -> bool:
+        if limit and process_rss_bytes() + required > limit:
+            return False
+        available = available_memory_bytes()
+        return available is None or available >= required
+
+    def _unload_locked(self) -> None:
+        self.llm.unload()
+        self._unload_count += 1
+        self._model_rss_bytes = 0
+        self._cond.notify_all()
+
+    def _start_watcher(self) -> None:
+        if self.cfg.idle_unload_seconds <= 0:
+            return
+        with self._cond:
+            if self._watcher is not None and self._watcher.is_alive():
+                return
+            self._watcher = threading.Thread(target=self._watch_idle, name="model-idle-unload", daemon=True)
+            self._watcher.start()
+
+    def _watch_idle(self) -> None:
+        timeout = self.cfg.idle_unload_seconds
+        with self._cond:
+            while self.llm.is_loaded:
+                idle = time.monotonic() - self._last_used
+                if self._in_flight == 0 and idle >= timeout:
+                    self._unload_locked()
+                    break
+                self._cond.wait(max(timeout - idle, 0.05))
+            self._watcher = None
@@ -0,0 +1,362 @@
+﻿from __future__ import annotations
+
+from concurrent.futures import Future
+import asyncio
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+import time
+from typing import Any
+
+from app.cancellation import current_token
+from app.config import MODEL_SERVER_ADDRESS
+from app.llm.scheduler import PRIORITIES, DeadlineExceeded, current_request, request_context
+
+
+def default_address() -> str:
+    """Per-user Unix socket where supported, loopback TCP otherwise (e.g. older Windows builds)."""
+    if hasattr(socket, "AF_UNIX") and os.name != "nt":
+        return os.path.join(runtime_dir(), "aiagent-model.sock")
+    return "127.0.0.1:8765"
+
+
+def runtime_dir() -> str:
+    """``$XDG_RUNTIME_DIR``, else a 0700 directory in the temp dir owned by this user."""
+    runtime = os.environ.get("XDG_RUNTIME_DIR", "")
+    if runtime and os.path.isdir(runtime):
+        return runtime
+    path = os.path.join(tempfile.gettempdir(), f"aiagent-{os.getuid()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    # Another user could have created the directory first to intercept the socket.
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"Refusing to use {path}: it must be a directory private to this user")
+    return path
+
+
+def _socket_alive(path: str) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.settimeout(1.0)
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def parse_address(address: str) -> tuple[str, Any]:
+    """Return ("tcp", (host, port)) for ``host:port`` and ("unix", path) otherwise."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and len(host) > 1:
+        return "tcp", (host, int(port))
+    return "unix", address
+
+
+class _Job:
+    __slots__ = ("prompt", "kwargs", "future", "deadline")
+
+    def __init__(self, prompt: str, kwargs: dict[str, Any], deadline: float | None = None) -> None:
+        self.prompt = prompt
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.future: Future[str] = Future()
+
+
+class ModelServer:
+    """Own one compiled model and serve ``invoke`` calls to many API workers.
+
+    Requests arriving within ``batch_window_ms`` of each other are grouped (up to
+    ``max_batch_size``) and, when their generation options match, run as one batch.
+    Queued interactive requests are batched before batch-class ones, and requests
+    whose deadline passed while queued are failed without running.
+    Wire format: one JSON object per line in each direction.
+    """
+
+    def __init__(self, llm, address: str | None = None, max_batch_size: int = 8, batch_window_ms: float = 5.0) -> None:
+        self.llm = llm
+        self.address = address or default_address()
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = batch_window_ms / 1000.0
+        self._jobs: queue.PriorityQueue[tuple[int, int, _Job | None]] = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._server: socketserver.BaseServer | None = None
+        self._threads: list[threading.Thread] = []
+        self._batches = 0
+        self._requests = 0
+        self._expired = 0
+
+    def start(self) -> None:
+        """Bind the socket and start serving in background threads."""
+        family, addr = parse_address(self.address)
+        handler = self._make_handler()
+        if family == "tcp":
+            server: socketserver.BaseServer = socketserver.ThreadingTCPServer(addr, handler)
+        else:
+            if os.path.exists(addr):
+                if _socket_alive(addr):
+                    raise RuntimeError(f"A model server is already running at {addr}")
+                os.unlink(addr)  # stale socket left by a server that exited
+            server = socketserver.ThreadingUnixStreamServer(addr, handler)
+            # No authentication on the socket: only this user may connect.
+            os.chmod(addr, 0o600)
+        server.daemon_threads = True
+        self._server = server
+
+        self._threads = [
+            threading.Thread(target=self._batch_loop, name="model-server-batcher", daemon=True),
+            threading.Thread(target=server.serve_forever, name="model-server-accept", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def serve_forever(self) -> None:
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            family, addr = parse_address(self.address)
+            if family == "unix" and os.path.exists(addr):
+                os.unlink(addr)
+            self._server = None
+        self._jobs.put((len(PRIORITIES), next(self._seq), None))
+
+    def submit(self, prompt: str, **kwargs: Any) -> Future[str]:
+        ctx = current_request()
+        job = _Job(prompt, kwargs, ctx.deadline)
+        self._jobs.put((PRIORITIES.index(ctx.priority), next(self._seq), job))
+        return job.future
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "address": self.address,
+            "requests": self._requests,
+            "batches": self._batches,
+            "expired": self._expired,
+            "queued": self._jobs.qsize(),
+            "max_batch_size": self.max_batch_size,
+        }
+
+    def _batch_loop(self) -> None:
+        while True:
+            _, _, first = self._jobs.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._jobs.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item[2] is None:
+                    self._jobs.put(item)
+                    break
+                batch.append(item[2])
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: list[_Job]) -> None:
+        groups: dict[str, list[_Job]] = {}
+        now = time.monotonic()
+        for job in batch:
+            if job.deadline is not None and job.deadline <= now:
+                self._expired += 1
+                job.future.set_exception(DeadlineExceeded("Request deadline passed before reaching the model"))
+                continue
+            groups.setdefault(json.dumps(job.kwargs, sort_keys=True), []).append(job)
+
+        invoke_batch = getattr(self.llm, "invoke_batch", None)
+        for jobs in groups.values():
+            self._batches += 1
+            self._requests += len(jobs)
+            try:
+                # Session calls reuse per-session KV state and cannot share a batch.
+                if invoke_batch is not None and len(jobs) > 1 and not jobs[0].kwargs.get("session_id"):
+                    outputs = invoke_batch([job.prompt for job in jobs], **jobs[0].kwargs)
+                else:
+                    outputs = [self.llm.invoke(job.prompt, **job.kwargs) for job in jobs]
+            except Exception as exc:
+                for job in jobs:
+                    job.future.set_exception(exc)
+                continue
+            for job, text in zip(jobs, outputs):
+                job.future.set_result(text)
+
+    def _handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        op = request.get("op", "invoke")
+        if op == "invoke":
+            with request_context(**dict(request.get("context") or {})):
+                future = self.submit(str(request.get("prompt", "")), **dict(request.get("kwargs") or {}))
+            return {"text": future.result()}
+        if op == "count_tokens":
+            return {"count": self.llm.count_tokens(str(request.get("text", "")))}
+        if op == "status":
+            status = self.llm.status() if hasattr(self.llm, "status") else {}
+            return {"status": {**status, "server": self.stats()}}
+        if op == "unload":
+            unloaded = self.llm.unload() if hasattr(self.llm, "unload") else False
+            return {"unloaded": bool(unloaded)}
+        if op == "drop_session":
+            if hasattr(self.llm, "drop_session"):
+                self.llm.drop_session(str(request.get("session_id", "")))
+            return {"dropped": True}
+        raise ValueError(f"Unsupported op: {op}")
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    request: Any = {}
+                    try:
+                        request = json.loads(line)
+                        response = server._handle(request)
+                    except Exception as exc:
+                        request = request if isinstance(request, dict) else {}
+                        response = {"error": str(exc), "error_type": type(exc).__name__}
+                    response["id"] = request.get("id")
+                    self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+
+        return Handler
+
+
+class ModelClient:
+    """Drop-in ``invoke``/``ainvoke`` client for a :class:`ModelServer`.
+
+    Synchronous calls reuse pooled connections (one per concurrent caller);
+    ``ainvoke`` opens a stream per call so it never blocks the event loop.
+    """
+
+    def __init__(self, address: str = MODEL_SERVER_ADDRESS, timeout: float = 300.0) -> None:
+        self.address = address or default_address()
+        self.timeout = timeout
+        self._pool: queue.LifoQueue[socket.socket] = queue.LifoQueue()
+        self._ids = iter(range(1, 1 << 62))
+
+    def invoke(self, prompt: str, **kwargs: Any) -> str:
+        return str(self._call(self._invoke_payload(prompt, kwargs))["text"])
+
+    async def ainvoke(self, prompt: str, **kwargs: Any) -> str:
+        payload = {**self._invoke_payload(prompt, kwargs), "id": next(self._ids)}
+        family, addr = parse_address(self.address)
+        try:
+            if family == "tcp":
+                reader, writer = await asyncio.open_connection(*addr, limit=1 << 24)
+            else:
+                reader, writer = await asyncio.open_unix_connection(addr, limit=1 << 24)
+        except OSError as exc:
+            raise RuntimeError(f"Model server unavailable at {self.address}: {exc}") from exc
+        try:
+            writer.write(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+        finally:
+            writer.close()
+        return str(self._unwrap(line)["text"])
+
+    def count_tokens(self, text: str) -> int:
+        return int(self._call({"op": "count_tokens", "text": text})["count"])
+
+    def status(self) -> dict[str, Any]:
+        return dict(self._call({"op": "status"})["status"])
+
+    def unload(self) -> bool:
+        return bool(self._call({"op": "unload"})["unloaded"])
+
+    def drop_session(self, session_id: str) -> None:
+        self._call({"op": "drop_session", "session_id": session_id})
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _invoke_payload(self, prompt: str, kwargs: dict[str, Any]) -> dict[str, Any]:
+        # Forward the caller's scheduling hints; the deadline travels as time remaining.
+        ctx = current_request()
+        remaining = ctx.remaining()
+        token = current_token()
+        if token is not None and token.deadline is not None:
+            token_remaining = token.deadline - time.monotonic()
+            remaining = token_remaining if remaining is None else min(remaining, token_remaining)
+        context = {
+            "priority": ctx.priority,
+            "client": ctx.client,
+            "timeout": None if remaining is None else max(remaining, 1e-3),
+        }
+        return {"op": "invoke", "prompt": prompt, "kwargs": kwargs, "context": context}
+
+    def _call(self, payload: dict[str, Any]) -> dict[str, Any]:
+        payload["id"] = next(self._ids)
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n"
+        sock = self._checkout()
+        try:
+            sock.sendall(data)
+            line = self._readline(sock)
+        except OSError as exc:
+            sock.close()
+            raise RuntimeError(f"Model server connection failed: {exc}") from exc
+        self._pool.put(sock)
+        return self._unwrap(line)
+
+    def _checkout(self) -> socket.socket:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        family, addr = parse_address(self.address)
+        try:
+            if family == "tcp":
+                sock = socket.create_connection(addr, timeout=self.timeout)
+            else:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(addr)
+        except OSError as exc:
+            raise RuntimeError(f"Model server unavailable at {self.address}: {exc}") from exc
+        return sock
+
+    def _readline(self, sock: socket.socket) -> bytes:
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("model server closed the connection")
+            chunks.append(chunk)
+            if chunk.endswith(b"\n"):
+                return b"".join(chunks)
+
+    def _unwrap(self, line: bytes) -> dict[str, Any]:
+        if not line:
+            raise RuntimeError("Model server returned no response")
+        response = json.loads(line)
+        if response.get("error_type") == "DeadlineExceeded":
+            raise DeadlineExceeded(response["error"])
+        if "error" in response:
+            raise RuntimeError(f"Model server error ({response.get('error_type')}): {response['error']}")
+        return response
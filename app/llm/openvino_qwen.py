@@ -1,10 +1,21 @@
 ﻿from __future__ import annotations
 
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from importlib import metadata
 from pathlib import Path
+import asyncio
+import contextvars
+import gc
 import os
+import re
+import threading
+from typing import Any
 
-from app.config import MODEL_CACHE_DIR, MODEL_ID, OPENVINO_DEVICE
+from app.cancellation import CancellationToken, check_cancelled, current_token
+from app.config import MODEL_CACHE_DIR, MODEL_ID, OPENVINO_CACHE_DIR, OPENVINO_DEVICE
+from app.llm.kv_sessions import SessionKVCache
 
 
 @dataclass
@@ -12,8 +23,119 @@ class OpenVINOQwenConfig:
     model_id: str = MODEL_ID
     model_cache_dir: str = MODEL_CACHE_DIR
     device: str = OPENVINO_DEVICE
+    compile_cache_dir: str = OPENVINO_CACHE_DIR
     max_new_tokens: int = 512
     temperature: float = 0.2
+    enable_thinking: bool = True
+    # Extra OpenVINO compile properties, e.g. {"INFERENCE_NUM_THREADS": 16}.
+    ov_config: dict[str, Any] = field(default_factory=dict)
+
+
+# Session KV reuse sets private OVModelForCausalLM state (_past_length, next_beam_idx and a
+# placeholder past_key_values); it is only enabled on the optimum-intel releases it was
+# written against. Other versions prefill the whole prompt.
+KV_REUSE_OPTIMUM_VERSIONS = ("1.25",)
+
+
+@lru_cache(maxsize=1)
+def optimum_intel_version() -> str | None:
+    try:
+        return metadata.version("optimum-intel")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def kv_reuse_supported(version: str | None = None) -> bool:
+    version = version or optimum_intel_version()
+    if not version:
+        return False
+    return any(version == known or version.startswith(known + ".") for known in KV_REUSE_OPTIMUM_VERSIONS)
+
+
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+
+def strip_reasoning(text: str) -> str:
+    """Remove Qwen3 ``<think>`` segments, including unterminated or headless ones."""
+    text = _THINK_BLOCK.sub("", text)
+    if "</think>" in text:
+        text = text.rsplit("</think>", 1)[1]
+    if "<think>" in text:
+        text = text.split("<think>", 1)[0]
+    return text.strip()
+
+
+def truncate_at_stop(text: str, stop: list[str] | None) -> str:
+    """Cut ``text`` before the earliest occurrence of any stop sequence."""
+    if not stop:
+        return text
+    cut = min((idx for idx in (text.find(seq) for seq in stop if seq) if idx >= 0), default=-1)
+    return text if cut < 0 else text[:cut]
+
+
+def final_reply(generated: str, stop: list[str] | None) -> str:
+    """The answer part of a generation: reasoning removed first, then cut at a stop sequence.
+
+    Stop sequences only apply to the answer; the reasoning may contain them freely.
+    """
+    return truncate_at_stop(strip_reasoning(generated), stop).strip()
+
+
+class _StopOnSequences:
+    """Generation stopping criterion that fires once a stop sequence was decoded.
+
+    With ``after`` set (``</think>`` in thinking mode) it stays disarmed until that
+    marker was generated, so only the answer can end decoding.
+    """
+
+    def __init__(self, tokenizer, stop: list[str], window: int = 16, after: str | None = None) -> None:
+        self.tokenizer = tokenizer
+        self.stop = [seq for seq in stop if seq]
+        self.window = window
+        self.after = after
+        self._start: int | None = None
+        self._armed_at: int | None = None
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        length = input_ids.shape[-1]
+        if self._start is None:
+            # First call happens after one new token; everything before is the prompt.
+            self._start = length - 1
+            if self.after is None:
+                self._armed_at = self._start
+        if self._armed_at is None:
+            tail = input_ids[0, max(self._start, length - self.window):]
+            if self.after in self.tokenizer.decode(tail, skip_special_tokens=True):
+                self._armed_at = length
+            return False
+        tail = input_ids[0, max(self._armed_at, length - self.window):]
+        text = self.tokenizer.decode(tail, skip_special_tokens=True)
+        return any(seq in text for seq in self.stop)
+
+
+class _StopOnCancel:
+    """Generation stopping criterion that ends decoding once the request's token is cancelled."""
+
+    def __init__(self, token: CancellationToken) -> None:
+        self.token = token
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.token.cancelled
+
+
+def _stopping_criteria(tokenizer, stop: list[str] | None, thinking: bool = False):
+    criteria = []
+    if stop:
+        criteria.append(_StopOnSequences(tokenizer, stop, after="</think>" if thinking else None))
+    token = current_token()
+    if token is not None:
+        criteria.append(_StopOnCancel(token))
+    if not criteria:
+        return None
+
+    from transformers import StoppingCriteriaList
+
+    return StoppingCriteriaList(criteria)
 
 
 class OpenVINOQwen:
@@ -22,6 +144,21 @@ class OpenVINOQwen:
     def __init__(self, cfg: OpenVINOQwenConfig | None = None) -> None:
         self.cfg = cfg or OpenVINOQwenConfig()
         self._pipe = None
+        self._model = None
+        self._tokenizer = None
+        self._executor: ThreadPoolExecutor | None = None
+        # The compiled model owns a single infer request; generations must not overlap.
+        self._generate_lock = threading.Lock()
+        self.kv_sessions = SessionKVCache()
+        self.kv_session_reuse = kv_reuse_supported()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._pipe is not None
+
+    def load(self) -> None:
+        """Load (or reload) the model and pipeline if they are not resident."""
+        self._load()
 
     def _load(self):
         if self._pipe is not None:
@@ -30,7 +167,7 @@ class OpenVINOQwen:
         self._patch_torch_onnx_compat()
 
         try:
-            from transformers import AutoTokenizer, pipeline
+            from transformers import pipeline
             try:
                 from optimum.intel.openvino import OVModelForCausalLM
             except Exception:
@@ -42,12 +179,27 @@ class OpenVINOQwen:
             ) from exc
 
         model_source = self._resolve_model_source()
-        tokenizer = AutoTokenizer.from_pretrained(model_source, trust_remote_code=True)
+        tokenizer = self._get_tokenizer()
+        # Left padding keeps every prompt adjacent to its generated tokens in batches.
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        kwargs = {}
+        ov_config = dict(self.cfg.ov_config)
+        cache_dir = self.cfg.compile_cache_dir.strip()
+        if cache_dir:
+            # Compiled blobs are reused on reload, which skips most of the compile time.
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            ov_config["CACHE_DIR"] = cache_dir
+        if ov_config:
+            kwargs["ov_config"] = ov_config
         model = OVModelForCausalLM.from_pretrained(
             model_source,
             trust_remote_code=True,
             device=self.cfg.device,
+            **kwargs,
         )
+        self._model = model
         self._pipe = pipeline(
             "text-generation",
             model=model,
@@ -57,6 +209,22 @@ class OpenVINOQwen:
             do_sample=self.cfg.temperature > 0,
         )
 
+    def _get_tokenizer(self):
+        if self._tokenizer is not None:
+            return self._tokenizer
+
+        try:
+            from transformers import AutoTokenizer
+        except Exception as exc:  # pragma: no cover
+            raise RuntimeError("Tokenizer unavailable (transformers is not installed)") from exc
+
+        self._tokenizer = AutoTokenizer.from_pretrained(self._resolve_model_source(), trust_remote_code=True)
+        return self._tokenizer
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with the model tokenizer. Does not require the model itself to be loaded."""
+        return len(self._get_tokenizer().encode(text, add_special_tokens=False))
+
     def _patch_torch_onnx_compat(self) -> None:
         """Patch torch.onnx.symbolic_opset14 private symbols for newer torch versions."""
         try:
@@ -104,15 +272,233 @@ class OpenVINOQwen:
                 "Check network/authentication, or set MODEL_ID to a local path."
             ) from exc
 
+    def unload(self) -> None:
+        """Drop the compiled model and pipeline so their memory can be reclaimed."""
+        self._pipe = None
+        self._model = None
+        self.kv_sessions.clear()
+        gc.collect()
+
+    def drop_session(self, session_id: str) -> None:
+        """Forget the KV state kept for a chat session that has ended."""
+        self.kv_sessions.drop(session_id)
+
+    def estimate_model_bytes(self) -> int:
+        """Estimate resident weight size from the model files on disk (0 if unknown)."""
+        source = Path(self._resolve_model_source())
+        if not source.is_dir():
+            return 0
+        return sum(path.stat().st_size for path in source.rglob("*.bin") if path.is_file())
+
+    def kv_cache_bytes(self) -> int:
+        """Return the bytes currently held by the stateful KV cache of the loaded model."""
+        parked = self.kv_sessions.snapshot_bytes
+        request = getattr(self._model, "request", None)
+        if request is None:
+            return parked
+        try:
+            return parked + sum(int(state.state.byte_size) for state in request.query_state())
+        except Exception:
+            return parked
+
     def ensure_model_downloaded(self) -> str:
         """Resolve and download the model if needed, returning local model path or model id."""
         return self._resolve_model_source()
 
-    def invoke(self, prompt: str) -> str:
-        self._load()
-        assert self._pipe is not None
-        out = self._pipe(prompt)
-        if not out:
-            return ""
-        generated = out[0].get("generated_text", "")
-        return generated[len(prompt):].strip() if generated.startswith(prompt) else generated.strip()
+    def render_prompt(
+        self,
+        prompt: str,
+        system: str | None = None,
+        enable_thinking: bool | None = None,
+        history: list[dict[str, str]] | None = None,
+    ) -> str:
+        """Render system/history/user messages through the tokenizer chat template."""
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.extend(history or [])
+        messages.append({"role": "user", "content": prompt})
+
+        tokenizer = self._get_tokenizer()
+        if not getattr(tokenizer, "chat_template", None):
+            return "\n\n".join(message["content"] for message in messages)
+
+        thinking = self.cfg.enable_thinking if enable_thinking is None else enable_thinking
+        return tokenizer.apply_chat_template(
+            messages,
+            tokenize=False,
+            add_generation_prompt=True,
+            enable_thinking=thinking,
+        )
+
+    def invoke(
+        self,
+        prompt: str,
+        *,
+        system: str | None = None,
+        enable_thinking: bool | None = None,
+        stop: list[str] | None = None,
+        history: list[dict[str, str]] | None = None,
+        session_id: str | None = None,
+    ) -> str:
+        """Generate a reply to ``prompt`` as a user turn; reasoning segments are stripped.
+
+        With ``session_id`` the KV cache of the session's previous turns is kept on a
+        stateful model, so only tokens after the shared prefix are prefilled.
+        Inside a cancellation scope decoding stops between tokens once the request is
+        cancelled, and :class:`OperationCancelled` is raised instead of a partial reply.
+        """
+        check_cancelled()
+        with self._generate_lock:
+            self._load()
+            assert self._pipe is not None
+            text = self.render_prompt(prompt, system=system, enable_thinking=enable_thinking, history=history)
+            thinking = self.cfg.enable_thinking if enable_thinking is None else enable_thinking
+
+            request = self._stateful_request()
+            if session_id and request is not None:
+                generated = self._generate_in_session(text, session_id, request, stop, thinking)
+                check_cancelled()
+                return final_reply(generated, stop)
+            if request is not None:
+                # The pipeline resets the request state; keep the resident session's KV first.
+                self.kv_sessions.park(request)
+
+            kwargs: dict[str, Any] = {"return_full_text": False}
+            criteria = _stopping_criteria(self._get_tokenizer(), stop, thinking)
+            if criteria is not None:
+                kwargs["stopping_criteria"] = criteria
+
+            out = self._pipe(text, **kwargs)
+            check_cancelled()
+            if not out:
+                return ""
+            generated = out[0].get("generated_text", "")
+            if generated.startswith(text):
+                generated = generated[len(text):]
+            return final_reply(generated, stop)
+
+    def _stateful_request(self):
+        """Infer request holding the KV state, for stateful exports only."""
+        if not getattr(self._model, "stateful", False):
+            return None
+        return getattr(self._model, "request", None)
+
+    def _generate_in_session(
+        self,
+        text: str,
+        session_id: str,
+        request,
+        stop: list[str] | None,
+        thinking: bool = False,
+    ) -> str:
+        model = self._model
+        tokenizer = self._get_tokenizer()
+        encoded = tokenizer(text, return_tensors="pt", add_special_tokens=False)
+        input_ids = encoded.input_ids
+        tokens = input_ids[0].tolist()
+
+        kwargs: dict[str, Any] = {
+            "attention_mask": encoded.attention_mask,
+            "max_new_tokens": self.cfg.max_new_tokens,
+            "do_sample": self.cfg.temperature > 0,
+            "pad_token_id": tokenizer.pad_token_id,
+        }
+        if self.cfg.temperature > 0:
+            kwargs["temperature"] = self.cfg.temperature
+        criteria = _stopping_criteria(tokenizer, stop, thinking)
+        if criteria is not None:
+            kwargs["stopping_criteria"] = criteria
+
+        if not self.kv_session_reuse:
+            # Unknown optimum-intel internals: keep other sessions' KV and prefill in full.
+            self.kv_sessions.park(request)
+            output = model.generate(input_ids, **kwargs)
+            return tokenizer.decode(output[0].tolist()[len(tokens):], skip_special_tokens=True)
+
+        reuse = self.kv_sessions.prepare(request, session_id, tokens)
+        try:
+            if reuse:
+                import numpy as np
+
+                # optimum-intel keeps KV inside the request and only feeds input_ids[past:]
+                # when it is given a (placeholder) past and a matching past length.
+                model._past_length = reuse
+                model.next_beam_idx = np.arange(1, dtype=int)
+                output = model.generate(input_ids, past_key_values=((),), **kwargs)
+            else:
+                output = model.generate(input_ids, **kwargs)
+        except Exception:
+            if not reuse:
+                raise
+            self.kv_sessions.drop(session_id)
+            output = model.generate(input_ids, **kwargs)
+
+        sequence = output[0].tolist()
+        # The last generated token has not been fed through the model yet.
+        self.kv_sessions.commit(session_id, sequence[:-1])
+        return tokenizer.decode(sequence[len(tokens):], skip_special_tokens=True)
+
+    def invoke_batch(
+        self,
+        prompts: list[str],
+        *,
+        system: str | None = None,
+        enable_thinking: bool | None = None,
+        stop: list[str] | None = None,
+        history: list[dict[str, str]] | None = None,
+    ) -> list[str]:
+        """Generate replies for several prompts in one padded batch.
+
+        Stop sequences are applied after generation: a stopping criterion would end
+        the whole batch as soon as any single row matched.
+        """
+        with self._generate_lock:
+            self._load()
+            assert self._pipe is not None
+            texts = [
+                self.render_prompt(prompt, system=system, enable_thinking=enable_thinking, history=history)
+                for prompt in prompts
+            ]
+            request = self._stateful_request()
+            if request is not None:
+                self.kv_sessions.park(request)
+            outputs = self._pipe(texts, return_full_text=False, batch_size=len(texts))
+
+            replies = []
+            for text, out in zip(texts, outputs):
+                generated = out[0].get("generated_text", "") if out else ""
+                if generated.startswith(text):
+                    generated = generated[len(text):]
+                replies.append(final_reply(generated, stop))
+            return replies
+
+    async def ainvoke(
+        self,
+        prompt: str,
+        *,
+        system: str | None = None,
+        enable_thinking: bool | None = None,
+        stop: list[str] | None = None,
+        history: list[dict[str, str]] | None = None,
+        session_id: str | None = None,
+    ) -> str:
+        """Async variant of :meth:`invoke`.
+
+        Generation runs on a single inference thread owned by this model (the compiled
+        model serves one request at a time), so concurrent callers wait as coroutines
+        on a future instead of each holding a thread.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="openvino-infer")
+        call = partial(
+            self.invoke,
+            prompt,
+            system=system,
+            enable_thinking=enable_thinking,
+            stop=stop,
+            history=history,
+            session_id=session_id,
+        )
+        ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, ctx.run, call)
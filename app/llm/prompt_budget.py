@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from functools import lru_cache
+import math
+from typing import Callable
+
+from app.config import PLANNER_MAX_INPUT_TOKENS
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used when no tokenizer is available.
+
+    ASCII text averages about four characters per token; CJK and other non-ASCII
+    characters are close to one token each for Qwen tokenizers.
+    """
+    ascii_chars = sum(1 for ch in text if ch.isascii())
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+class PromptBudget:
+    """Count tokens (cached per string) and trim text to a maximum input budget.
+
+    Work is bounded by the budget, not the input: text longer than
+    ``MAX_CHARS_PER_TOKEN`` characters per allowed token cannot fit and is never
+    tokenized whole, and only strings up to ``cache_max_chars`` are cached.
+    """
+
+    # No tokenizer we use averages more characters than this per token.
+    MAX_CHARS_PER_TOKEN = 16
+
+    def __init__(
+        self,
+        counter: Callable[[str], int] | None = None,
+        max_input_tokens: int = PLANNER_MAX_INPUT_TOKENS,
+        cache_size: int = 1024,
+        cache_max_chars: int = 8192,
+    ) -> None:
+        if max_input_tokens < 16:
+            raise ValueError("max_input_tokens must be >= 16")
+        self.max_input_tokens = max_input_tokens
+        self.cache_max_chars = cache_max_chars
+        self._counter = counter or estimate_tokens
+        self._cached_count = lru_cache(maxsize=cache_size)(self._count_uncached)
+
+    def count(self, text: str) -> int:
+        if len(text) > self.cache_max_chars:
+            # Large texts would pin megabytes as cache keys and are rarely repeated.
+            return self._count_uncached(text)
+        return self._cached_count(text)
+
+    def fits(self, text: str, max_tokens: int | None = None) -> bool:
+        limit = max_tokens or self.max_input_tokens
+        if len(text) > limit * self.MAX_CHARS_PER_TOKEN:
+            return False
+        return self.count(text) <= limit
+
+    def excerpt(self, text: str, max_tokens: int | None = None) -> str:
+        """Return ``text`` unchanged if it fits, otherwise a head/tail excerpt that does."""
+        limit = max_tokens or self.max_input_tokens
+        window = limit * self.MAX_CHARS_PER_TOKEN
+        if len(text) <= 2 * window:
+            total = self.count(text)
+            if total <= limit:
+                return text
+        else:
+            # Too long to fit; estimate the total from the head and tail windows only.
+            sampled = self.count(text[:window]) + self.count(text[-window:])
+            total = max(limit + 1, round(sampled * len(text) / (2 * window)))
+
+        # Scale the character window by the observed characters-per-token ratio and
+        # shrink until the excerpt (including the omission marker) fits.
+        chars_per_token = len(text) / max(total, 1)
+        keep = int(limit * chars_per_token) // 2
+        while keep > 0:
+            omitted = total - self.count(text[:keep]) - self.count(text[-keep:])
+            candidate = f"{text[:keep]}\n...[{omitted} tokens omitted]...\n{text[-keep:]}"
+            if self.count(candidate) <= limit:
+                return candidate
+            keep = int(keep * 0.8)
+        return f"...[{total} tokens omitted]..."
+
+    def _count_uncached(self, text: str) -> int:
+        try:
+            return int(self._counter(text))
+        except Exception:
+            # Tokenizer not available (e.g. backend deps missing); stop retrying it.
+            self._counter = estimate_tokens
+            return estimate_tokens(text)
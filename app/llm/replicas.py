@@ -0,0 +1,241 @@
+﻿from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Future
+import contextvars
+from dataclasses import replace
+import os
+from pathlib import Path
+import queue
+import threading
+import time
+from typing import Any, Callable
+import zlib
+
+from app.config import MODEL_REPLICAS
+from app.llm.openvino_qwen import OpenVINOQwen, OpenVINOQwenConfig
+
+NODE_ROOT = Path("/sys/devices/system/node")
+
+
+def parse_cpulist(text: str) -> list[int]:
+    """Parse a kernel cpulist such as ``0-3,8-11,16``."""
+    cpus: list[int] = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        cpus.extend(range(int(first), int(last) + 1) if sep else [int(first)])
+    return cpus
+
+
+def numa_nodes(root: Path = NODE_ROOT) -> list[list[int]]:
+    """CPUs of each NUMA node this process may run on; one group of all usable CPUs without NUMA info."""
+    usable = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    nodes = []
+    for node_dir in sorted(root.glob("node[0-9]*"), key=lambda path: int(path.name[4:])):
+        try:
+            cpus = [cpu for cpu in parse_cpulist((node_dir / "cpulist").read_text()) if cpu in usable]
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [usable]
+
+
+def plan_cpusets(replicas: int, nodes: list[list[int]]) -> list[list[int]]:
+    """Split NUMA nodes into ``replicas`` CPU sets that never straddle a node.
+
+    ``replicas <= 0`` means one replica per node. More replicas than nodes divide
+    each node's CPUs evenly; fewer replicas than nodes use the first nodes only.
+    """
+    if replicas <= 0:
+        return [list(cpus) for cpus in nodes]
+    if replicas <= len(nodes):
+        return [list(cpus) for cpus in nodes[:replicas]]
+
+    per_node = [replicas // len(nodes) + (1 if i < replicas % len(nodes) else 0) for i in range(len(nodes))]
+    cpusets = []
+    for cpus, parts in zip(nodes, per_node):
+        parts = min(parts, len(cpus))
+        size, extra = divmod(len(cpus), parts)
+        start = 0
+        for i in range(parts):
+            end = start + size + (1 if i < extra else 0)
+            cpusets.append(cpus[start:end])
+            start = end
+    return cpusets
+
+
+class _Replica:
+    def __init__(self, index: int, llm, cpus: list[int]) -> None:
+        self.index = index
+        self.llm = llm
+        self.cpus = cpus
+        self.jobs: queue.Queue[tuple[Callable[[], Any], Future] | None] = queue.Queue()
+        self.busy = False
+        self.completed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, name=f"model-replica-{index}", daemon=True)
+        self.thread.start()
+
+    @property
+    def load(self) -> int:
+        return self.jobs.qsize() + int(self.busy)
+
+    def submit(self, call: Callable[[], Any]) -> Future:
+        future: Future = Future()
+        # Run in the caller's context so cancellation and scheduling hints still apply.
+        ctx = contextvars.copy_context()
+        self.jobs.put((lambda: ctx.run(call), future))
+        return future
+
+    def _run(self) -> None:
+        if hasattr(os, "sched_setaffinity"):
+            try:
+                # Pins this thread; OpenVINO's inference threads created while loading inherit it,
+                # and first-touch places the weights in this node's memory.
+                os.sched_setaffinity(0, self.cpus)
+            except OSError:
+                pass
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                return
+            call, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.busy = True
+            started = time.perf_counter()
+            try:
+                future.set_result(call())
+            except BaseException as exc:
+                self.errors += 1
+                future.set_exception(exc)
+            finally:
+                self.busy_seconds += time.perf_counter() - started
+                self.completed += 1
+                self.busy = False
+
+
+class ReplicaPool:
+    """Several model replicas, each served by a thread pinned to its own CPU set.
+
+    ``invoke`` goes to the replica with the fewest queued plus running calls; calls
+    with a ``session_id`` always go to the same replica so its KV cache is reused.
+    Exposes the ``OpenVINOQwen`` surface used by ``ModelLifecycleManager``, so the
+    pool can be wrapped for idle unload and memory limits like a single model.
+    """
+
+    def __init__(self, replicas: list[Any], cpusets: list[list[int]]) -> None:
+        if not replicas or len(replicas) != len(cpusets):
+            raise ValueError("ReplicaPool needs one CPU set per replica")
+        self.replicas = [_Replica(i, llm, cpus) for i, (llm, cpus) in enumerate(zip(replicas, cpusets))]
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    @property
+    def is_loaded(self) -> bool:
+        return all(replica.llm.is_loaded for replica in self.replicas)
+
+    def load(self) -> None:
+        """Load every replica on its pinned thread (in parallel)."""
+        futures = [replica.submit(replica.llm.load) for replica in self.replicas]
+        for future in futures:
+            future.result()
+
+    def unload(self) -> None:
+        futures = [replica.submit(replica.llm.unload) for replica in self.replicas]
+        for future in futures:
+            future.result()
+
+    def estimate_model_bytes(self) -> int:
+        return sum(replica.llm.estimate_model_bytes() for replica in self.replicas)
+
+    def kv_cache_bytes(self) -> int:
+        return sum(replica.llm.kv_cache_bytes() for replica in self.replicas if replica.llm.is_loaded)
+
+    def count_tokens(self, text: str) -> int:
+        return self.replicas[0].llm.count_tokens(text)
+
+    def invoke(self, prompt: str, **kwargs: Any) -> str:
+        return self._dispatch(kwargs.get("session_id"), lambda llm: llm.invoke(prompt, **kwargs)).result()
+
+    async def ainvoke(self, prompt: str, **kwargs: Any) -> str:
+        return await asyncio.wrap_future(self._dispatch(kwargs.get("session_id"), lambda llm: llm.invoke(prompt, **kwargs)))
+
+    def invoke_batch(self, prompts: list[str], **kwargs: Any) -> list[str]:
+        def run(llm) -> list[str]:
+            invoke_batch = getattr(llm, "invoke_batch", None)
+            if invoke_batch is None:
+                return [llm.invoke(prompt, **kwargs) for prompt in prompts]
+            return invoke_batch(prompts, **kwargs)
+
+        return self._dispatch(None, run).result()
+
+    def drop_session(self, session_id: str) -> None:
+        self._replica_for(session_id).llm.drop_session(session_id)
+
+    def stats(self) -> dict[str, Any]:
+        uptime = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "replicas": [
+                {
+                    "index": replica.index,
+                    "cpus": len(replica.cpus),
+                    "cpu_list": replica.cpus,
+                    "loaded": replica.llm.is_loaded,
+                    "queued": replica.jobs.qsize(),
+                    "busy": replica.busy,
+                    "completed": replica.completed,
+                    "errors": replica.errors,
+                    "busy_seconds": round(replica.busy_seconds, 3),
+                    "utilization": round(min(1.0, replica.busy_seconds / uptime), 4),
+                }
+                for replica in self.replicas
+            ]
+        }
+
+    def close(self) -> None:
+        for replica in self.replicas:
+            replica.jobs.put(None)
+
+    def _dispatch(self, session_id: str | None, call: Callable[[Any], Any]) -> Future:
+        if session_id:
+            replica = self._replica_for(session_id)
+            return replica.submit(lambda: call(replica.llm))
+        # Pick and enqueue under one lock so concurrent callers see each other's load.
+        with self._lock:
+            replica = min(self.replicas, key=lambda candidate: (candidate.load, candidate.completed))
+            return replica.submit(lambda: call(replica.llm))
+
+
+    def _replica_for(self, session_id: str) -> _Replica:
+        return self.replicas[zlib.crc32(session_id.encode("utf-8")) % len(self.replicas)]
+
+
+def build_replica_pool(spec: str = MODEL_REPLICAS, cfg: OpenVINOQwenConfig | None = None) -> ReplicaPool | None:
+    """Build a CPU replica pool from MODEL_REPLICAS (``auto`` = one per NUMA node, or a count); None when off."""
+    spec = spec.strip().lower()
+    if spec in {"", "0", "off"}:
+        return None
+    count = 0 if spec == "auto" else int(spec)
+    base = cfg or OpenVINOQwenConfig()
+    cpusets = plan_cpusets(count, numa_nodes())
+    replicas = [
+        OpenVINOQwen(
+            replace(
+                base,
+                device="CPU",
+                ov_config={
+                    **base.ov_config,
+                    "INFERENCE_NUM_THREADS": len(cpus),
+                    "NUM_STREAMS": 1,
+                    "PERFORMANCE_HINT": "LATENCY",
+                },
+            )
+        )
+        for cpus in cpusets
+    ]
+    return ReplicaPool(replicas, cpusets)
@@ -0,0 +1,327 @@
+﻿from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import itertools
+import threading
+import time
+from typing import Any, Iterator
+
+from app.cancellation import OperationCancelled, current_token
+from app.config import SCHEDULER_MAX_CONCURRENT, SCHEDULER_MAX_QUEUED_PER_CLIENT
+
+PRIORITIES = ("interactive", "batch")
+
+
+class DeadlineExceeded(RuntimeError):
+    """The request's deadline passed before it reached the model."""
+
+
+class SchedulerRejected(RuntimeError):
+    """The client already has its fair share of requests queued."""
+
+
+@dataclass
+class RequestContext:
+    """Scheduling hints for the LLM calls made while serving one request.
+
+    ``queue_wait_ms`` and ``inference_ms`` accumulate over every LLM call made in
+    this context so callers can report where the time went.
+    """
+
+    priority: str = "interactive"
+    client: str = "anonymous"
+    deadline: float | None = None  # time.monotonic() value
+    queue_wait_ms: float = 0.0
+    inference_ms: float = 0.0
+
+    def remaining(self) -> float | None:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+
+_current: ContextVar[RequestContext | None] = ContextVar("llm_request_context", default=None)
+
+
+def current_request() -> RequestContext:
+    return _current.get() or RequestContext()
+
+
+@contextmanager
+def request_context(
+    priority: str = "interactive",
+    client: str = "anonymous",
+    timeout: float | None = None,
+) -> Iterator[RequestContext]:
+    """Tag LLM calls made inside the block with a priority, a client and an optional timeout."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {PRIORITIES}: {priority}")
+    deadline = time.monotonic() + timeout if timeout else None
+    ctx = RequestContext(priority=priority, client=client or "anonymous", deadline=deadline)
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
+
+
+@dataclass
+class _Ticket:
+    seq: int
+    ctx: RequestContext
+    enqueued: float = field(default_factory=time.monotonic)
+    granted: bool = False
+    expired: bool = False
+    # Async waiters park on a future resolved by _dispatch instead of holding a thread.
+    future: asyncio.Future | None = None
+    loop: asyncio.AbstractEventLoop | None = None
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _ClassStats:
+    def __init__(self, window: int = 512) -> None:
+        self.completed = 0
+        self.expired = 0
+        self.rejected = 0
+        self.queue_wait_ms: deque[float] = deque(maxlen=window)
+        self.inference_ms: deque[float] = deque(maxlen=window)
+
+    def snapshot(self) -> dict[str, Any]:
+        def pct(values: deque[float], q: float) -> float:
+            if not values:
+                return 0.0
+            ordered = sorted(values)
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+        return {
+            "completed": self.completed,
+            "expired": self.expired,
+            "rejected": self.rejected,
+            "queue_wait_ms_p50": pct(self.queue_wait_ms, 0.5),
+            "queue_wait_ms_p95": pct(self.queue_wait_ms, 0.95),
+            "inference_ms_p50": pct(self.inference_ms, 0.5),
+            "inference_ms_p95": pct(self.inference_ms, 0.95),
+        }
+
+
+class LLMScheduler:
+    """Order LLM calls by priority class, deadline and per-client fair share.
+
+    Interactive requests always go before batch ones. Within a class, clients are
+    served round-robin so one client's backlog cannot starve the others, and each
+    client may have at most ``max_queued_per_client`` requests waiting. Requests
+    whose deadline passes while queued are dropped before they use the model.
+    Wraps anything with the ``invoke``/``ainvoke`` interface (lifecycle manager,
+    model client).
+    """
+
+    # Fair-share bookkeeping is kept for this many recently served clients. The one
+    # forgotten first was served longest ago, so it keeps its place in the ranking.
+    MAX_TRACKED_CLIENTS = 4096
+
+    def __init__(
+        self,
+        llm,
+        max_concurrent: int = SCHEDULER_MAX_CONCURRENT,
+        max_queued_per_client: int = SCHEDULER_MAX_QUEUED_PER_CLIENT,
+    ) -> None:
+        self.llm = llm
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued_per_client = max_queued_per_client
+        self._cond = threading.Condition()
+        self._waiting: list[_Ticket] = []
+        self._running = 0
+        self._seq = itertools.count()
+        self._last_served: OrderedDict[str, int] = OrderedDict()
+        self._stats = {priority: _ClassStats() for priority in PRIORITIES}
+
+    def invoke(self, prompt: str, **kwargs: Any) -> str:
+        ctx = current_request()
+        self._acquire(ctx)
+        return self._timed(ctx, lambda: self.llm.invoke(prompt, **kwargs))
+
+    async def ainvoke(self, prompt: str, **kwargs: Any) -> str:
+        ctx = current_request()
+        await self._aacquire(ctx)
+        started = time.perf_counter()
+        try:
+            ainvoke = getattr(self.llm, "ainvoke", None)
+            if ainvoke is not None:
+                return await ainvoke(prompt, **kwargs)
+            return await asyncio.to_thread(self.llm.invoke, prompt, **kwargs)
+        finally:
+            self._finish(ctx, started)
+
+    def count_tokens(self, text: str) -> int:
+        return self.llm.count_tokens(text)
+
+    def unload(self) -> bool:
+        return bool(self.llm.unload()) if hasattr(self.llm, "unload") else False
+
+    def drop_session(self, session_id: str) -> None:
+        if hasattr(self.llm, "drop_session"):
+            self.llm.drop_session(session_id)
+
+    def status(self) -> dict[str, Any]:
+        status = self.llm.status() if hasattr(self.llm, "status") else {}
+        return {**status, "scheduler": self.stats()}
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            queued = {priority: 0 for priority in PRIORITIES}
+            for ticket in self._waiting:
+                queued[ticket.ctx.priority] += 1
+            return {
+                "running": self._running,
+                "max_concurrent": self.max_concurrent,
+                "queued": queued,
+                "classes": {priority: stats.snapshot() for priority, stats in self._stats.items()},
+            }
+
+    def _timed(self, ctx: RequestContext, call) -> str:
+        started = time.perf_counter()
+        try:
+            return call()
+        finally:
+            self._finish(ctx, started)
+
+    def _acquire(self, ctx: RequestContext) -> None:
+        with self._cond:
+            ticket = self._enqueue(ctx)
+            token = current_token()
+            while not ticket.granted and not ticket.expired:
+                timeout = self._check_waiting(ticket, token)
+                if timeout is not None and timeout <= 0:
+                    break
+                self._cond.wait(timeout=timeout)
+            self._settle(ticket)
+
+    async def _aacquire(self, ctx: RequestContext) -> None:
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            ticket = self._enqueue(ctx, loop.create_future(), loop)
+        token = current_token()
+        try:
+            while True:
+                with self._cond:
+                    if ticket.granted or ticket.expired:
+                        break
+                    timeout = self._check_waiting(ticket, token)
+                    if timeout is not None and timeout <= 0:
+                        break
+                try:
+                    await asyncio.wait_for(asyncio.shield(ticket.future), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            with self._cond:
+                if ticket.granted:
+                    # Granted while the caller went away; hand the slot straight back.
+                    self._running -= 1
+                    self._dispatch()
+                elif ticket in self._waiting:
+                    self._waiting.remove(ticket)
+            raise
+        with self._cond:
+            self._settle(ticket)
+
+    def _enqueue(
+        self,
+        ctx: RequestContext,
+        future: asyncio.Future | None = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ) -> _Ticket:
+        # Caller holds self._cond.
+        stats = self._stats[ctx.priority]
+        if ctx.deadline is not None and ctx.remaining() <= 0:
+            stats.expired += 1
+            raise DeadlineExceeded("Request deadline passed before reaching the model")
+        queued = sum(1 for ticket in self._waiting if ticket.ctx.client == ctx.client)
+        if self.max_queued_per_client > 0 and queued >= self.max_queued_per_client:
+            stats.rejected += 1
+            raise SchedulerRejected(f"Client '{ctx.client}' already has {queued} request(s) queued")
+
+        ticket = _Ticket(seq=next(self._seq), ctx=ctx, future=future, loop=loop)
+        self._waiting.append(ticket)
+        self._dispatch()
+        return ticket
+
+    def _check_waiting(self, ticket: _Ticket, token) -> float | None:
+        """Expire or cancel a waiting ticket; returns how long to wait before checking again.
+
+        Caller holds self._cond. A return value <= 0 means the ticket just expired.
+        """
+        remaining = ticket.ctx.remaining()
+        if remaining is not None and remaining <= 0:
+            self._waiting.remove(ticket)
+            ticket.expired = True
+            return 0.0
+        if token is not None:
+            if token.cancelled:
+                self._waiting.remove(ticket)
+                raise OperationCancelled(f"Request {token.reason} while queued for the model")
+            # Cancellation does not notify the scheduler; poll for it.
+            return 0.1 if remaining is None else min(remaining, 0.1)
+        return remaining
+
+    def _settle(self, ticket: _Ticket) -> None:
+        # Caller holds self._cond.
+        stats = self._stats[ticket.ctx.priority]
+        wait_ms = (time.monotonic() - ticket.enqueued) * 1000
+        ticket.ctx.queue_wait_ms += wait_ms
+        if ticket.expired:
+            stats.expired += 1
+            raise DeadlineExceeded(f"Request deadline passed after {wait_ms:.0f} ms in the queue")
+        stats.queue_wait_ms.append(wait_ms)
+
+    def _finish(self, ctx: RequestContext, started: float) -> None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        ctx.inference_ms += elapsed_ms
+        with self._cond:
+            stats = self._stats[ctx.priority]
+            stats.completed += 1
+            stats.inference_ms.append(elapsed_ms)
+            self._running -= 1
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        # Caller holds self._cond.
+        now = time.monotonic()
+        for ticket in [t for t in self._waiting if t.ctx.deadline is not None and t.ctx.deadline <= now]:
+            self._waiting.remove(ticket)
+            ticket.expired = True
+            self._wake(ticket)
+
+        while self._running < self.max_concurrent and self._waiting:
+            ticket = min(self._waiting, key=self._rank)
+            self._waiting.remove(ticket)
+            ticket.granted = True
+            self._running += 1
+            self._last_served[ticket.ctx.client] = next(self._seq)
+            self._last_served.move_to_end(ticket.ctx.client)
+            while len(self._last_served) > self.MAX_TRACKED_CLIENTS:
+                self._last_served.popitem(last=False)
+            self._wake(ticket)
+        self._cond.notify_all()
+
+    def _wake(self, ticket: _Ticket) -> None:
+        if ticket.future is None:
+            return
+        try:
+            ticket.loop.call_soon_threadsafe(_resolve, ticket.future)
+        except RuntimeError:
+            pass  # the waiter's event loop is already closed
+
+    def _rank(self, ticket: _Ticket) -> tuple[int, int, int]:
+        # Priority class first, then the client served longest ago, then arrival order.
+        return (
+            PRIORITIES.index(ticket.ctx.priority),
+            self._last_served.get(ticket.ctx.client, -1),
+            ticket.seq,
+        )
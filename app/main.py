@@ -2,9 +2,22 @@
 
 import argparse
 import json
-
-from app.agent.runner import MVPAgent
+from pathlib import Path
+import sys
+import time
+
+from app.agent.audit import EXPORT_FORMATS, export_records, iter_records, query_records
+from app.agent.planner_eval import DEFAULT_CASES_PATH, load_cases
+from app.agent.runner import LLMToolPlanner, MVPAgent
+from app.api.replay import ReplayClient, load_capture, parse_speed, render_summary
+from app.config import AUDIT_LOG_PATH, DOCUMENT_WRITE_BUFFER_BYTES, MODEL_SERVER_ADDRESS, OPENVINO_DEVICE
+from app.llm.export import DEFAULT_SOURCE_MODEL, DEFAULT_VARIANTS, compare_variants, render_report, write_report
+from app.llm.lifecycle import ModelLifecycleManager
+from app.llm.model_server import ModelClient, ModelServer
 from app.llm.openvino_qwen import OpenVINOQwen
+from app.llm.scheduler import PRIORITIES, request_context
+from app.tools.federated_search import build_federated_search
+from app.tools.search_cache import default_search_cache
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -13,7 +26,12 @@ def build_parser() -> argparse.ArgumentParser:
 
     create_parser = subparsers.add_parser("create", help="Create a document")
     create_parser.add_argument("--title", required=True, help="Document title")
-    create_parser.add_argument("--content", required=True, help="Document content")
+    content_group = create_parser.add_mutually_exclusive_group(required=True)
+    content_group.add_argument("--content", help="Document content")
+    content_group.add_argument(
+        "--content-file",
+        help="Stream document content from a UTF-8 file ('-' for stdin) without loading it into memory",
+    )
     create_parser.add_argument("--format", default="md", choices=["md", "txt"], help="Document format")
     create_parser.add_argument("--output-dir", default=None, help="Sub directory under allowed output root")
 
@@ -21,31 +39,151 @@ def build_parser() -> argparse.ArgumentParser:
     search_parser.add_argument("--root-path", default=".", help="Search root under allowed output root")
     search_parser.add_argument("--pattern", default="*.md", help="Glob pattern")
     search_parser.add_argument("--max-results", type=int, default=20, help="Maximum number of results")
+    search_parser.add_argument("--federated", action="store_true", help="Also search peers listed in SEARCH_PEERS")
 
     chat_parser = subparsers.add_parser("chat", help="Auto-select tool from a natural language prompt")
     chat_parser.add_argument("--prompt", required=True, help="Natural language instruction")
+    chat_parser.add_argument(
+        "--priority",
+        default="interactive",
+        choices=list(PRIORITIES),
+        help="Scheduling class when sharing a model server (batch yields to interactive requests)",
+    )
     subparsers.add_parser("download-model", help="Download/prepare LLM model to local cache")
 
+    serve_parser = subparsers.add_parser("serve-model", help="Run a shared local inference server that owns the model")
+    serve_parser.add_argument(
+        "--address",
+        default=MODEL_SERVER_ADDRESS or None,
+        help="Unix socket path or host:port (clients use MODEL_SERVER_ADDRESS)",
+    )
+    serve_parser.add_argument("--max-batch-size", type=int, default=8, help="Maximum requests per generation batch")
+    serve_parser.add_argument("--batch-window-ms", type=float, default=5.0, help="Time to wait for more requests to batch")
+
+    quant_parser = subparsers.add_parser(
+        "quantize-eval",
+        help="Export weight-quantized variants and compare planner accuracy/latency",
+    )
+    quant_parser.add_argument("--model-id", default=DEFAULT_SOURCE_MODEL, help="Full-precision Hugging Face model id to export")
+    quant_parser.add_argument(
+        "--variants",
+        default=",".join(DEFAULT_VARIANTS),
+        help="Comma separated variants such as int8,int4_sym_g128,int4_asym_g64",
+    )
+    quant_parser.add_argument("--output-dir", default="models/quantized", help="Where exported variants are stored")
+    quant_parser.add_argument("--cases", default=str(DEFAULT_CASES_PATH), help="Labeled prompts (JSONL)")
+    quant_parser.add_argument("--device", default=OPENVINO_DEVICE, help="OpenVINO device for evaluation")
+    quant_parser.add_argument("--report", default="reports/quantization.md", help="Markdown report path")
+    quant_parser.add_argument(
+        "--min-accuracy",
+        type=float,
+        default=0.9,
+        help="Argument accuracy required for a variant to be recommended",
+    )
+
+    replay_parser = subparsers.add_parser("replay", help="Replay a captured request log against an API server")
+    replay_parser.add_argument("--capture", required=True, help="Capture file written via REQUEST_CAPTURE_PATH")
+    replay_parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="API server to replay against")
+    replay_parser.add_argument("--speed", default="1", help="Replay speed: 1, 10x, ... or max")
+    replay_parser.add_argument("--max-workers", type=int, default=64, help="Maximum concurrent in-flight requests")
+    replay_parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    replay_parser.add_argument("--report", default=None, help="Optional JSON report path")
+
+    audit_parser = subparsers.add_parser("audit", help="Inspect the agent run audit log (AUDIT_LOG_PATH)")
+    audit_commands = audit_parser.add_subparsers(dest="audit_command", required=True)
+    query_parser = audit_commands.add_parser("query", help="Show recent audited runs")
+    query_parser.add_argument("--tool", default=None, help="Only runs that selected this tool")
+    query_parser.add_argument("--fallback-only", action="store_true", help="Only runs where the rule planner was used")
+    query_parser.add_argument("--since-hours", type=float, default=None, help="Only runs from the last N hours")
+    query_parser.add_argument("--contains", default=None, help="Only prompts containing this text")
+    query_parser.add_argument("--limit", type=int, default=20, help="Maximum number of runs (0 = all)")
+    export_parser = audit_commands.add_parser("export", help="Export audited runs")
+    export_parser.add_argument("--format", default="jsonl", choices=list(EXPORT_FORMATS), help="eval = planner eval cases")
+    export_parser.add_argument("--output", default="-", help="Output file ('-' for stdout)")
+    for sub in (query_parser, export_parser):
+        sub.add_argument("--path", default=AUDIT_LOG_PATH or None, required=not AUDIT_LOG_PATH, help="Audit log path")
+
     return parser
 
 
 def main() -> int:
     args = build_parser().parse_args()
-    agent = MVPAgent()
 
-    if args.command == "create":
-        result = agent.create_document(
-            title=args.title,
-            content=args.content,
-            format=args.format,
-            output_dir=args.output_dir,
+    if args.command == "serve-model":
+        server = ModelServer(
+            ModelLifecycleManager(OpenVINOQwen()),
+            address=args.address,
+            max_batch_size=args.max_batch_size,
+            batch_window_ms=args.batch_window_ms,
         )
+        print(f"Model server listening on {server.address}")
+        server.serve_forever()
+        return 0
+
+    if args.command == "quantize-eval":
+        variants = [name.strip() for name in args.variants.split(",") if name.strip()]
+        rows = compare_variants(args.model_id, variants, load_cases(args.cases), args.output_dir, args.device)
+        report = write_report(args.report, args.model_id, rows, args.min_accuracy)
+        print(render_report(args.model_id, rows, args.min_accuracy))
+        print(f"Report written to {report}")
+        return 0
+
+    if args.command == "replay":
+        client = ReplayClient(args.base_url, max_workers=args.max_workers, timeout=args.timeout)
+        report = client.replay(load_capture(args.capture), speed=parse_speed(args.speed))
+        print(render_summary(report))
+        if args.report:
+            Path(args.report).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        return 0
+
+    if args.command == "audit":
+        if args.audit_command == "query":
+            since = time.time() - args.since_hours * 3600 if args.since_hours is not None else None
+            records = query_records(
+                args.path,
+                tool=args.tool,
+                fallback_only=args.fallback_only,
+                since=since,
+                text=args.contains,
+                limit=args.limit,
+            )
+            print(json.dumps(records, ensure_ascii=False, indent=2))
+            return 0
+        text = export_records(iter_records(args.path), format=args.format)
+        if args.output == "-":
+            sys.stdout.write(text)
+        else:
+            Path(args.output).write_text(text, encoding="utf-8")
+        return 0
+
+    llm = ModelClient(MODEL_SERVER_ADDRESS) if MODEL_SERVER_ADDRESS else None
+    federation = build_federated_search(lambda root, pattern, limit: default_search_cache.search(root, pattern, limit)[0])
+    agent = MVPAgent(planner=LLMToolPlanner(llm=llm), federation=federation)
+
+    if args.command == "create":
+        if args.content_file:
+            source = sys.stdin.buffer if args.content_file == "-" else open(args.content_file, "rb")
+            with source:
+                result = agent.create_document_stream(
+                    title=args.title,
+                    chunks=iter(lambda: source.read(DOCUMENT_WRITE_BUFFER_BYTES), b""),
+                    format=args.format,
+                    output_dir=args.output_dir,
+                )
+        else:
+            result = agent.create_document(
+                title=args.title,
+                content=args.content,
+                format=args.format,
+                output_dir=args.output_dir,
+            )
         print(result.message)
         print(json.dumps(result.data, ensure_ascii=False, indent=2))
         return 0
 
     if args.command == "search":
-        result = agent.search_files(
+        search_files = agent.search_files_federated if args.federated else agent.search_files
+        result = search_files(
             root_path=args.root_path,
             pattern=args.pattern,
             max_results=args.max_results,
@@ -55,7 +193,8 @@ def main() -> int:
         return 0
 
     if args.command == "chat":
-        result = agent.run_prompt(args.prompt)
+        with request_context(priority=args.priority, client="cli"):
+            result = agent.run_prompt(args.prompt)
         print(result.message)
         print(json.dumps(result.data, ensure_ascii=False, indent=2))
         return 0
@@ -1,12 +1,29 @@
 ﻿from __future__ import annotations
 
+import codecs
+import contextlib
 from datetime import datetime
+import itertools
+import os
 from pathlib import Path
 import re
+import tempfile
+from typing import Iterable
 
 from pydantic import BaseModel, Field
 
-from app.config import ALLOWED_OUTPUT_ROOT, SUPPORTED_FORMATS
+from app.cancellation import check_cancelled
+from app.config import ALLOWED_OUTPUT_ROOT, DOCUMENT_WRITE_BUFFER_BYTES, SUPPORTED_FORMATS
+
+
+def _current_umask() -> int:
+    # Only readable by setting it; done once at import, before any worker threads exist.
+    mask = os.umask(0o022)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _current_umask()
 
 
 class DocumentCreateInput(BaseModel):
@@ -41,7 +58,37 @@ def _resolve_output_dir(output_dir: str | None) -> Path:
     return target
 
 
+def _file_mode(path: Path) -> int:
+    """Mode a plain ``open(path, "w")`` would give: the existing file's, else 0o666 minus the umask."""
+    try:
+        return path.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def _header(title: str, fmt: str) -> str:
+    if fmt == "md":
+        return f"# {title}\n\n"
+    return f"{title}\n{'=' * len(title)}\n\n"
+
+
 def create_document(title: str, content: str, format: str = "md", output_dir: str | None = None) -> dict[str, str]:
+    return create_document_stream(title, [content], format=format, output_dir=output_dir)
+
+
+def create_document_stream(
+    title: str,
+    chunks: Iterable[str | bytes],
+    format: str = "md",
+    output_dir: str | None = None,
+    buffer_size: int = DOCUMENT_WRITE_BUFFER_BYTES,
+) -> dict[str, str]:
+    """Write a document from content chunks (text or UTF-8 bytes) without holding it in memory.
+
+    Output matches :func:`create_document`: header, content with trailing whitespace
+    removed, final newline. The file is written under a temporary name next to the
+    target and renamed into place, so readers never see a partial document.
+    """
     fmt = format.lower().strip()
     if fmt not in SUPPORTED_FORMATS:
         raise ValueError(f"unsupported format: {fmt}; expected one of {sorted(SUPPORTED_FORMATS)}")
@@ -50,15 +97,62 @@ def create_document(title: str, content: str, format: str = "md", output_dir: st
     file_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{_sanitize_title(title)}.{fmt}"
     path = out_dir / file_name
 
-    if fmt == "md":
-        body = f"# {title}\n\n{content.rstrip()}\n"
-    else:
-        body = f"{title}\n{'=' * len(title)}\n\n{content.rstrip()}\n"
-
-    path.write_text(body, encoding="utf-8")
+    fd, tmp_name = tempfile.mkstemp(dir=out_dir, prefix=f".{file_name}.", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb", buffering=buffer_size) as handle:
+            _write_body(handle, _header(title, fmt), chunks, buffer_size)
+        # mkstemp creates the file 0600; give the document the permissions it always had.
+        os.chmod(tmp_name, _file_mode(path))
+        os.replace(tmp_name, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_name)
+        raise
     return {"saved_path": str(path), "format": fmt}
 
 
+def _write_body(handle, header: str, chunks: Iterable[str | bytes], buffer_size: int) -> None:
+    # Same bytes as Path.write_text(): text newlines become the platform line separator.
+    def encode(text: str) -> bytes:
+        if os.linesep != "\n":
+            text = text.replace("\n", os.linesep)
+        return text.encode("utf-8")
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    # Trailing whitespace is held back until more content follows, so the end of the
+    # document can be stripped like str.rstrip(). A run longer than the buffer is
+    # written out and, if nothing follows it, truncated away at the end.
+    pending = ""
+    spilled_at: int | None = None
+
+    handle.write(encode(header))
+    for chunk in itertools.chain(chunks, [None]):
+        check_cancelled()
+        if chunk is None:
+            text = decoder.decode(b"", final=True)
+        else:
+            text = decoder.decode(chunk) if isinstance(chunk, (bytes, bytearray, memoryview)) else chunk
+        if not text:
+            continue
+        stripped = text.rstrip()
+        if stripped:
+            handle.write(encode(pending + stripped))
+            pending = text[len(stripped):]
+            spilled_at = None
+        else:
+            pending += text
+        if len(pending) > buffer_size:
+            if spilled_at is None:
+                spilled_at = handle.tell()
+            handle.write(encode(pending))
+            pending = ""
+
+    if spilled_at is not None:
+        handle.seek(spilled_at)
+        handle.truncate()
+    handle.write(encode("\n"))
+
+
 try:
     from langchain_core.tools import StructuredTool
 except Exception:  # pragma: no cover
@@ -0,0 +1,169 @@
+﻿from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+import http.client
+import json
+import queue
+import time
+from typing import Any, Callable
+from urllib.parse import urlsplit
+
+from app.config import NODE_NAME, SEARCH_PEER_TIMEOUT_SECONDS, SEARCH_PEERS
+
+
+@dataclass(frozen=True)
+class Peer:
+    name: str
+    base_url: str
+
+
+def parse_peers(spec: str) -> list[Peer]:
+    """Parse ``name=http://host:port,...`` (a bare URL uses its host:port as the name)."""
+    peers = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, url = item.partition("=")
+        if not sep:
+            url, name = item, urlsplit(item).netloc
+        peers.append(Peer(name=name.strip(), base_url=url.strip().rstrip("/")))
+    return peers
+
+
+class _PeerConnections:
+    """Keep-alive HTTP connections to one peer, reused across searches."""
+
+    def __init__(self, peer: Peer, timeout: float, max_idle: int = 4) -> None:
+        parts = urlsplit(peer.base_url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.secure = parts.scheme == "https"
+        self.timeout = timeout
+        self._idle: queue.LifoQueue[http.client.HTTPConnection] = queue.LifoQueue(maxsize=max_idle)
+
+    def post_json(self, path: str, payload: dict[str, Any]) -> Any:
+        conn = self._checkout()
+        body = json.dumps(payload).encode("utf-8")
+        try:
+            conn.request("POST", self.prefix + path, body=body, headers={"Content-Type": "application/json"})
+            res = conn.getresponse()
+            data = res.read()
+        except Exception:
+            conn.close()
+            raise
+        if res.will_close:
+            conn.close()
+        else:
+            self._checkin(conn)
+        if res.status != 200:
+            raise RuntimeError(f"HTTP {res.status}: {data[:200].decode('utf-8', 'replace')}")
+        return json.loads(data)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _checkout(self) -> http.client.HTTPConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+            return cls(self.host, self.port, timeout=self.timeout)
+
+    def _checkin(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+class FederatedSearch:
+    """Fan a ``file_search`` query out to this node and peer agents' ``/v1/tools/search``.
+
+    Peers are queried concurrently with a per-peer timeout; peers that fail or time
+    out are reported in ``errors`` while the other nodes' results are still returned.
+    """
+
+    def __init__(
+        self,
+        peers: list[Peer],
+        local_search: Callable[[str, str, int], list[dict[str, Any]]],
+        node_name: str = NODE_NAME,
+        timeout: float = SEARCH_PEER_TIMEOUT_SECONDS,
+    ) -> None:
+        self.peers = peers
+        self.local_search = local_search
+        self.node_name = node_name
+        self.timeout = timeout
+        self._connections = {peer.name: _PeerConnections(peer, timeout) for peer in peers}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(peers)), thread_name_prefix="federated-search")
+
+    def search(self, root_path: str = ".", pattern: str = "*.md", max_results: int = 20) -> tuple[list[dict[str, Any]], dict[str, str]]:
+        """Return ``(results, errors)``; results are merged newest-first and tagged with ``node``."""
+        payload = {"root_path": root_path, "pattern": pattern, "max_results": max_results}
+        futures = {
+            self._executor.submit(self._connections[peer.name].post_json, "/v1/tools/search", payload): peer.name
+            for peer in self.peers
+        }
+        deadline = time.monotonic() + self.timeout
+
+        per_node: dict[str, list[dict[str, Any]]] = {}
+        errors: dict[str, str] = {}
+        try:
+            per_node[self.node_name] = list(self.local_search(root_path, pattern, max_results))
+        except (ValueError, OSError) as exc:
+            errors[self.node_name] = str(exc)
+
+        done, pending = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        for future in pending:
+            future.cancel()
+            errors[futures[future]] = f"timed out after {self.timeout}s"
+        for future in done:
+            name = futures[future]
+            try:
+                body = future.result()
+                per_node[name] = list(body.get("data") or [])
+            except Exception as exc:
+                errors[name] = str(exc) or type(exc).__name__
+
+        return self._merge(per_node, max_results), errors
+
+    def close(self) -> None:
+        for connections in self._connections.values():
+            connections.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _merge(self, per_node: dict[str, list[dict[str, Any]]], max_results: int) -> list[dict[str, Any]]:
+        seen: set[tuple[str, str]] = set()
+        merged = []
+        for node, results in per_node.items():
+            for item in results:
+                key = (node, str(item.get("path")))
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append({**item, "node": node})
+
+        def mtime(item: dict[str, Any]) -> int:
+            try:
+                return int(item.get("mtime", 0))
+            except (TypeError, ValueError):
+                return 0
+
+        # Newest first; node/path break ties so the order does not depend on peer timing.
+        merged.sort(key=lambda item: (-mtime(item), item["node"], str(item.get("path"))))
+        return merged[:max_results]
+
+
+def build_federated_search(local_search: Callable[[str, str, int], list[dict[str, Any]]]) -> FederatedSearch | None:
+    """Return a FederatedSearch for the peers in SEARCH_PEERS, or None when none are configured."""
+    peers = parse_peers(SEARCH_PEERS)
+    if not peers:
+        return None
+    return FederatedSearch(peers, local_search=local_search)
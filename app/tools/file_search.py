@@ -1,11 +1,42 @@
 ﻿from __future__ import annotations
 
+from dataclasses import dataclass
+import fnmatch
 import os
 from pathlib import Path
 import string
+from typing import Any, Iterator
 
 from pydantic import BaseModel, Field
 
+from app.cancellation import check_cancelled
+
+
+@dataclass(frozen=True, slots=True)
+class FileRecord:
+    """One search hit with typed fields; ``node`` is set for federated results."""
+
+    path: str
+    size: int
+    mtime: int
+    node: str | None = None
+
+    def as_row(self) -> dict[str, str]:
+        row = {"path": self.path, "size": str(self.size), "mtime": str(self.mtime)}
+        if self.node is not None:
+            row["node"] = self.node
+        return row
+
+    @classmethod
+    def from_row(cls, row: dict[str, Any]) -> FileRecord:
+        node = row.get("node")
+        return cls(
+            path=str(row["path"]),
+            size=int(row.get("size") or 0),
+            mtime=int(row.get("mtime") or 0),
+            node=None if node is None else str(node),
+        )
+
 
 class FileSearchInput(BaseModel):
     root_path: str = Field(default=".")
@@ -29,16 +60,35 @@ def _expand_search_roots(root_path: str) -> list[Path]:
     return [target]
 
 
-def file_search(root_path: str = ".", pattern: str = "*.md", max_results: int = 20) -> list[dict[str, str]]:
+def _walk(root: Path, pattern: str) -> Iterator[Path]:
+    """Yield paths under ``root`` matching ``pattern`` like ``root.rglob(pattern)``.
+
+    Simple name patterns are matched while walking so cancellation is checked per
+    directory, not only when a match turns up.
+    """
+    if "/" in pattern or os.sep in pattern:
+        for path in root.rglob(pattern):
+            check_cancelled()
+            yield path
+        return
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        check_cancelled()
+        for name in filenames:
+            if fnmatch.fnmatch(name, pattern):
+                yield Path(dirpath) / name
+
+
+def search_records(root_path: str = ".", pattern: str = "*.md", max_results: int = 20) -> list[FileRecord]:
     roots = _expand_search_roots(root_path)
-    results: list[dict[str, str]] = []
+    results: list[FileRecord] = []
     seen: set[str] = set()
 
     for root in roots:
         if not root.exists():
             continue
         try:
-            iterator = root.rglob(pattern)
+            iterator = _walk(root, pattern)
             for path in iterator:
                 try:
                     if not path.is_file():
@@ -47,13 +97,7 @@ def file_search(root_path: str = ".", pattern: str = "*.md", max_results: int =
                     if real in seen:
                         continue
                     stat = path.stat()
-                    results.append(
-                        {
-                            "path": real,
-                            "size": str(stat.st_size),
-                            "mtime": str(int(stat.st_mtime)),
-                        }
-                    )
+                    results.append(FileRecord(real, stat.st_size, int(stat.st_mtime)))
                     seen.add(real)
                     if len(results) >= max_results:
                         return results
@@ -65,6 +109,11 @@ def file_search(root_path: str = ".", pattern: str = "*.md", max_results: int =
     return results
 
 
+def file_search(root_path: str = ".", pattern: str = "*.md", max_results: int = 20) -> list[dict[str, str]]:
+    """Search results as JSON-style rows with ``size``/``mtime`` as strings (the tool's wire format)."""
+    return [record.as_row() for record in search_records(root_path, pattern, max_results)]
+
+
 try:
     from langchain_core.tools import StructuredTool
 except Exception:  # pragma: no cover
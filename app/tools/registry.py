@@ -0,0 +1,170 @@
+﻿from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import cached_property
+import re
+import threading
+from typing import Any, Callable, Iterator
+
+from pydantic import BaseModel
+
+from app.tools.document_create import DocumentCreateInput
+from app.tools.file_search import FileSearchInput
+
+_CHOICES = re.compile(r"^\^\(([\w.|-]+)\)\$$")
+_JSON_TYPES = {"string": "str", "integer": "int", "number": "float", "boolean": "bool", "null": "null"}
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """Declaration of one agent tool; everything else is derived from it.
+
+    ``execute(agent, **params)`` runs the tool with validated arguments and receives
+    the agent so tools share its search cache, federation and session state.
+    ``coerce`` repairs loosely typed LLM arguments before validation.
+    ``content_arg`` names the argument that may hold the full user request when the
+    planner only saw an excerpt of it.
+    """
+
+    name: str
+    description: str
+    input_model: type[BaseModel]
+    execute: Callable[..., Any]
+    read_only: bool
+    coerce: Callable[[dict[str, Any]], dict[str, Any]] = lambda args: args
+    hints: tuple[str, ...] = ()
+    content_arg: str | None = None
+
+    @cached_property
+    def json_schema(self) -> dict[str, Any]:
+        return self.input_model.model_json_schema()
+
+    @cached_property
+    def prompt_line(self) -> str:
+        properties = self.json_schema.get("properties", {})
+        arguments = ", ".join(f"{name}({_describe(schema)})" for name, schema in properties.items())
+        return f"- {self.name} arguments: {arguments}"
+
+    def prepare(self, arguments: dict[str, Any]) -> dict[str, Any]:
+        """Coerce and validate planner arguments; raises ValueError when they cannot be used."""
+        return self.input_model.model_validate(self.coerce(arguments)).model_dump()
+
+
+def _describe(schema: dict[str, Any]) -> str:
+    if "anyOf" in schema:
+        return "|".join(_describe(option) for option in schema["anyOf"])
+    choices = _CHOICES.match(schema.get("pattern", ""))
+    if choices:
+        return "|".join(f"'{choice}'" for choice in choices.group(1).split("|"))
+    kind = _JSON_TYPES.get(schema.get("type", ""), schema.get("type", "any"))
+    if "minimum" in schema and "maximum" in schema:
+        return f"{kind} {schema['minimum']}..{schema['maximum']}"
+    return kind
+
+
+class ToolRegistry:
+    """Tools the planner may choose, with the prompt text and lookups derived once.
+
+    The planner prompt section is rebuilt only when a tool is registered, so the
+    per-request path is a dict lookup and a cached string.
+    """
+
+    def __init__(self, specs: list[ToolSpec] | None = None) -> None:
+        self._specs: dict[str, ToolSpec] = {}
+        self._lock = threading.Lock()
+        self._prompt: str | None = None
+        self.version = 0
+        for spec in specs or []:
+            self.register(spec)
+
+    def register(self, spec: ToolSpec) -> ToolSpec:
+        with self._lock:
+            if spec.name in self._specs:
+                raise ValueError(f"Tool already registered: {spec.name}")
+            _ = spec.prompt_line  # derive the schema and prompt text now, not on the first request
+            self._specs = {**self._specs, spec.name: spec}
+            self._prompt = None
+            self.version += 1
+        return spec
+
+    def get(self, name: str) -> ToolSpec | None:
+        return self._specs.get(name)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._specs
+
+    def __iter__(self) -> Iterator[ToolSpec]:
+        return iter(self._specs.values())
+
+    def names(self) -> list[str]:
+        return list(self._specs)
+
+    def prompt_section(self) -> str:
+        """``Tools:`` block of the planner system prompt (argument lines, then tool hints)."""
+        prompt = self._prompt
+        if prompt is None:
+            lines = ["Tools:", *(spec.prompt_line for spec in self)]
+            lines.extend(hint for spec in self for hint in spec.hints)
+            prompt = self._prompt = "\n".join(lines) + "\n"
+        return prompt
+
+    def describe(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "name": spec.name,
+                "description": spec.description,
+                "read_only": spec.read_only,
+                "input_schema": spec.json_schema,
+            }
+            for spec in self
+        ]
+
+
+def _coerce_search_args(args: dict[str, Any]) -> dict[str, Any]:
+    raw_max = args.get("max_results", 20)
+    try:
+        max_results = int(raw_max)
+    except (TypeError, ValueError):
+        max_results = 20
+    return {
+        "root_path": str(args.get("root_path", ".")),
+        "pattern": str(args.get("pattern", "*.md")),
+        "max_results": max(1, min(200, max_results)),
+    }
+
+
+def _coerce_create_args(args: dict[str, Any]) -> dict[str, Any]:
+    fmt = str(args.get("format", "md")).lower().strip()
+    output_dir = args.get("output_dir")
+    return {
+        "title": (str(args.get("title", "Agent_Note")).strip() or "Agent_Note")[:200],
+        "content": str(args.get("content", "")).strip() or "(empty)",
+        "format": fmt if fmt in {"md", "txt"} else "md",
+        "output_dir": None if output_dir is None else str(output_dir),
+    }
+
+
+FILE_SEARCH_TOOL = ToolSpec(
+    name="file_search_tool",
+    description="Search files on this computer (root_path=this_pc for the whole computer).",
+    input_model=FileSearchInput,
+    execute=lambda agent, **params: agent.search_files_federated(**params),
+    read_only=True,
+    coerce=_coerce_search_args,
+    hints=(
+        "If user mentions whole computer, use root_path='this_pc'.",
+        "If user asks for python files, prefer pattern='*.py'.",
+    ),
+)
+
+DOCUMENT_CREATE_TOOL = ToolSpec(
+    name="document_create_tool",
+    description="Create a local document in md or txt format.",
+    input_model=DocumentCreateInput,
+    execute=lambda agent, **params: agent.create_document(**params),
+    read_only=False,
+    coerce=_coerce_create_args,
+    content_arg="content",
+)
+
+default_tool_registry = ToolRegistry([FILE_SEARCH_TOOL, DOCUMENT_CREATE_TOOL])
@@ -0,0 +1,48 @@
+﻿from __future__ import annotations
+
+from typing import Any, Iterable
+
+from app.tools.file_search import FileRecord
+
+FORMATS = ("rows", "columns", "msgpack")
+COLUMNS_MEDIA_TYPE = "application/vnd.aiagent.columns+json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+def negotiate_format(requested: str | None, accept: str = "") -> str:
+    """Pick the search result format: an explicit ``format`` wins, then the Accept header, else rows.
+
+    Rows stay the default so existing clients keep receiving string-typed dicts.
+    """
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        return requested
+    media_types = [part.split(";", 1)[0].strip().lower() for part in accept.split(",")]
+    for media_type in media_types:
+        if media_type in MSGPACK_MEDIA_TYPES:
+            return "msgpack"
+        if media_type == COLUMNS_MEDIA_TYPE:
+            return "columns"
+    return "rows"
+
+
+def to_columns(records: Iterable[FileRecord]) -> dict[str, list[Any]]:
+    """Column arrays with integer ``size``/``mtime``; ``node`` only appears for federated results."""
+    records = list(records)
+    columns: dict[str, list[Any]] = {
+        "path": [record.path for record in records],
+        "size": [record.size for record in records],
+        "mtime": [record.mtime for record in records],
+    }
+    if any(record.node is not None for record in records):
+        columns["node"] = [record.node for record in records]
+    return columns
+
+
+def pack_msgpack(payload: dict[str, Any]) -> bytes:
+    try:
+        import msgpack
+    except Exception as exc:
+        raise RuntimeError("msgpack output needs the msgpack package: pip install msgpack") from exc
+    return msgpack.packb(payload, use_bin_type=True)
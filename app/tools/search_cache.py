@@ -0,0 +1,166 @@
+﻿from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import json
+from pathlib import Path
+import threading
+import time
+from typing import Any
+
+from app.config import SEARCH_CACHE_MAX_BYTES, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS
+from app.tools.file_search import FileRecord, _expand_search_roots, search_records
+
+
+@dataclass
+class _Entry:
+    results: tuple[FileRecord, ...]
+    etag: str
+    fingerprint: tuple[tuple[str, int, int], ...]
+    generation: int
+    created: float
+    size: int
+
+
+def _stat(path: str) -> tuple[int, int]:
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return -1, -1
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _file_stats(results: tuple[FileRecord, ...]) -> tuple[tuple[str, int, int], ...]:
+    """``(path, mtime_ns, size)`` of every result; in-place edits change these, not the directory."""
+    return tuple((record.path, *_stat(record.path)) for record in results)
+
+
+def _fingerprint(
+    roots: list[Path],
+    results: tuple[FileRecord, ...],
+    files: tuple[tuple[str, int, int], ...] | None = None,
+) -> tuple[tuple[str, int, int], ...]:
+    """Cheap validator: the search roots, every directory holding a result, and the results.
+
+    Adding, removing or renaming a matching file next to an existing result, or
+    directly under a root, changes a directory mtime; rewriting a result changes
+    its own nanosecond mtime or size. No tree walk is needed for either.
+    Deeper additions are bounded by the cache TTL.
+    """
+    dirs = {str(root) for root in roots}
+    dirs.update(str(Path(record.path).parent) for record in results)
+    return tuple((path, *_stat(path)) for path in sorted(dirs)) + (files if files is not None else _file_stats(results))
+
+
+class SearchResultCache:
+    """LRU cache for ``file_search`` results keyed by normalized arguments."""
+
+    def __init__(
+        self,
+        max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+        max_bytes: int = SEARCH_CACHE_MAX_BYTES,
+        ttl_seconds: float = SEARCH_CACHE_TTL_SECONDS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple[Any, ...], _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._evictions = 0
+
+    def search(self, root_path: str = ".", pattern: str = "*.md", max_results: int = 20) -> tuple[list[dict[str, str]], str]:
+        """Return ``(results, etag)`` as ``file_search`` rows, re-walking only when the entry is invalid."""
+        records, etag = self.search_records(root_path=root_path, pattern=pattern, max_results=max_results)
+        return [record.as_row() for record in records], etag
+
+    def search_records(self, root_path: str = ".", pattern: str = "*.md", max_results: int = 20) -> tuple[list[FileRecord], str]:
+        """Like :meth:`search` but returns the typed records the cache holds."""
+        roots = _expand_search_roots(root_path)
+        key = (tuple(str(root) for root in roots), pattern, max_results)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self._generation
+        if entry is not None:
+            if self._is_valid(entry, roots, generation):
+                with self._lock:
+                    self._hits += 1
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                return list(entry.results), entry.etag
+            with self._lock:
+                self._stale += 1
+
+        results = tuple(search_records(root_path=root_path, pattern=pattern, max_results=max_results))
+        encoded = json.dumps([[r.path, r.size, r.mtime] for r in results], ensure_ascii=False).encode("utf-8")
+        # Rows only carry whole-second mtimes; the file stats tell same-second rewrites apart.
+        files = _file_stats(results)
+        etag = '"' + hashlib.sha1(encoded + json.dumps(files).encode("utf-8")).hexdigest() + '"'
+        fresh = _Entry(
+            results=results,
+            etag=etag,
+            fingerprint=_fingerprint(roots, results, files),
+            generation=generation,
+            created=time.monotonic(),
+            size=len(encoded),
+        )
+        with self._lock:
+            self._misses += 1
+            self._store(key, fresh)
+        return list(results), etag
+
+    def invalidate(self) -> None:
+        """Invalidate every entry, e.g. after this process wrote files."""
+        with self._lock:
+            self._generation += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "stale": self._stale,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "generation": self._generation,
+            }
+
+    def _is_valid(self, entry: _Entry, roots: list[Path], generation: int) -> bool:
+        if entry.generation != generation:
+            return False
+        if time.monotonic() - entry.created > self.ttl_seconds:
+            return False
+        return _fingerprint(roots, entry.results) == entry.fingerprint
+
+    def _store(self, key: tuple[Any, ...], entry: _Entry) -> None:
+        # Caller holds self._lock.
+        if entry.size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self._evictions += 1
+
+
+default_search_cache = SearchResultCache()
@@ -1,10 +1,17 @@
 ﻿from __future__ import annotations
 
+import asyncio
 import shutil
+import threading
+import time
 import unittest
 from pathlib import Path
 
-from app.agent.runner import MVPAgent
+from app.agent.runner import AgentResult, MVPAgent, SpeculationStats
+from app.cancellation import check_cancelled
+from app.tools.file_search import FileSearchInput
+from app.tools.registry import DOCUMENT_CREATE_TOOL, ToolRegistry, ToolSpec
+from app.llm.scheduler import DeadlineExceeded, SchedulerRejected
 
 
 class FakePlanner:
@@ -15,6 +22,16 @@ class FakePlanner:
         return self._decision
 
 
+class AsyncFakePlanner(FakePlanner):
+    def __init__(self, decision: dict):
+        super().__init__(decision)
+        self.async_calls = 0
+
+    async def aplan(self, user_prompt: str) -> dict:
+        self.async_calls += 1
+        return self._decision
+
+
 class BrokenPlanner:
     def plan(self, user_prompt: str) -> dict:
         raise ValueError("Planner returned invalid JSON")
@@ -25,6 +42,14 @@ class RuntimeBrokenPlanner:
         raise RuntimeError("Missing dependencies. Install: pip install transformers optimum-intel openvino")
 
 
+class OverloadedPlanner:
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def plan(self, user_prompt: str) -> dict:
+        raise self.error
+
+
 class AgentAutoToolSelectionTests(unittest.TestCase):
     def setUp(self) -> None:
         self.base = Path("workspace")
@@ -90,12 +115,171 @@ class AgentAutoToolSelectionTests(unittest.TestCase):
         self.assertIn("fallback planner used", result.message)
         self.assertIn("invalid JSON", result.data["fallback_reason"])
 
+    def test_scheduler_shedding_is_not_a_fallback(self) -> None:
+        for error in (SchedulerRejected("queue full"), DeadlineExceeded("too late")):
+            agent = MVPAgent(planner=OverloadedPlanner(error), speculative=False)
+            with self.assertRaises(type(error)):
+                agent.run_prompt("workspace/notes.md というメモを作成して")
+            with self.assertRaises(type(error)):
+                asyncio.run(agent.arun_prompt("workspace/notes.md というメモを作成して"))
+        self.assertFalse(Path("workspace/notes.md").exists())
+
     def test_runtime_error_falls_back(self) -> None:
         agent = MVPAgent(planner=RuntimeBrokenPlanner())
         result = agent.run_prompt("app以下のpythonファイルを教えて")
         self.assertEqual(result.data["selected_tool"], "file_search_tool")
         self.assertIn("fallback planner used", result.message)
 
+    def test_arun_prompt_uses_async_planner(self) -> None:
+        planner = AsyncFakePlanner(
+            {
+                "action": "use_tool",
+                "tool_name": "file_search_tool",
+                "arguments": {"root_path": "workspace/notes", "pattern": "*.md", "max_results": 5},
+            }
+        )
+        agent = MVPAgent(planner=planner)
+        result = asyncio.run(agent.arun_prompt("dummy"))
+
+        self.assertEqual(planner.async_calls, 1)
+        self.assertEqual(result.data["selected_tool"], "file_search_tool")
+        self.assertGreaterEqual(len(result.data["tool_output"]), 1)
+
+    def test_arun_prompt_wraps_sync_planner_and_falls_back(self) -> None:
+        agent = MVPAgent(planner=BrokenPlanner())
+        result = asyncio.run(agent.arun_prompt("app以下のpythonファイルを教えて"))
+        self.assertEqual(result.data["selected_tool"], "file_search_tool")
+        self.assertIn("fallback planner used", result.message)
+
+
+class SpeculativeSearchTests(unittest.TestCase):
+    PROMPT = "workspace/notes フォルダの md を検索して"
+
+    def setUp(self) -> None:
+        self.base = Path("workspace")
+        (self.base / "notes").mkdir(parents=True, exist_ok=True)
+        (self.base / "notes" / "sample.md").write_text("# sample\n", encoding="utf-8")
+        (self.base / "notes" / "sample.txt").write_text("sample\n", encoding="utf-8")
+        self.stats = SpeculationStats()
+
+    def tearDown(self) -> None:
+        if self.base.exists():
+            shutil.rmtree(self.base)
+
+    def search_decision(self, pattern: str) -> dict:
+        return {
+            "action": "use_tool",
+            "tool_name": "file_search_tool",
+            "arguments": {"root_path": "workspace/notes", "pattern": pattern, "max_results": 20},
+        }
+
+    def test_matching_plan_reuses_speculative_search(self) -> None:
+        planner = FakePlanner(self.search_decision("*.md"))
+        agent = MVPAgent(planner=planner, speculative=True, speculation_stats=self.stats)
+        result = agent.run_prompt(self.PROMPT)
+
+        self.assertEqual(result.data["speculation"]["status"], "hit")
+        self.assertEqual(result.data["speculation"]["hit_rate"], 1.0)
+        self.assertEqual([Path(item["path"]).name for item in result.data["tool_output"]], ["sample.md"])
+
+    def test_different_plan_discards_speculation(self) -> None:
+        planner = FakePlanner(self.search_decision("*.txt"))
+        agent = MVPAgent(planner=planner, speculative=True, speculation_stats=self.stats)
+        result = agent.run_prompt(self.PROMPT)
+
+        self.assertEqual(result.data["speculation"]["status"], "miss")
+        self.assertEqual([Path(item["path"]).name for item in result.data["tool_output"]], ["sample.txt"])
+        deadline = time.monotonic() + 5
+        while self.stats.snapshot()["misses"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.stats.snapshot()["misses"], 1)
+
+    def test_discarded_speculation_stops_walking(self) -> None:
+        walking = threading.Event()
+        stopped = threading.Event()
+
+        def endless_walk(agent, **params) -> AgentResult:
+            walking.set()
+            deadline = time.monotonic() + 5
+            try:
+                while time.monotonic() < deadline:
+                    check_cancelled()
+                    time.sleep(0.01)
+            finally:
+                stopped.set()
+            return AgentResult(message="walked the whole disk", data=[])
+
+        slow_search = ToolSpec(
+            name="file_search_tool",
+            description="Search files.",
+            input_model=FileSearchInput,
+            execute=endless_walk,
+            read_only=True,
+        )
+        class SlowPlanner(FakePlanner):
+            def plan(self, user_prompt: str) -> dict:
+                walking.wait(2)  # decide only once the guessed walk is under way
+                return super().plan(user_prompt)
+
+        planner = SlowPlanner({"action": "respond", "answer": "検索は不要です"})
+        agent = MVPAgent(
+            planner=planner,
+            speculative=True,
+            speculation_stats=self.stats,
+            tools=ToolRegistry([slow_search, DOCUMENT_CREATE_TOOL]),
+        )
+        result = agent.run_prompt(self.PROMPT)
+
+        self.assertEqual(result.data["speculation"]["status"], "miss")
+        self.assertTrue(stopped.wait(2))
+        deadline = time.monotonic() + 2
+        while self.stats.snapshot()["misses"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.stats.snapshot()["misses"], 1)
+
+    def test_fallback_plan_is_a_hit_and_async_path_speculates(self) -> None:
+        agent = MVPAgent(planner=BrokenPlanner(), speculative=True, speculation_stats=self.stats)
+        result = asyncio.run(agent.arun_prompt(self.PROMPT))
+        self.assertEqual(result.data["speculation"]["status"], "hit")
+        self.assertIn("fallback planner used", result.message)
+
+    def test_invalid_arguments_skip_speculation_and_fail_the_tool_call(self) -> None:
+        def never_called(agent, **params) -> AgentResult:
+            raise AssertionError("tool ran with invalid arguments")
+
+        strict_search = ToolSpec(
+            name="file_search_tool",
+            description="Search files.",
+            input_model=FileSearchInput,
+            execute=never_called,
+            read_only=True,
+            coerce=lambda args: {**args, "max_results": 0},
+        )
+        agent = MVPAgent(
+            planner=FakePlanner(self.search_decision("*.md")),
+            speculative=True,
+            speculation_stats=self.stats,
+            tools=ToolRegistry([strict_search, DOCUMENT_CREATE_TOOL]),
+        )
+        result = agent.run_prompt(self.PROMPT)
+
+        self.assertIn("Invalid arguments for file_search_tool", result.message)
+        self.assertIsNone(result.data["tool_output"])
+        self.assertIsNone(result.data["speculation"])
+
+    def test_writes_and_default_mode_do_not_speculate(self) -> None:
+        decision = {
+            "action": "use_tool",
+            "tool_name": "document_create_tool",
+            "arguments": {"title": "memo", "content": "本文", "format": "md", "output_dir": "notes"},
+        }
+        agent = MVPAgent(planner=FakePlanner(decision), speculative=True, speculation_stats=self.stats)
+        self.assertIsNone(agent.run_prompt("メモを作成して保存して").data["speculation"])
+
+        agent = MVPAgent(planner=FakePlanner(self.search_decision("*.md")), speculation_stats=self.stats)
+        self.assertIsNone(agent.run_prompt(self.PROMPT).data["speculation"])
+        self.assertEqual(self.stats.snapshot()["hits"] + self.stats.snapshot()["misses"], 0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,14 +1,17 @@
 ﻿from __future__ import annotations
 
 import importlib.util
+import shutil
 import unittest
+from pathlib import Path
 
 if importlib.util.find_spec("fastapi") is None:
     raise unittest.SkipTest("fastapi is not installed")
 
 from fastapi.testclient import TestClient
 
-from app.api.server import create_app
+from app.api.server import create_app, get_llm, get_planner
+from app.llm.scheduler import DeadlineExceeded, SchedulerRejected
 
 
 class APIServerTests(unittest.TestCase):
@@ -40,6 +43,98 @@ class APIServerTests(unittest.TestCase):
         body = res.json()
         self.assertIn("Found", body["message"])
 
+    def test_search_endpoint_returns_304_for_matching_etag(self) -> None:
+        payload = {"root_path": "app", "pattern": "*.py", "max_results": 5}
+        first = self.client.post("/v1/tools/search", json=payload)
+        etag = first.headers["etag"]
+
+        second = self.client.post("/v1/tools/search", json=payload, headers={"If-None-Match": etag})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.headers["etag"], etag)
+
+    def test_search_endpoint_parses_if_none_match_lists(self) -> None:
+        payload = {"root_path": "app", "pattern": "*.py", "max_results": 5}
+        etag = self.client.post("/v1/tools/search", json=payload).headers["etag"]
+
+        for header, status in (
+            (f'"other", W/{etag}', 304),
+            ("*", 304),
+            (f'"x{etag[1:]}', 200),
+            (f'{etag[:-1]}-columns"', 200),
+        ):
+            res = self.client.post("/v1/tools/search", json=payload, headers={"If-None-Match": header})
+            self.assertEqual(res.status_code, status, header)
+
+    def test_create_stream_endpoint_writes_raw_body(self) -> None:
+        body = ("line\n" * 10000 + "\n\n").encode("utf-8")
+        try:
+            res = self.client.post(
+                "/v1/tools/create/stream?title=Large&format=txt&output_dir=uploads",
+                content=body,
+                headers={"Content-Type": "text/plain; charset=utf-8"},
+            )
+            self.assertEqual(res.status_code, 200)
+            saved = Path(res.json()["data"]["saved_path"])
+            self.assertEqual(saved.read_text(encoding="utf-8"), "Large\n=====\n\n" + "line\n" * 10000)
+        finally:
+            shutil.rmtree("workspace", ignore_errors=True)
+
+    def test_chat_sheds_load_with_retry_after(self) -> None:
+        class OverloadedLLM:
+            def __init__(self, error: Exception) -> None:
+                self.error = error
+
+            def count_tokens(self, text: str) -> int:
+                return len(text)
+
+            def invoke(self, prompt: str, **kwargs) -> str:
+                raise self.error
+
+            async def ainvoke(self, prompt: str, **kwargs) -> str:
+                raise self.error
+
+        app = self.client.app
+        for error, status in ((SchedulerRejected("queue full"), 429), (DeadlineExceeded("too late"), 503)):
+            app.dependency_overrides[get_llm] = lambda error=error: OverloadedLLM(error)
+            try:
+                res = self.client.post("/v1/agent/chat", json={"prompt": "app以下のpythonファイルを教えて"})
+            finally:
+                app.dependency_overrides.clear()
+            self.assertEqual(res.status_code, status)
+            self.assertEqual(res.headers["retry-after"], "1")
+
+    def test_chat_requests_share_the_planner_prompt_cache(self) -> None:
+        class RecordingLLM:
+            def __init__(self) -> None:
+                self.systems: list[str] = []
+
+            def count_tokens(self, text: str) -> int:
+                return len(text)
+
+            async def ainvoke(self, prompt: str, **kwargs) -> str:
+                self.systems.append(kwargs["system"])
+                return '{"action": "respond", "answer": "ok"}'
+
+        llm = RecordingLLM()
+        app = self.client.app
+        app.dependency_overrides[get_llm] = lambda: llm
+        try:
+            for _ in range(2):
+                res = self.client.post("/v1/agent/chat", json={"prompt": "こんにちは"})
+                self.assertEqual(res.status_code, 200)
+        finally:
+            app.dependency_overrides.clear()
+        self.assertEqual(len(llm.systems), 2)
+        self.assertIs(llm.systems[0], llm.systems[1])
+        self.assertIs(get_planner(llm), get_planner(llm))
+
+    def test_model_status_endpoint(self) -> None:
+        res = self.client.get("/v1/model/status")
+        self.assertEqual(res.status_code, 200)
+        body = res.json()
+        self.assertIn("loaded", body)
+        self.assertIn("kv_cache_bytes", body)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,241 @@
+﻿from __future__ import annotations
+
+import asyncio
+import json
+import shutil
+import sqlite3
+import threading
+import unittest
+from pathlib import Path
+
+from app.agent.audit import FIELDS, AuditSink, export_records, iter_records, query_records
+from app.agent.runner import MVPAgent
+from app.cancellation import OperationCancelled
+
+
+class FixedPlanner:
+    def plan(self, user_prompt: str) -> dict:
+        return {
+            "action": "use_tool",
+            "tool_name": "file_search_tool",
+            "arguments": {"root_path": "workspace", "pattern": "*.md", "max_results": 5},
+        }
+
+
+class BrokenPlanner:
+    def plan(self, user_prompt: str) -> dict:
+        raise RuntimeError("model not available")
+
+
+class CancelledPlanner:
+    def plan(self, user_prompt: str) -> dict:
+        raise OperationCancelled("Request client disconnected")
+
+
+class StalledSink(AuditSink):
+    """Writer that waits for ``release`` so the queue fills up."""
+
+    release = threading.Event()
+
+    def _open_backend(self):
+        backend = super()._open_backend()
+        release = self.release
+
+        class Stalled:
+            def write(self, records):
+                release.wait(5)
+                backend.write(records)
+
+            def close(self):
+                backend.close()
+
+        return Stalled()
+
+
+class AuditSinkTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base = Path("workspace")
+        self.base.mkdir(parents=True, exist_ok=True)
+        (self.base / "a.md").write_text("# a\n", encoding="utf-8")
+
+    def tearDown(self) -> None:
+        if self.base.exists():
+            shutil.rmtree(self.base)
+
+    def test_sqlite_sink_batches_into_wal_database(self) -> None:
+        path = self.base / "audit" / "runs.db"
+        sink = AuditSink(path, batch_size=50, flush_interval=0.05)
+        for n in range(120):
+            self.assertTrue(sink.put({"ts": n, "prompt": f"p{n}", "tool_input": {"n": n}}))
+        sink.close()
+
+        stats = sink.stats()
+        self.assertEqual(stats["written"], 120)
+        self.assertLess(stats["batches"], 120)
+        conn = sqlite3.connect(path)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        conn.close()
+        records = list(iter_records(path))
+        self.assertEqual(records[-1]["tool_input"], {"n": 119})
+
+    def test_jsonl_sink_rotates_and_reads_back_in_order(self) -> None:
+        path = self.base / "audit.jsonl"
+        sink = AuditSink(path, batch_size=1, flush_interval=0, max_bytes=200, backups=2)
+        for n in range(10):
+            sink.put({"ts": n, "prompt": "x" * 50})
+        sink.close()
+
+        self.assertTrue((self.base / "audit.jsonl.1").exists())
+        self.assertFalse((self.base / "audit.jsonl.3").exists())
+        timestamps = [record["ts"] for record in iter_records(path)]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(timestamps[-1], 9)
+
+    def test_drop_policy_counts_records_when_full(self) -> None:
+        StalledSink.release.clear()
+        sink = StalledSink(self.base / "audit.jsonl", max_queue=2, batch_size=1, flush_interval=0)
+        try:
+            accepted = [sink.put({"ts": n}) for n in range(10)]
+            self.assertFalse(all(accepted))
+            self.assertEqual(sink.stats()["dropped"], accepted.count(False))
+        finally:
+            StalledSink.release.set()
+            sink.close()
+
+    def test_block_policy_waits_for_room(self) -> None:
+        StalledSink.release.clear()
+        sink = StalledSink(self.base / "audit.jsonl", max_queue=1, policy="block", block_timeout=2, flush_interval=0)
+        try:
+            threading.Timer(0.1, StalledSink.release.set).start()
+            self.assertTrue(all(sink.put({"ts": n}) for n in range(4)))
+        finally:
+            StalledSink.release.set()
+            sink.close()
+        self.assertEqual(sink.stats()["dropped"], 0)
+        self.assertEqual(len(list(iter_records(self.base / "audit.jsonl"))), 4)
+
+    def test_async_block_policy_waits_off_the_event_loop(self) -> None:
+        StalledSink.release.clear()
+        sink = StalledSink(self.base / "audit.jsonl", max_queue=1, policy="block", block_timeout=2, flush_interval=0)
+
+        async def run():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while not StalledSink.release.is_set():
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            ticker = asyncio.create_task(tick())
+            asyncio.get_running_loop().call_later(0.2, StalledSink.release.set)
+            accepted = [await sink.aput({"ts": n}) for n in range(4)]
+            await ticker
+            return accepted, ticks
+
+        try:
+            accepted, ticks = asyncio.run(run())
+        finally:
+            StalledSink.release.set()
+            sink.close()
+        self.assertTrue(all(accepted))
+        self.assertGreater(ticks, 5)
+        self.assertEqual(len(list(iter_records(self.base / "audit.jsonl"))), 4)
+
+    def test_large_fields_are_clipped(self) -> None:
+        path = self.base / "audit.jsonl"
+        sink = AuditSink(path, flush_interval=0, max_field_chars=10)
+        tool_input = {"title": "t", "content": "c" * 50}
+        sink.put({"ts": 1, "prompt": "p" * 50, "message": "short", "tool_input": tool_input})
+        sink.close()
+
+        (record,) = iter_records(path)
+        self.assertEqual(record["prompt"], "p" * 10 + "...[40 chars clipped]")
+        self.assertEqual(record["message"], "short")
+        self.assertEqual(record["tool_input"], {"title": "t", "content": "c" * 10 + "...[40 chars clipped]"})
+        self.assertEqual(tool_input["content"], "c" * 50)
+
+    def test_unopenable_log_is_reported_and_disables_the_sink(self) -> None:
+        path = self.base / "audit.jsonl"
+        path.mkdir()
+        with self.assertLogs("app.agent.audit", level="ERROR") as logs:
+            sink = AuditSink(path, flush_interval=0)
+            sink._thread.join(5)
+
+        self.assertIn("Audit log disabled", logs.output[0])
+        self.assertFalse(sink.put({"prompt": "x"}))
+        self.assertFalse(asyncio.run(sink.aput({"prompt": "x"})))
+        self.assertIsNotNone(sink.stats()["open_error"])
+        sink.close()
+
+    def test_sqlite_log_from_older_schema_gains_new_columns(self) -> None:
+        path = self.base / "old.db"
+        conn = sqlite3.connect(path)
+        conn.execute(f"CREATE TABLE audit (id INTEGER PRIMARY KEY, {', '.join(name for name in FIELDS if name != 'error')})")
+        conn.execute("INSERT INTO audit (prompt) VALUES ('before')")
+        conn.commit()
+        conn.close()
+
+        sink = AuditSink(path, flush_interval=0)
+        sink.put({"prompt": "after", "error": "RuntimeError: boom"})
+        sink.close()
+        self.assertEqual([(r["prompt"], r["error"]) for r in iter_records(path)], [("before", None), ("after", "RuntimeError: boom")])
+
+    def test_rejects_unknown_policy(self) -> None:
+        with self.assertRaises(ValueError):
+            AuditSink(self.base / "audit.jsonl", policy="wait")
+
+
+class AgentAuditTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base = Path("workspace")
+        self.base.mkdir(parents=True, exist_ok=True)
+        (self.base / "a.md").write_text("# a\n", encoding="utf-8")
+        self.path = self.base / "audit.db"
+        self.sink = AuditSink(self.path, flush_interval=0.01)
+
+    def tearDown(self) -> None:
+        self.sink.close()
+        if self.base.exists():
+            shutil.rmtree(self.base)
+
+    def test_run_prompt_records_decision_and_timings(self) -> None:
+        MVPAgent(planner=FixedPlanner(), audit=self.sink).run_prompt("workspace の md を探して")
+        MVPAgent(planner=BrokenPlanner(), audit=self.sink).run_prompt("workspace の md を検索して")
+        self.sink.close()
+
+        planned, fallback = list(iter_records(self.path))
+        self.assertEqual(planned["selected_tool"], "file_search_tool")
+        self.assertEqual(planned["tool_input"]["pattern"], "*.md")
+        self.assertIsNone(planned["fallback_reason"])
+        self.assertGreaterEqual(planned["total_ms"], planned["plan_ms"] + planned["tool_ms"] - 0.01)
+        self.assertEqual(fallback["fallback_reason"], "model not available")
+
+        self.assertEqual(query_records(self.path, fallback_only=True), [fallback])
+        cases = [json.loads(line) for line in export_records(iter_records(self.path), "eval").splitlines()]
+        self.assertEqual(len(cases), 1)
+        self.assertEqual(cases[0]["expected"]["tool_name"], "file_search_tool")
+        self.assertIn("prompt,", export_records([planned], "csv").splitlines()[0])
+
+    def test_runs_that_raise_are_recorded_with_the_error(self) -> None:
+        agent = MVPAgent(planner=CancelledPlanner(), audit=self.sink)
+        with self.assertRaises(OperationCancelled):
+            agent.run_prompt("workspace の md を探して")
+        with self.assertRaises(OperationCancelled):
+            asyncio.run(agent.arun_prompt("workspace の md を検索して"))
+        self.sink.close()
+
+        records = list(iter_records(self.path))
+        self.assertEqual([record["error"] for record in records], ["OperationCancelled: Request client disconnected"] * 2)
+        self.assertEqual(records[0]["prompt"], "workspace の md を探して")
+        self.assertEqual(export_records(records, "eval"), "")
+
+    def test_arun_prompt_records_through_the_async_path(self) -> None:
+        asyncio.run(MVPAgent(planner=FixedPlanner(), audit=self.sink).arun_prompt("workspace の md を探して"))
+        self.sink.close()
+        (record,) = iter_records(self.path)
+        self.assertEqual(record["selected_tool"], "file_search_tool")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+﻿from __future__ import annotations
+
+import shutil
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from app.agent.runner import MVPAgent
+from app.cancellation import CancellationToken, OperationCancelled, cancellation_scope, check_cancelled, current_token
+from app.llm.openvino_qwen import OpenVINOQwen, OpenVINOQwenConfig, _StopOnCancel
+from app.llm.scheduler import LLMScheduler
+from app.tools.file_search import file_search
+
+
+class CancellingPlanner:
+    """Simulates a client hanging up while the LLM is generating."""
+
+    def plan(self, user_prompt: str) -> dict:
+        current_token().cancel("client disconnected")
+        check_cancelled()
+        return {"action": "respond", "answer": "unreachable"}
+
+
+class CancellationTokenTests(unittest.TestCase):
+    def test_checkpoint_is_noop_outside_a_scope(self) -> None:
+        self.assertIsNone(current_token())
+        check_cancelled()
+
+    def test_timeout_cancels_and_is_reported_as_timed_out(self) -> None:
+        token = CancellationToken(timeout=0.01)
+        self.assertFalse(token.cancelled)
+        time.sleep(0.02)
+        self.assertTrue(token.cancelled)
+        self.assertTrue(token.timed_out)
+        with self.assertRaises(OperationCancelled):
+            token.raise_if_cancelled()
+
+    def test_child_token_follows_its_parent_but_not_the_reverse(self) -> None:
+        parent = CancellationToken()
+        child = CancellationToken(parent=parent)
+        child.cancel("discarded")
+        self.assertFalse(parent.cancelled)
+
+        sibling = CancellationToken(parent=parent)
+        parent.cancel("client disconnected")
+        self.assertTrue(sibling.cancelled)
+        self.assertEqual(sibling.reason, "client disconnected")
+
+    def test_generation_criterion_fires_after_cancel(self) -> None:
+        token = CancellationToken()
+        criterion = _StopOnCancel(token)
+        self.assertFalse(criterion(None, None))
+        token.cancel("client disconnected")
+        self.assertTrue(criterion(None, None))
+        self.assertFalse(token.timed_out)
+
+    def test_invoke_refuses_to_start_when_already_cancelled(self) -> None:
+        llm = OpenVINOQwen(cfg=OpenVINOQwenConfig(model_id="unused"))
+        with cancellation_scope() as token:
+            token.cancel()
+            with self.assertRaises(OperationCancelled):
+                llm.invoke("hello")
+        self.assertFalse(llm.is_loaded)
+
+
+class CancellationCheckpointTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base = Path("workspace")
+        for n in range(3):
+            (self.base / "tree" / f"d{n}").mkdir(parents=True, exist_ok=True)
+        (self.base / "tree" / "d2" / "a.md").write_text("# a\n", encoding="utf-8")
+
+    def tearDown(self) -> None:
+        if self.base.exists():
+            shutil.rmtree(self.base)
+
+    def test_file_search_walk_stops_when_cancelled(self) -> None:
+        with cancellation_scope() as token:
+            token.cancel()
+            with self.assertRaises(OperationCancelled):
+                # No name matches: the walk itself must hit the checkpoint.
+                file_search(root_path="workspace/tree", pattern="*.none", max_results=5)
+
+    def test_file_search_unchanged_without_cancellation(self) -> None:
+        with cancellation_scope():
+            results = file_search(root_path="workspace/tree", pattern="*.md", max_results=5)
+        self.assertEqual(len(results), 1)
+
+    def test_cancelled_planning_is_not_turned_into_a_fallback(self) -> None:
+        agent = MVPAgent(planner=CancellingPlanner())
+        with cancellation_scope():
+            with self.assertRaises(OperationCancelled):
+                agent.run_prompt("workspace の md を検索して")
+
+    def test_scheduler_drops_queued_request_on_cancel(self) -> None:
+        release = threading.Event()
+
+        class BlockingLLM:
+            def invoke(self, prompt: str, **kwargs) -> str:
+                release.wait(5)
+                return prompt
+
+        scheduler = LLMScheduler(BlockingLLM(), max_concurrent=1)
+        holder = threading.Thread(target=scheduler.invoke, args=("hold",))
+        holder.start()
+        while scheduler.stats()["running"] == 0:
+            time.sleep(0.005)
+
+        try:
+            with cancellation_scope(timeout=0.05):
+                with self.assertRaises(OperationCancelled):
+                    scheduler.invoke("queued")
+            self.assertEqual(sum(scheduler.stats()["queued"].values()), 0)
+        finally:
+            release.set()
+            holder.join(5)
+
+
+if __name__ == "__main__":
+    unittest.main()
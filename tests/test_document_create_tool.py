@@ -1,10 +1,13 @@
 ﻿from __future__ import annotations
 
+import os
 import shutil
+import stat
 import unittest
 from pathlib import Path
 
-from app.tools.document_create import create_document
+from app.tools import document_create
+from app.tools.document_create import create_document, create_document_stream
 
 
 class DocumentCreateTests(unittest.TestCase):
@@ -27,6 +30,42 @@ class DocumentCreateTests(unittest.TestCase):
         with self.assertRaises(ValueError):
             create_document("bad", "x", "pdf")
 
+    def test_stream_matches_single_string_output(self) -> None:
+        content = "見出し\n本文  \n\n  two\t\n\u3000\n \n"
+        expected = f"# Notes\n\n{content.rstrip()}\n"
+        data = content.encode("utf-8")
+        for size in (1, 2, 3, 7, len(data)):
+            # Byte chunks may split multi-byte characters and trailing whitespace runs.
+            chunks = [data[i : i + size] for i in range(0, len(data), size)]
+            result = create_document_stream("Notes", chunks, "md", f"stream{size}")
+            self.assertEqual(Path(result["saved_path"]).read_text(encoding="utf-8"), expected)
+
+    def test_stream_strips_whitespace_runs_longer_than_buffer(self) -> None:
+        chunks = ["body", " " * 10, "\n" * 10, "more", "\t " * 20, "\n" * 30]
+        result = create_document_stream("Long", chunks, "txt", buffer_size=8)
+        text = Path(result["saved_path"]).read_text(encoding="utf-8")
+        self.assertEqual(text, "Long\n====\n\nbody" + " " * 10 + "\n" * 10 + "more\n")
+
+    @unittest.skipIf(os.name == "nt", "POSIX permissions")
+    def test_documents_get_the_umask_mode_not_the_temp_file_mode(self) -> None:
+        result = create_document("Mode", "body", "md", "modes")
+        mode = stat.S_IMODE(Path(result["saved_path"]).stat().st_mode)
+        self.assertEqual(mode, 0o666 & ~document_create._UMASK)
+
+        existing = self.base / "modes" / "existing.md"
+        existing.write_text("old", encoding="utf-8")
+        existing.chmod(0o640)
+        self.assertEqual(document_create._file_mode(existing), 0o640)
+
+    def test_stream_failure_leaves_no_partial_file(self) -> None:
+        def broken():
+            yield b"partial"
+            raise OSError("connection reset")
+
+        with self.assertRaises(OSError):
+            create_document_stream("Broken", broken(), "md", "broken")
+        self.assertEqual(list((self.base / "broken").iterdir()), [])
+
 
 if __name__ == "__main__":
     unittest.main()
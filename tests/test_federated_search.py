@@ -0,0 +1,105 @@
+﻿from __future__ import annotations
+
+import importlib.util
+import shutil
+import socket
+import threading
+import time
+import unittest
+from pathlib import Path
+
+if importlib.util.find_spec("fastapi") is None or importlib.util.find_spec("uvicorn") is None:
+    raise unittest.SkipTest("fastapi/uvicorn are not installed")
+
+import uvicorn
+
+from app.agent.runner import MVPAgent
+from app.api.server import create_app
+from app.tools.federated_search import FederatedSearch, Peer, parse_peers
+from app.tools.search_cache import default_search_cache
+
+
+class _PeerServer:
+    """Run the real API app in-process on an ephemeral port."""
+
+    def __init__(self) -> None:
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        config = uvicorn.Config(create_app(), log_level="error", lifespan="off")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.sock]}, daemon=True)
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+        self.sock.close()
+
+
+def _unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FederatedSearchTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base = Path("workspace")
+        (self.base / "notes").mkdir(parents=True, exist_ok=True)
+        for name in ("a.md", "b.md", "c.md"):
+            (self.base / "notes" / name).write_text(f"# {name}\n", encoding="utf-8")
+
+    def tearDown(self) -> None:
+        if self.base.exists():
+            shutil.rmtree(self.base)
+
+    def _local(self, root: str, pattern: str, limit: int) -> list[dict]:
+        return default_search_cache.search(root, pattern, limit)[0]
+
+    def test_parse_peers(self) -> None:
+        peers = parse_peers("nas=http://10.0.0.2:8000, http://10.0.0.3:8000/")
+        self.assertEqual(peers[0], Peer("nas", "http://10.0.0.2:8000"))
+        self.assertEqual(peers[1], Peer("10.0.0.3:8000", "http://10.0.0.3:8000"))
+
+    def test_merges_tagged_results_and_tolerates_dead_peer(self) -> None:
+        with _PeerServer() as url1, _PeerServer() as url2:
+            peers = [Peer("peer1", url1), Peer("peer2", url2), Peer("dead", f"http://127.0.0.1:{_unused_port()}")]
+            federation = FederatedSearch(peers, local_search=self._local, node_name="local", timeout=5)
+            try:
+                results, errors = federation.search("workspace/notes", "*.md", 8)
+                # Second call reuses the pooled keep-alive connections.
+                again, _ = federation.search("workspace/notes", "*.md", 8)
+            finally:
+                federation.close()
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(set(errors), {"dead"})
+        self.assertEqual(again, results)
+        self.assertTrue({"local", "peer1"} <= {item["node"] for item in results})
+        mtimes = [int(item["mtime"]) for item in results]
+        self.assertEqual(mtimes, sorted(mtimes, reverse=True))
+        self.assertEqual(len({(item["node"], item["path"]) for item in results}), 8)
+
+    def test_agent_file_search_tool_uses_federation(self) -> None:
+        with _PeerServer() as url:
+            federation = FederatedSearch([Peer("peer1", url)], local_search=self._local, node_name="local")
+            try:
+                result = MVPAgent(planner=object(), federation=federation).search_files_federated(
+                    root_path="workspace/notes", pattern="*.md", max_results=10
+                )
+            finally:
+                federation.close()
+
+        self.assertEqual({item["node"] for item in result.data}, {"local", "peer1"})
+        self.assertIn("on 2 node(s)", result.message)
+
+
+if __name__ == "__main__":
+    unittest.main()
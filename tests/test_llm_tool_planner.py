@@ -1,15 +1,26 @@
 ﻿from __future__ import annotations
 
+import asyncio
 import unittest
 
 from app.agent.runner import LLMToolPlanner
+from app.llm.prompt_budget import PromptBudget
 
 
 class StubLLM:
     def __init__(self, response: str):
         self.response = response
 
-    def invoke(self, prompt: str) -> str:
+    def invoke(self, prompt: str, **kwargs) -> str:
+        self.last_prompt = prompt
+        self.last_kwargs = kwargs
+        return self.response
+
+
+class AsyncStubLLM(StubLLM):
+    async def ainvoke(self, prompt: str, **kwargs) -> str:
+        self.last_prompt = prompt
+        self.async_called = True
         return self.response
 
 
@@ -36,6 +47,35 @@ class LLMToolPlannerTests(unittest.TestCase):
         with self.assertRaises(ValueError):
             planner.plan("x")
 
+    def test_long_prompt_is_excerpted_and_content_passed_by_reference(self) -> None:
+        llm = StubLLM(
+            '{"action":"use_tool","tool_name":"document_create_tool",'
+            '"arguments":{"title":"memo","content":"@user_request","format":"md"}}'
+        )
+        planner = LLMToolPlanner(llm=llm, budget=PromptBudget(max_input_tokens=64))
+        long_prompt = "メモとして保存して: " + "x" * 20000
+        decision = planner.plan(long_prompt)
+
+        self.assertLess(len(llm.last_prompt), 2000)
+        self.assertEqual(decision["arguments"]["content"], long_prompt)
+
+    def test_plans_without_thinking_and_strips_reasoning(self) -> None:
+        llm = StubLLM('<think>\nlong reasoning {"x": 1}\n</think>\n{"action":"respond","answer":"ok"}')
+        planner = LLMToolPlanner(llm=llm)
+        decision = planner.plan("hello")
+
+        self.assertEqual(decision["answer"], "ok")
+        self.assertIs(llm.last_kwargs["enable_thinking"], False)
+        self.assertIn("tool planner", llm.last_kwargs["system"])
+
+    def test_aplan_awaits_async_llm(self) -> None:
+        llm = AsyncStubLLM('{"action":"respond","answer":"ok"}')
+        planner = LLMToolPlanner(llm=llm)
+        decision = asyncio.run(planner.aplan("hello"))
+
+        self.assertTrue(llm.async_called)
+        self.assertEqual(decision["answer"], "ok")
+
 
 if __name__ == "__main__":
     unittest.main()
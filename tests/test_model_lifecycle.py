@@ -0,0 +1,117 @@
+﻿from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import unittest
+
+from app.llm.lifecycle import ModelLifecycleConfig, ModelLifecycleManager, ModelMemoryError
+
+
+class FakeLLM:
+    def __init__(self, model_bytes: int = 1024):
+        self.model_bytes = model_bytes
+        self.loaded = False
+        self.loads = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.loaded
+
+    def load(self) -> None:
+        self.loaded = True
+        self.loads += 1
+
+    def unload(self) -> None:
+        self.loaded = False
+
+    def estimate_model_bytes(self) -> int:
+        return self.model_bytes
+
+    def kv_cache_bytes(self) -> int:
+        return 64 if self.loaded else 0
+
+    def invoke(self, prompt: str, **kwargs) -> str:
+        return f"echo:{prompt}"
+
+
+class SlowLoadingLLM(FakeLLM):
+    def __init__(self) -> None:
+        super().__init__()
+        self.release = threading.Event()
+
+    def load(self) -> None:
+        self.release.wait(5)
+        super().load()
+
+
+class ModelLifecycleManagerTests(unittest.TestCase):
+    def test_loads_on_demand_and_reports_status(self) -> None:
+        llm = FakeLLM()
+        manager = ModelLifecycleManager(llm, ModelLifecycleConfig(idle_unload_seconds=0))
+
+        self.assertFalse(manager.status()["loaded"])
+        self.assertEqual(manager.invoke("hi"), "echo:hi")
+
+        status = manager.status()
+        self.assertTrue(status["loaded"])
+        self.assertEqual(status["load_count"], 1)
+        self.assertEqual(status["kv_cache_bytes"], 64)
+        self.assertGreaterEqual(status["process_rss_bytes"], 0)
+
+    def test_unloads_after_idle_timeout_and_reloads(self) -> None:
+        llm = FakeLLM()
+        manager = ModelLifecycleManager(llm, ModelLifecycleConfig(idle_unload_seconds=0.05))
+        manager.invoke("first")
+
+        deadline = time.monotonic() + 2
+        while llm.is_loaded and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(llm.is_loaded)
+        self.assertEqual(manager.status()["unload_count"], 1)
+
+        manager.invoke("second")
+        self.assertEqual(llm.loads, 2)
+
+    def test_async_callers_wait_for_a_load_without_holding_threads(self) -> None:
+        llm = SlowLoadingLLM()
+        manager = ModelLifecycleManager(llm, ModelLifecycleConfig(idle_unload_seconds=0, memory_limit_mb=0))
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=2))
+            calls = [asyncio.create_task(manager.ainvoke(f"p{n}")) for n in range(20)]
+            await asyncio.sleep(0.05)
+            # The executor is still free while the load is in progress.
+            free = await asyncio.wait_for(loop.run_in_executor(None, lambda: "free"), 1)
+            llm.release.set()
+            return free, await asyncio.gather(*calls)
+
+        free, replies = asyncio.run(run())
+        self.assertEqual(free, "free")
+        self.assertEqual(replies, [f"echo:p{n}" for n in range(20)])
+        self.assertEqual(llm.loads, 1)
+        self.assertEqual(manager.status()["in_flight"], 0)
+
+    def test_async_callers_see_load_errors(self) -> None:
+        manager = ModelLifecycleManager(
+            FakeLLM(model_bytes=10 * 1024 * 1024), ModelLifecycleConfig(idle_unload_seconds=0, memory_limit_mb=1)
+        )
+        with self.assertRaises(ModelMemoryError):
+            asyncio.run(manager.ainvoke("hi"))
+
+    def test_refuses_load_above_memory_limit(self) -> None:
+        llm = FakeLLM(model_bytes=10 * 1024 * 1024)
+        manager = ModelLifecycleManager(llm, ModelLifecycleConfig(memory_limit_mb=1))
+        with self.assertRaises(ModelMemoryError):
+            manager.invoke("x")
+        self.assertFalse(llm.is_loaded)
+
+    def test_rejects_unknown_load_policy(self) -> None:
+        with self.assertRaises(ValueError):
+            ModelLifecycleManager(FakeLLM(), ModelLifecycleConfig(load_policy="drop"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+﻿from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from app.llm.lifecycle import ModelLifecycleConfig, ModelLifecycleManager
+from app.llm.model_server import ModelClient, ModelServer, parse_address
+
+if not hasattr(socket, "AF_UNIX"):
+    raise unittest.SkipTest("unix domain sockets are not available")
+
+
+class FakeLLM:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def invoke(self, prompt: str, **kwargs) -> str:
+        if prompt == "boom":
+            raise RuntimeError("generation failed")
+        return f"{prompt}|{kwargs.get('enable_thinking')}"
+
+    def invoke_batch(self, prompts: list[str], **kwargs) -> list[str]:
+        self.batch_sizes.append(len(prompts))
+        return [self.invoke(prompt, **kwargs) for prompt in prompts]
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+
+class FakeLoadableLLM(FakeLLM):
+    """FakeLLM with the load/unload surface ModelLifecycleManager needs."""
+
+    def __init__(self):
+        super().__init__()
+        self.is_loaded = False
+
+    def load(self) -> None:
+        self.is_loaded = True
+
+    def unload(self) -> None:
+        self.is_loaded = False
+
+    def estimate_model_bytes(self) -> int:
+        return 0
+
+    def kv_cache_bytes(self) -> int:
+        return 0
+
+
+class ModelServerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.address = str(Path(self.tmp.name) / "model.sock")
+        self.llm = FakeLLM()
+        self.server = ModelServer(self.llm, address=self.address, max_batch_size=8, batch_window_ms=100)
+        self.server.start()
+        self.client = ModelClient(self.address, timeout=5)
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def test_socket_is_private_and_not_taken_over(self) -> None:
+        self.assertEqual(stat.S_IMODE(os.stat(self.address).st_mode), 0o600)
+        with self.assertRaises(RuntimeError):
+            ModelServer(FakeLLM(), address=self.address).start()
+        self.assertEqual(self.client.invoke("still here"), "still here|None")
+
+    def test_default_address_is_per_user(self) -> None:
+        from app.llm import model_server
+
+        previous = os.environ.get("XDG_RUNTIME_DIR")
+        os.environ["XDG_RUNTIME_DIR"] = self.tmp.name
+        try:
+            self.assertEqual(model_server.default_address(), str(Path(self.tmp.name) / "aiagent-model.sock"))
+        finally:
+            if previous is None:
+                del os.environ["XDG_RUNTIME_DIR"]
+            else:
+                os.environ["XDG_RUNTIME_DIR"] = previous
+
+    def test_stale_socket_is_replaced(self) -> None:
+        stale = str(Path(self.tmp.name) / "stale.sock")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(stale)
+        listener.close()  # the path remains but nobody answers
+        server = ModelServer(FakeLLM(), address=stale)
+        server.start()
+        try:
+            client = ModelClient(stale, timeout=5)
+            self.assertEqual(client.invoke("hi"), "hi|None")
+            client.close()
+        finally:
+            server.stop()
+
+    def test_parse_address(self) -> None:
+        self.assertEqual(parse_address("127.0.0.1:8765"), ("tcp", ("127.0.0.1", 8765)))
+        self.assertEqual(parse_address("/tmp/x.sock"), ("unix", "/tmp/x.sock"))
+        self.assertEqual(parse_address("C:\\\\tmp\\\\x.sock")[0], "unix")
+
+    def test_invoke_round_trip_with_kwargs(self) -> None:
+        self.assertEqual(self.client.invoke("hi", enable_thinking=False), "hi|False")
+        self.assertEqual(self.client.count_tokens("a b c"), 3)
+
+    def test_ainvoke_round_trip(self) -> None:
+        self.assertEqual(asyncio.run(self.client.ainvoke("hi", enable_thinking=True)), "hi|True")
+
+    def test_concurrent_requests_are_batched(self) -> None:
+        results: dict[int, str] = {}
+
+        def call(i: int) -> None:
+            results[i] = self.client.invoke(f"p{i}", enable_thinking=False)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {i: f"p{i}|False" for i in range(4)})
+        self.assertGreater(max(self.llm.batch_sizes, default=1), 1)
+
+    def test_errors_surface_as_runtime_error(self) -> None:
+        with self.assertRaises(RuntimeError):
+            self.client.invoke("boom")
+        self.assertEqual(self.client.invoke("ok"), "ok|None")
+
+    def test_unavailable_server_raises_runtime_error(self) -> None:
+        client = ModelClient(str(Path(self.tmp.name) / "missing.sock"), timeout=1)
+        with self.assertRaises(RuntimeError):
+            client.invoke("x")
+
+
+class LifecycleWrappedServerTests(unittest.TestCase):
+    """The server as ``python -m app.main serve-model`` builds it."""
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.address = str(Path(self.tmp.name) / "model.sock")
+        self.llm = FakeLoadableLLM()
+        manager = ModelLifecycleManager(self.llm, ModelLifecycleConfig(memory_limit_mb=0, idle_unload_seconds=0))
+        self.server = ModelServer(manager, address=self.address, max_batch_size=8, batch_window_ms=200)
+        self.server.start()
+        self.client = ModelClient(self.address, timeout=5)
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def test_concurrent_requests_reach_the_model_as_one_batch(self) -> None:
+        results: dict[int, str] = {}
+        barrier = threading.Barrier(4)
+
+        def call(i: int) -> None:
+            barrier.wait()
+            results[i] = self.client.invoke(f"p{i}", enable_thinking=False)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {i: f"p{i}|False" for i in range(4)})
+        self.assertEqual(self.llm.batch_sizes, [4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,129 @@
 ﻿from __future__ import annotations
 
+import asyncio
+import importlib.util
 import shutil
+import threading
+import time
 import unittest
 from pathlib import Path
+from types import SimpleNamespace
 
-from app.llm.openvino_qwen import OpenVINOQwen, OpenVINOQwenConfig
+from app.agent.runner import LLMToolPlanner, MVPAgent
+from app.agent.sessions import SessionStore
+from app.llm.kv_sessions import SessionKVCache
+from app.llm.openvino_qwen import (
+    OpenVINOQwen,
+    OpenVINOQwenConfig,
+    _StopOnSequences,
+    final_reply,
+    kv_reuse_supported,
+    strip_reasoning,
+    truncate_at_stop,
+)
+
+
+class FakeTokenizer:
+    chat_template = "qwen3"
+
+    def apply_chat_template(self, messages, tokenize, add_generation_prompt, enable_thinking):
+        rendered = "".join(f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in messages)
+        rendered += "<|im_start|>assistant\n"
+        if not enable_thinking:
+            rendered += "<think>\n\n</think>\n\n"
+        return rendered
+
+
+class FakePipe:
+    def __init__(self, reply: str):
+        self.reply = reply
+        self.calls = []
+
+    def __call__(self, text, **kwargs):
+        self.calls.append((text, kwargs))
+        return [{"generated_text": self.reply}]
+
+
+class OverlapPipe(FakePipe):
+    def __init__(self, reply: str):
+        super().__init__(reply)
+        self.active = 0
+        self.max_active = 0
+
+    def __call__(self, text, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        self.active -= 1
+        return super().__call__(text, **kwargs)
+
+
+class TokenIds(list):
+    def tolist(self) -> list[int]:
+        return list(self)
+
+
+class WordTokenizer:
+    """One token per word, returning the tensor-like shapes the session path reads."""
+
+    pad_token_id = 0
+
+    def __init__(self) -> None:
+        self.words = ["<pad>"]
+
+    def __call__(self, text, **kwargs):
+        ids = TokenIds(self._id(word) for word in text.split())
+        return SimpleNamespace(input_ids=[ids], attention_mask=[[1] * len(ids)])
+
+    def decode(self, ids, skip_special_tokens=True) -> str:
+        return " ".join(self.words[i] for i in ids)
+
+    def _id(self, word: str) -> int:
+        if word not in self.words:
+            self.words.append(word)
+        return self.words.index(word)
+
+
+class StatefulModel:
+    """Stateful OVModelForCausalLM stand-in that records how much of each prompt it skipped."""
+
+    stateful = True
+
+    def __init__(self, reply: int) -> None:
+        self.reply = reply
+        self.request = {"kv": []}
+        self.past_lengths: list[int] = []
+
+    def generate(self, input_ids, past_key_values=None, **kwargs):
+        self.past_lengths.append(self._past_length if past_key_values is not None else 0)
+        sequence = TokenIds([*input_ids[0], self.reply])
+        self.request["kv"] = sequence[:-1]
+        return [sequence]
+
+
+class ReplyModel(StatefulModel):
+    """Stateful model whose reply spans several tokens, so part of it lands in the cached KV."""
+
+    def __init__(self, reply: list[int]) -> None:
+        super().__init__(reply[-1])
+        self.replies = reply
+
+    def generate(self, input_ids, past_key_values=None, **kwargs):
+        self.past_lengths.append(self._past_length if past_key_values is not None else 0)
+        sequence = TokenIds([*input_ids[0], *self.replies])
+        self.request["kv"] = sequence[:-1]
+        return [sequence]
+
+
+class ListStateOps:
+    def read(self, request):
+        return [list(request["kv"])], len(request["kv"])
+
+    def write(self, request, arrays):
+        request["kv"] = list(arrays[0])
+
+    def crop(self, request, length):
+        request["kv"] = request["kv"][:length]
 
 
 class OpenVINOQwenResolveModelTests(unittest.TestCase):
@@ -51,5 +170,145 @@ class OpenVINOQwenResolveModelTests(unittest.TestCase):
             self.assertTrue(hasattr(compat, name), f"Missing symbol after patch: {name}")
 
 
+class OpenVINOQwenInvokeTests(unittest.TestCase):
+    def _llm(self, reply: str) -> tuple[OpenVINOQwen, FakePipe]:
+        llm = OpenVINOQwen(cfg=OpenVINOQwenConfig(model_id="unused"))
+        pipe = FakePipe(reply)
+        llm._pipe = pipe
+        llm._tokenizer = FakeTokenizer()
+        return llm, pipe
+
+    def test_invoke_applies_chat_template_with_thinking_switch(self) -> None:
+        llm, pipe = self._llm('{"action":"respond"}')
+        reply = llm.invoke("hello", system="be brief", enable_thinking=False)
+
+        rendered, kwargs = pipe.calls[0]
+        self.assertEqual(reply, '{"action":"respond"}')
+        self.assertIn("<|im_start|>system\nbe brief", rendered)
+        self.assertTrue(rendered.endswith("<think>\n\n</think>\n\n"))
+        self.assertFalse(kwargs["return_full_text"])
+
+    def test_invoke_strips_reasoning_from_reply(self) -> None:
+        llm, _ = self._llm("<think>\nplanning...\n</think>\n\nanswer")
+        self.assertEqual(llm.invoke("q", enable_thinking=True), "answer")
+
+    def test_ainvoke_runs_on_inference_thread(self) -> None:
+        llm, pipe = self._llm("answer")
+
+        async def run_many() -> list[str]:
+            return await asyncio.gather(*(llm.ainvoke(f"q{i}", enable_thinking=False) for i in range(5)))
+
+        self.assertEqual(asyncio.run(run_many()), ["answer"] * 5)
+        self.assertEqual(len(pipe.calls), 5)
+
+    def test_sync_and_async_callers_never_generate_concurrently(self) -> None:
+        llm = OpenVINOQwen(cfg=OpenVINOQwenConfig(model_id="unused"))
+        pipe = OverlapPipe("answer")
+        llm._pipe = pipe
+        llm._tokenizer = FakeTokenizer()
+
+        threads = [threading.Thread(target=llm.invoke, args=(f"q{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        asyncio.run(llm.ainvoke("async"))
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(pipe.calls), 5)
+        self.assertEqual(pipe.max_active, 1)
+
+    def test_stop_sequences_inside_reasoning_do_not_cut_the_answer(self) -> None:
+        stop = ["```\n\n", "\n\n\n"]
+        generated = '<think>\nfirst idea\n\n\n```\n\nsecond</think>\n\n{"action":"respond"}\n\n\nextra'
+        self.assertEqual(final_reply(generated, stop), '{"action":"respond"}')
+
+    def test_stop_criterion_is_armed_only_after_reasoning(self) -> None:
+        class PieceTokenizer:
+            def decode(self, ids, skip_special_tokens=True) -> str:
+                return "".join(ids)
+
+        class Ids:
+            def __init__(self, pieces: list[str]) -> None:
+                self.pieces = pieces
+                self.shape = (1, len(pieces))
+
+            def __getitem__(self, key):
+                return self.pieces[key[1]]
+
+        pieces = ["<prompt>", "<think>", "plan", "\n\n\n", "more", "</think>", "\n\n", "{}", "\n\n\n"]
+        thinking = _StopOnSequences(PieceTokenizer(), ["\n\n\n"], after="</think>")
+        fired = [thinking(Ids(pieces[:n]), None) for n in range(2, len(pieces) + 1)]
+        self.assertEqual(fired, [False] * 7 + [True])
+
+        plain = _StopOnSequences(PieceTokenizer(), ["\n\n\n"])
+        self.assertEqual([plain(Ids(pieces[:n]), None) for n in range(2, 5)], [False, False, True])
+
+    def test_strip_reasoning_handles_headless_and_unterminated_blocks(self) -> None:
+        self.assertEqual(strip_reasoning("reasoning</think>\nanswer"), "answer")
+        self.assertEqual(strip_reasoning("answer<think>cut off"), "answer")
+
+    def test_truncate_at_stop_uses_earliest_sequence(self) -> None:
+        self.assertEqual(truncate_at_stop("abc###def@@@", ["@@@", "###"]), "abc")
+        self.assertEqual(truncate_at_stop("abc", None), "abc")
+
+
+
+class SessionKVReuseTests(unittest.TestCase):
+    def _llm(self, reuse: bool) -> tuple[OpenVINOQwen, StatefulModel]:
+        llm = OpenVINOQwen(cfg=OpenVINOQwenConfig(model_id="unused"))
+        llm._tokenizer = WordTokenizer()
+        model = StatefulModel(reply=llm._tokenizer._id("ok"))
+        llm._model = model
+        llm.kv_sessions = SessionKVCache(state_ops=ListStateOps())
+        llm.kv_session_reuse = reuse
+        return llm, model
+
+    def test_only_known_optimum_intel_versions_reuse_kv(self) -> None:
+        self.assertTrue(kv_reuse_supported("1.25.2"))
+        self.assertFalse(kv_reuse_supported("1.26.0"))
+        self.assertFalse(kv_reuse_supported("1.250.0"))
+
+    @unittest.skipIf(importlib.util.find_spec("numpy") is None, "numpy is not installed")
+    def test_follow_up_turn_skips_the_shared_prefix(self) -> None:
+        llm, model = self._llm(reuse=True)
+        first = llm._generate_in_session("sys a b", "s1", model.request, None)
+        second = llm._generate_in_session("sys a b ok c d", "s1", model.request, None)
+
+        self.assertEqual((first, second), ("ok", "ok"))
+        # The reply token was never fed back through the model, so only the prompt is cached.
+        self.assertEqual(model.past_lengths, [0, 3])
+        self.assertEqual(llm.kv_sessions.stats()["reused_tokens"], 3)
+
+    @unittest.skipIf(
+        importlib.util.find_spec("numpy") is None or importlib.util.find_spec("transformers") is None,
+        "numpy/transformers are not installed",
+    )
+    def test_second_agent_turn_reuses_the_first_turn_and_its_reply(self) -> None:
+        llm = OpenVINOQwen(cfg=OpenVINOQwenConfig(model_id="unused"))
+        llm._tokenizer = WordTokenizer()
+        llm._pipe = object()
+        model = ReplyModel([llm._tokenizer._id(word) for word in '{"action":"respond", "answer":"hi"}'.split()])
+        llm._model = model
+        llm.kv_sessions = SessionKVCache(state_ops=ListStateOps())
+        llm.kv_session_reuse = True
+        agent = MVPAgent(planner=LLMToolPlanner(llm=llm), session_store=SessionStore())
+
+        agent.run_prompt("hello", session_id="s1")
+        first_turn = len(model.request["kv"])
+        agent.run_prompt("again", session_id="s1")
+
+        # Everything the model saw or generated last turn, bar the unfed final token.
+        self.assertEqual(model.past_lengths, [0, first_turn])
+
+    def test_unknown_optimum_intel_version_prefills_in_full(self) -> None:
+        llm, model = self._llm(reuse=False)
+        llm._generate_in_session("sys a b", "s1", model.request, None)
+        reply = llm._generate_in_session("sys a b ok c d", "s1", model.request, None)
+
+        self.assertEqual(reply, "ok")
+        self.assertEqual(model.past_lengths, [0, 0])
+        self.assertEqual(llm.kv_sessions.stats()["reused_tokens"], 0)
+
+
 if __name__ == "__main__":
     unittest.main()
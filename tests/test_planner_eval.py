@@ -0,0 +1,77 @@
+﻿from __future__ import annotations
+
+import unittest
+
+from app.agent.planner_eval import EvalCase, evaluate_planner, load_cases
+from app.llm.export import parse_variant, recommend, render_report
+
+
+class ScriptedPlanner:
+    def __init__(self, decisions):
+        self.decisions = list(decisions)
+
+    def plan(self, user_prompt: str, **kwargs):
+        decision = self.decisions.pop(0)
+        if isinstance(decision, Exception):
+            raise decision
+        return decision
+
+
+class PlannerEvalTests(unittest.TestCase):
+    def test_bundled_cases_load(self) -> None:
+        cases = load_cases()
+        self.assertGreaterEqual(len(cases), 5)
+        self.assertTrue(all(case.action in {"use_tool", "respond"} for case in cases))
+
+    def test_scores_tool_choice_arguments_and_invalid_output(self) -> None:
+        cases = [
+            EvalCase("search md", "use_tool", "file_search_tool", {"pattern": "*.md", "max_results": 5}),
+            EvalCase("search py", "use_tool", "file_search_tool", {"pattern": "*.py"}),
+            EvalCase("hello", "respond"),
+        ]
+        planner = ScriptedPlanner(
+            [
+                {"action": "use_tool", "tool_name": "file_search_tool", "arguments": {"pattern": "*.md", "max_results": "5"}},
+                {"action": "use_tool", "tool_name": "file_search_tool", "arguments": {"pattern": "*.txt"}},
+                ValueError("Planner returned invalid JSON"),
+            ]
+        )
+
+        metrics = evaluate_planner(planner, cases)
+
+        self.assertEqual(metrics["cases"], 3)
+        self.assertAlmostEqual(metrics["tool_accuracy"], 2 / 3, places=3)
+        self.assertAlmostEqual(metrics["argument_accuracy"], 1 / 3, places=3)
+        self.assertEqual(metrics["invalid_outputs"], 1)
+        self.assertEqual(len(metrics["failures"]), 2)
+
+
+class QuantizationReportTests(unittest.TestCase):
+    def test_parse_variant_defaults(self) -> None:
+        int8 = parse_variant("int8")
+        self.assertEqual((int8.bits, int8.sym, int8.group_size), (8, False, -1))
+        int4 = parse_variant("int4_asym_g64")
+        self.assertEqual((int4.bits, int4.sym, int4.group_size), (4, False, 64))
+        self.assertTrue(parse_variant("int4").sym)
+        with self.assertRaises(ValueError):
+            parse_variant("fp8")
+
+    def test_recommends_smallest_variant_meeting_accuracy(self) -> None:
+        base = {"model_rss_mb": 1, "load_seconds": 1, "tool_accuracy": 1.0, "invalid_outputs": 0,
+                "latency_ms_p50": 1, "latency_ms_p95": 2}
+        rows = [
+            {**base, "variant": "int8", "disk_mb": 8000, "argument_accuracy": 1.0},
+            {**base, "variant": "int4_sym_g128", "disk_mb": 4500, "argument_accuracy": 0.95},
+            {**base, "variant": "int4_asym_g64", "disk_mb": 4200, "argument_accuracy": 0.7},
+            {"variant": "int4_sym_g32", "error": "export failed"},
+        ]
+
+        self.assertEqual(recommend(rows, 0.9)["variant"], "int4_sym_g128")
+        self.assertIsNone(recommend(rows, 1.1))
+        report = render_report("Qwen/Qwen3-8B", rows, 0.9)
+        self.assertIn("Recommended: `int4_sym_g128`", report)
+        self.assertIn("export failed", report)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+﻿from __future__ import annotations
+
+import importlib.util
+import threading
+import time
+import unittest
+
+from app.api import profiling
+from app.api.profiling import (
+    ProfilerBusy,
+    ProfileStore,
+    allocation_diff,
+    dump_threads,
+    profile_call,
+    pstats_text,
+    render_collapsed,
+    sample_stacks,
+)
+
+
+def busy_worker(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class ProfilingTests(unittest.TestCase):
+    def test_sampler_sees_other_threads_as_collapsed_stacks(self) -> None:
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_worker, args=(stop,), name="busy-worker")
+        worker.start()
+        try:
+            stacks = sample_stacks(0.1, interval=0.005)
+        finally:
+            stop.set()
+            worker.join(5)
+        text = render_collapsed(stacks)
+        self.assertTrue(any(line.startswith("busy-worker;") and "busy_worker (" in line for line in text.splitlines()))
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in text.splitlines()))
+
+    def test_only_one_capture_at_a_time(self) -> None:
+        holder = threading.Thread(target=sample_stacks, args=(0.3,))
+        holder.start()
+        while holder.is_alive() and not profiling._capture_lock.locked():
+            time.sleep(0.001)
+        try:
+            with self.assertRaises(ProfilerBusy):
+                allocation_diff(0.01)
+        finally:
+            holder.join(5)
+
+    def test_allocation_diff_reports_growth(self) -> None:
+        kept: list[bytes] = []
+        timer = threading.Timer(0.02, lambda: kept.extend(bytes(1024) for _ in range(200)))
+        timer.start()
+        diff = allocation_diff(0.2, limit=5)
+        timer.join()
+        self.assertGreater(sum(item["size_diff"] for item in diff["top"]), 100 * 1024)
+        self.assertTrue(all(item["site"] for item in diff["top"]))
+
+    def test_thread_dump_names_threads(self) -> None:
+        self.assertIn(f"Thread {threading.current_thread().name}", dump_threads())
+
+    def test_profile_call_returns_pstats(self) -> None:
+        result, data = profile_call(sorted, [3, 1, 2])
+        self.assertEqual(result, [1, 2, 3])
+        self.assertIn("sorted", pstats_text(data))
+
+        store = ProfileStore(keep=1)
+        first = store.add(data)
+        second = store.add(data)
+        self.assertIsNone(store.get(first))
+        self.assertEqual(store.get(second), data)
+
+
+@unittest.skipIf(importlib.util.find_spec("fastapi") is None, "fastapi is not installed")
+class DebugEndpointTests(unittest.TestCase):
+    def test_endpoints_are_hidden_without_token(self) -> None:
+        from fastapi.testclient import TestClient
+
+        from app.api.server import create_app
+
+        client = TestClient(create_app(debug_token=""))
+        self.assertEqual(client.get("/v1/debug/threads").status_code, 404)
+        res = client.post("/v1/agent/chat?profile=1", json={"prompt": "hello"})
+        self.assertEqual(res.status_code, 404)
+
+    def test_endpoints_require_matching_token(self) -> None:
+        from fastapi.testclient import TestClient
+
+        from app.api.server import create_app
+
+        client = TestClient(create_app(debug_token="secret"))
+        self.assertEqual(client.get("/v1/debug/threads").status_code, 403)
+        self.assertEqual(client.get("/v1/debug/threads", headers={"X-Debug-Token": "wrong"}).status_code, 403)
+
+        headers = {"X-Debug-Token": "secret"}
+        self.assertIn("Thread ", client.get("/v1/debug/threads", headers=headers).text)
+        res = client.get("/v1/debug/profile?seconds=0.05", headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(".collapsed", res.headers["content-disposition"])
+        self.assertEqual(client.get("/v1/debug/profile?seconds=3600", headers=headers).status_code, 422)
+
+    def test_chat_profile_can_be_downloaded(self) -> None:
+        from fastapi.testclient import TestClient
+
+        from app.api.server import create_app
+
+        client = TestClient(create_app(debug_token="secret"))
+        headers = {"X-Debug-Token": "secret"}
+        res = client.post("/v1/agent/chat?profile=1", json={"prompt": "app以下のpythonファイルを教えて"}, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        profile_id = res.headers["x-profile-id"]
+
+        download = client.get(f"/v1/debug/profiles/{profile_id}", headers=headers)
+        self.assertEqual(download.headers["content-type"], "application/octet-stream")
+        text = client.get(f"/v1/debug/profiles/{profile_id}?format=text", headers=headers).text
+        self.assertIn("run_prompt", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+﻿from __future__ import annotations
+
+import unittest
+
+from app.llm.prompt_budget import PromptBudget, estimate_tokens
+
+
+class CountingTokenizer:
+    def __init__(self):
+        self.calls = 0
+        self.longest = 0
+
+    def __call__(self, text: str) -> int:
+        self.calls += 1
+        self.longest = max(self.longest, len(text))
+        return len(text.split())
+
+
+class PromptBudgetTests(unittest.TestCase):
+    def test_counts_are_cached_per_string(self) -> None:
+        counter = CountingTokenizer()
+        budget = PromptBudget(counter=counter, max_input_tokens=32)
+        self.assertEqual(budget.count("a b c"), 3)
+        self.assertEqual(budget.count("a b c"), 3)
+        self.assertEqual(counter.calls, 1)
+
+    def test_short_text_is_unchanged(self) -> None:
+        budget = PromptBudget(counter=CountingTokenizer(), max_input_tokens=32)
+        self.assertEqual(budget.excerpt("short text"), "short text")
+
+    def test_long_text_keeps_head_and_tail_within_budget(self) -> None:
+        budget = PromptBudget(counter=CountingTokenizer(), max_input_tokens=40)
+        text = " ".join(f"w{i}" for i in range(1000))
+        excerpt = budget.excerpt(text)
+
+        self.assertLessEqual(budget.count(excerpt), 40)
+        self.assertTrue(excerpt.startswith("w0 "))
+        self.assertTrue(excerpt.endswith("w999"))
+        self.assertIn("tokens omitted", excerpt)
+
+    def test_huge_text_is_never_tokenized_whole(self) -> None:
+        counter = CountingTokenizer()
+        budget = PromptBudget(counter=counter, max_input_tokens=64)
+        text = "word " * 500_000
+
+        self.assertFalse(budget.fits(text))
+        self.assertEqual(counter.calls, 0)
+
+        excerpt = budget.excerpt(text)
+        self.assertLessEqual(budget.count(excerpt), 64)
+        self.assertLessEqual(counter.longest, 64 * PromptBudget.MAX_CHARS_PER_TOKEN)
+
+        # Large strings are counted on demand instead of being kept as cache keys.
+        calls = counter.calls
+        budget.count(text)
+        budget.count(text)
+        self.assertEqual(counter.calls, calls + 2)
+
+    def test_falls_back_to_estimate_when_counter_fails(self) -> None:
+        def broken(text: str) -> int:
+            raise RuntimeError("no tokenizer")
+
+        budget = PromptBudget(counter=broken, max_input_tokens=32)
+        self.assertEqual(budget.count("abcdefgh"), estimate_tokens("abcdefgh"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+﻿from __future__ import annotations
+
+import os
+import shutil
+import threading
+import unittest
+from pathlib import Path
+
+from app.llm.lifecycle import ModelLifecycleConfig, ModelLifecycleManager
+from app.llm.replicas import ReplicaPool, build_replica_pool, numa_nodes, parse_cpulist, plan_cpusets
+
+
+class FakeLLM:
+    def __init__(self, name: str, release: threading.Event | None = None) -> None:
+        self.name = name
+        self.release = release
+        self.is_loaded = False
+        self.calls: list[str] = []
+        self.load_affinity: set[int] | None = None
+
+    def load(self) -> None:
+        if hasattr(os, "sched_getaffinity"):
+            self.load_affinity = os.sched_getaffinity(0)
+        self.is_loaded = True
+
+    def unload(self) -> None:
+        self.is_loaded = False
+
+    def estimate_model_bytes(self) -> int:
+        return 100
+
+    def kv_cache_bytes(self) -> int:
+        return 0
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+    def invoke(self, prompt: str, **kwargs) -> str:
+        if self.release is not None:
+            self.release.wait(5)
+        self.calls.append(prompt)
+        return f"{self.name}:{prompt}"
+
+
+class CpuPlanTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base = Path("workspace")
+
+    def tearDown(self) -> None:
+        if self.base.exists():
+            shutil.rmtree(self.base)
+
+    def test_parse_cpulist(self) -> None:
+        self.assertEqual(parse_cpulist("0-3,8-9,16\n"), [0, 1, 2, 3, 8, 9, 16])
+        self.assertEqual(parse_cpulist(""), [])
+
+    def test_numa_nodes_reads_sysfs_and_respects_affinity(self) -> None:
+        usable = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else [0]
+        root = self.base / "node"
+        (root / "node0").mkdir(parents=True)
+        (root / "node0" / "cpulist").write_text(f"{usable[0]}\n", encoding="utf-8")
+        (root / "node1").mkdir()
+        (root / "node1" / "cpulist").write_text("100000\n", encoding="utf-8")
+        self.assertEqual(numa_nodes(root), [[usable[0]]])
+        self.assertEqual(numa_nodes(self.base / "missing"), [usable])
+
+    def test_plan_cpusets_never_straddles_nodes(self) -> None:
+        nodes = [[0, 1, 2, 3], [4, 5, 6, 7]]
+        self.assertEqual(plan_cpusets(0, nodes), nodes)
+        self.assertEqual(plan_cpusets(1, nodes), [[0, 1, 2, 3]])
+        self.assertEqual(plan_cpusets(4, nodes), [[0, 1], [2, 3], [4, 5], [6, 7]])
+        self.assertEqual(plan_cpusets(3, nodes), [[0, 1], [2, 3], [4, 5, 6, 7]])
+
+    def test_build_replica_pool_is_off_by_default(self) -> None:
+        self.assertIsNone(build_replica_pool(""))
+        self.assertIsNone(build_replica_pool("off"))
+
+
+class ReplicaPoolTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cpu = sorted(os.sched_getaffinity(0))[0] if hasattr(os, "sched_getaffinity") else 0
+        self.pools: list[ReplicaPool] = []
+
+    def tearDown(self) -> None:
+        for pool in self.pools:
+            pool.close()
+
+    def make_pool(self, *llms: FakeLLM) -> ReplicaPool:
+        pool = ReplicaPool(list(llms), [[self.cpu] for _ in llms])
+        self.pools.append(pool)
+        return pool
+
+    def test_load_runs_on_the_pinned_thread(self) -> None:
+        llm = FakeLLM("a")
+        pool = self.make_pool(llm)
+        pool.load()
+        self.assertTrue(pool.is_loaded)
+        if hasattr(os, "sched_getaffinity"):
+            self.assertEqual(llm.load_affinity, {self.cpu})
+
+    def test_busy_replica_is_skipped(self) -> None:
+        release = threading.Event()
+        slow, idle = FakeLLM("slow", release), FakeLLM("idle")
+        pool = self.make_pool(slow, idle)
+        first = pool._dispatch(None, lambda llm: llm.invoke("first"))
+        try:
+            self.assertEqual(pool.invoke("second"), "idle:second")
+        finally:
+            release.set()
+        self.assertEqual(first.result(5), "slow:first")
+
+    def test_session_sticks_to_one_replica(self) -> None:
+        pool = self.make_pool(FakeLLM("a"), FakeLLM("b"), FakeLLM("c"))
+        answers = {pool.invoke("hi", session_id="s-1").split(":")[0] for _ in range(5)}
+        self.assertEqual(len(answers), 1)
+
+    def test_stats_and_lifecycle_status(self) -> None:
+        pool = self.make_pool(FakeLLM("a"), FakeLLM("b"))
+        manager = ModelLifecycleManager(pool, ModelLifecycleConfig(idle_unload_seconds=0, memory_limit_mb=0))
+        manager.invoke("hello")
+        replicas = manager.status()["replicas"]
+        self.assertEqual([replica["index"] for replica in replicas], [0, 1])
+        self.assertEqual(sum(replica["completed"] for replica in replicas), 3)  # two loads + one call
+        self.assertTrue(all(replica["loaded"] for replica in replicas))
+
+
+if __name__ == "__main__":
+    unittest.main()
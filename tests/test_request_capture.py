@@ -0,0 +1,115 @@
+﻿from __future__ import annotations
+
+import importlib.util
+import json
+import shutil
+import socket
+import threading
+import time
+import unittest
+from pathlib import Path
+
+if importlib.util.find_spec("fastapi") is None or importlib.util.find_spec("uvicorn") is None:
+    raise unittest.SkipTest("fastapi/uvicorn are not installed")
+
+import uvicorn
+from fastapi.testclient import TestClient
+
+from app.api.capture import REDACTED, encode_body, parse_fields
+from app.api.replay import ReplayClient, load_capture, parse_speed, record_body, schedule
+from app.api.server import create_app
+
+
+class RequestCaptureTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base = Path("workspace")
+        (self.base / "notes").mkdir(parents=True, exist_ok=True)
+        (self.base / "notes" / "a.md").write_text("# a\n", encoding="utf-8")
+        self.capture_path = self.base / "capture" / "requests.jsonl"
+
+    def tearDown(self) -> None:
+        if self.base.exists():
+            shutil.rmtree(self.base)
+
+    def _capture(self) -> list[dict]:
+        app = create_app(capture_path=str(self.capture_path))
+        client = TestClient(app)
+        client.get("/v1/health")
+        client.post(
+            "/v1/tools/search",
+            json={"root_path": "notes", "pattern": "*.md", "max_results": 5},
+            headers={"Authorization": "Bearer secret", "X-Debug-Token": "debug-secret", "X-Trace": "t1"},
+        )
+        client.get("/v1/missing")
+        app.state.capture.close()
+        return [json.loads(line) for line in self.capture_path.read_text(encoding="utf-8").splitlines()]
+
+    def test_records_are_sanitized_and_skip_health(self) -> None:
+        records = self._capture()
+
+        self.assertEqual([record["path"] for record in records], ["/v1/tools/search", "/v1/missing"])
+        search = records[0]
+        self.assertEqual(search["status"], 200)
+        self.assertEqual(search["headers"]["authorization"], REDACTED)
+        self.assertEqual(search["headers"]["x-debug-token"], REDACTED)
+        self.assertEqual(search["headers"]["x-trace"], "t1")
+        self.assertNotIn("host", search["headers"])
+        self.assertEqual(json.loads(search["body"])["pattern"], "*.md")
+        self.assertEqual(records[1]["status"], 404)
+
+    def test_non_utf8_body_round_trips_through_base64(self) -> None:
+        app = create_app(capture_path=str(self.capture_path))
+        payload = b"\xff\xfe binary \x00"
+        TestClient(app).post("/v1/tools/create/stream?title=Bin&format=txt&output_dir=uploads", content=payload)
+        app.state.capture.close()
+
+        record = json.loads(self.capture_path.read_text(encoding="utf-8").splitlines()[0])
+        self.assertEqual(record["body_encoding"], "base64")
+        self.assertEqual(record_body(record), payload)
+
+    def test_listed_json_fields_are_redacted_at_any_depth(self) -> None:
+        body = json.dumps({"prompt": "secret", "meta": {"content": "x", "keep": 1}, "items": [{"prompt": "y"}]})
+        record = encode_body(body.encode("utf-8"), parse_fields("prompt, content"))
+
+        self.assertTrue(record["body_redacted"])
+        self.assertEqual(
+            json.loads(record["body"]),
+            {"prompt": REDACTED, "meta": {"content": REDACTED, "keep": 1}, "items": [{"prompt": REDACTED}]},
+        )
+        self.assertEqual(encode_body(b'{"pattern": "*.md"}', parse_fields("prompt")), {"body": '{"pattern": "*.md"}'})
+
+    def test_schedule_preserves_gaps_and_speed(self) -> None:
+        records = [{"ts": 100.0}, {"ts": 101.0}, {"ts": 104.0}]
+        self.assertEqual(schedule(records, 1.0), [0.0, 1.0, 4.0])
+        self.assertEqual(schedule(records, parse_speed("2x")), [0.0, 0.5, 2.0])
+        self.assertEqual(schedule(records, parse_speed("max")), [0.0, 0.0, 0.0])
+
+    def test_replay_reports_latency_and_errors_per_path(self) -> None:
+        self._capture()
+        records = load_capture(self.capture_path)
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        server = uvicorn.Server(uvicorn.Config(create_app(capture_path=""), log_level="error", lifespan="off"))
+        thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 10
+        while not server.started and time.monotonic() < deadline:
+            time.sleep(0.01)
+        try:
+            report = ReplayClient(f"http://127.0.0.1:{sock.getsockname()[1]}", max_workers=4).replay(records, speed=0.0)
+        finally:
+            server.should_exit = True
+            thread.join(timeout=5)
+            sock.close()
+
+        self.assertEqual(report["requests"], 2)
+        search = report["paths"]["POST /v1/tools/search"]
+        self.assertEqual(search["count"], 1)
+        self.assertEqual(search["errors"], 0)
+        self.assertEqual(report["paths"]["GET /v1/missing"]["client_errors"], 1)
+        self.assertGreater(report["paths"]["all"]["max_ms"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
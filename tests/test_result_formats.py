@@ -0,0 +1,81 @@
+﻿from __future__ import annotations
+
+import importlib.util
+import shutil
+import unittest
+from pathlib import Path
+
+from app.tools.file_search import FileRecord, file_search, search_records
+from app.tools.result_formats import COLUMNS_MEDIA_TYPE, negotiate_format, to_columns
+
+
+class ResultFormatTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base = Path("workspace")
+        (self.base / "notes").mkdir(parents=True, exist_ok=True)
+        (self.base / "notes" / "a.md").write_text("# a\n", encoding="utf-8")
+        (self.base / "notes" / "b.md").write_text("# bb\n", encoding="utf-8")
+
+    def tearDown(self) -> None:
+        if self.base.exists():
+            shutil.rmtree(self.base)
+
+    def test_records_are_typed_and_rows_stay_backward_compatible(self) -> None:
+        records = search_records("workspace/notes", "*.md", 10)
+        self.assertTrue(all(isinstance(record.size, int) and isinstance(record.mtime, int) for record in records))
+        self.assertEqual(file_search("workspace/notes", "*.md", 10), [record.as_row() for record in records])
+        self.assertIsInstance(file_search("workspace/notes", "*.md", 10)[0]["size"], str)
+
+    def test_columns_roundtrip_rows_from_peers(self) -> None:
+        rows = [
+            {"path": "/x/a.md", "size": "4", "mtime": "10", "node": "nas"},
+            {"path": "/y/b.md", "size": "5", "mtime": "11", "node": "pc"},
+        ]
+        columns = to_columns(FileRecord.from_row(row) for row in rows)
+        self.assertEqual(
+            columns,
+            {"path": ["/x/a.md", "/y/b.md"], "size": [4, 5], "mtime": [10, 11], "node": ["nas", "pc"]},
+        )
+        self.assertNotIn("node", to_columns([FileRecord("/x", 1, 2)]))
+
+    def test_negotiation_prefers_explicit_format_then_accept(self) -> None:
+        self.assertEqual(negotiate_format(None, ""), "rows")
+        self.assertEqual(negotiate_format(None, "application/json"), "rows")
+        self.assertEqual(negotiate_format(None, f"{COLUMNS_MEDIA_TYPE}, */*"), "columns")
+        self.assertEqual(negotiate_format(None, "application/x-msgpack"), "msgpack")
+        self.assertEqual(negotiate_format("columns", "application/x-msgpack"), "columns")
+        with self.assertRaises(ValueError):
+            negotiate_format("xml")
+
+    @unittest.skipIf(importlib.util.find_spec("fastapi") is None, "fastapi is not installed")
+    def test_search_endpoint_serves_columns_and_msgpack(self) -> None:
+        from fastapi.testclient import TestClient
+
+        from app.api.server import create_app
+
+        client = TestClient(create_app())
+        payload = {"root_path": "workspace/notes", "pattern": "*.md", "max_results": 10}
+
+        rows = client.post("/v1/tools/search", json=payload)
+        columns = client.post("/v1/tools/search?format=columns", json=payload)
+        self.assertEqual(columns.status_code, 200)
+        data = columns.json()["data"]
+        self.assertEqual(sorted(data["size"]), [4, 5])
+        self.assertEqual(sorted(data["path"]), sorted(item["path"] for item in rows.json()["data"]))
+        self.assertNotEqual(columns.headers["etag"], rows.headers["etag"])
+        cached = client.post(
+            "/v1/tools/search?format=columns", json=payload, headers={"If-None-Match": columns.headers["etag"]}
+        )
+        self.assertEqual(cached.status_code, 304)
+
+        packed = client.post("/v1/tools/search", json=payload, headers={"Accept": "application/x-msgpack"})
+        if importlib.util.find_spec("msgpack") is None:
+            self.assertEqual(packed.status_code, 406)
+        else:
+            import msgpack
+
+            self.assertEqual(msgpack.unpackb(packed.content)["data"], data)
+
+
+if __name__ == "__main__":
+    unittest.main()
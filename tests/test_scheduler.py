@@ -0,0 +1,199 @@
+﻿from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import unittest
+
+from app.llm.scheduler import DeadlineExceeded, LLMScheduler, SchedulerRejected, request_context
+
+
+class GatedLLM:
+    """Records call order; the prompt "hold" blocks until released."""
+
+    def __init__(self):
+        self.calls: list[str] = []
+        self.release = threading.Event()
+        self.holding = threading.Event()
+
+    def invoke(self, prompt: str, **kwargs) -> str:
+        if prompt == "hold":
+            self.holding.set()
+            self.release.wait(5)
+        self.calls.append(prompt)
+        return prompt
+
+
+class LLMSchedulerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.llm = GatedLLM()
+        self.scheduler = LLMScheduler(self.llm, max_concurrent=1, max_queued_per_client=4)
+        self.threads: list[threading.Thread] = []
+        self.errors: dict[str, Exception] = {}
+        self._submit("hold", "interactive", "owner")
+        self.llm.holding.wait(5)
+
+    def tearDown(self) -> None:
+        self.llm.release.set()
+        for thread in self.threads:
+            thread.join(5)
+
+    def _submit(self, prompt: str, priority: str, client: str, timeout: float | None = None) -> None:
+        def run() -> None:
+            with request_context(priority, client, timeout):
+                try:
+                    self.scheduler.invoke(prompt)
+                except RuntimeError as exc:
+                    self.errors[prompt] = exc
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.threads.append(thread)
+        self._wait_queued(prompt)
+
+    def _wait_queued(self, prompt: str) -> None:
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            if prompt in self.errors or sum(self.scheduler.stats()["queued"].values()) >= len(self.threads) - 1:
+                return
+            time.sleep(0.005)
+
+    def _drain(self) -> list[str]:
+        self.llm.release.set()
+        for thread in self.threads:
+            thread.join(5)
+        return self.llm.calls
+
+    def test_interactive_requests_overtake_batch(self) -> None:
+        self._submit("batch-1", "batch", "etl")
+        self._submit("batch-2", "batch", "etl")
+        self._submit("chat-1", "interactive", "alice")
+
+        self.assertEqual(self._drain(), ["hold", "chat-1", "batch-1", "batch-2"])
+
+    def test_clients_share_fairly_within_a_class(self) -> None:
+        for n in range(1, 4):
+            self._submit(f"a-{n}", "batch", "a")
+        self._submit("b-1", "batch", "b")
+
+        self.assertEqual(self._drain(), ["hold", "a-1", "b-1", "a-2", "a-3"])
+
+    def test_expired_requests_never_reach_the_model(self) -> None:
+        self._submit("late", "interactive", "alice", timeout=0.05)
+        time.sleep(0.15)
+
+        self.assertEqual(self._drain(), ["hold"])
+        self.assertIsInstance(self.errors["late"], DeadlineExceeded)
+        self.assertEqual(self.scheduler.stats()["classes"]["interactive"]["expired"], 1)
+
+    def test_per_client_queue_limit(self) -> None:
+        for n in range(5):
+            self._submit(f"a-{n}", "batch", "a")
+
+        self._drain()
+        self.assertIsInstance(self.errors["a-4"], SchedulerRejected)
+        self.assertEqual(self.scheduler.stats()["classes"]["batch"]["rejected"], 1)
+
+
+class FairShareBookkeepingTests(unittest.TestCase):
+    def test_served_clients_are_tracked_up_to_a_cap(self) -> None:
+        scheduler = LLMScheduler(GatedLLM(), max_concurrent=1)
+        scheduler.MAX_TRACKED_CLIENTS = 3
+        for n in range(10):
+            with request_context("interactive", f"client-{n}"):
+                scheduler.invoke(f"q{n}")
+
+        self.assertEqual(list(scheduler._last_served), ["client-7", "client-8", "client-9"])
+
+
+class RequestTimingTests(unittest.TestCase):
+    def test_queue_wait_and_inference_are_reported_separately(self) -> None:
+        class SlowLLM:
+            async def ainvoke(self, prompt: str, **kwargs) -> str:
+                await asyncio.sleep(0.05)
+                return prompt
+
+        scheduler = LLMScheduler(SlowLLM(), max_concurrent=1)
+
+        async def run():
+            async def one(name: str):
+                with request_context("interactive", name) as ctx:
+                    await scheduler.ainvoke(name)
+                return ctx
+
+            return await asyncio.gather(one("first"), one("second"))
+
+        first, second = asyncio.run(run())
+        self.assertGreaterEqual(first.inference_ms + second.inference_ms, 90)
+        self.assertGreaterEqual(max(first.queue_wait_ms, second.queue_wait_ms), 30)
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+
+
+class AsyncWaiterTests(unittest.TestCase):
+    def test_queued_async_callers_hold_no_threads(self) -> None:
+        release = asyncio.Event()
+        served: list[str] = []
+
+        class HeldLLM:
+            async def ainvoke(self, prompt: str, **kwargs) -> str:
+                if prompt == "hold":
+                    await release.wait()
+                served.append(prompt)
+                return prompt
+
+        scheduler = LLMScheduler(HeldLLM(), max_concurrent=1, max_queued_per_client=0)
+
+        async def call(prompt: str, priority: str, client: str) -> str:
+            with request_context(priority, client):
+                return await scheduler.ainvoke(prompt)
+
+        async def run():
+            # Far more waiters than executor workers: priority must still decide the order.
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2))
+            holder = asyncio.create_task(call("hold", "batch", "owner"))
+            await asyncio.sleep(0.01)
+            batch = [asyncio.create_task(call(f"batch-{n}", "batch", f"client-{n}")) for n in range(40)]
+            await asyncio.sleep(0.01)
+            urgent = asyncio.create_task(call("urgent", "interactive", "user"))
+            await asyncio.sleep(0.01)
+            queued = scheduler.stats()["queued"]
+            release.set()
+            await asyncio.gather(holder, urgent, *batch)
+            return queued
+
+        queued = asyncio.run(run())
+        self.assertEqual(queued, {"interactive": 1, "batch": 40})
+        self.assertEqual(served[:2], ["hold", "urgent"])
+        self.assertEqual(len(served), 42)
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+    def test_cancelled_waiter_leaves_the_queue(self) -> None:
+        release = asyncio.Event()
+
+        class HeldLLM:
+            async def ainvoke(self, prompt: str, **kwargs) -> str:
+                await release.wait()
+                return prompt
+
+        scheduler = LLMScheduler(HeldLLM(), max_concurrent=1)
+
+        async def run():
+            holder = asyncio.create_task(scheduler.ainvoke("hold"))
+            await asyncio.sleep(0.01)
+            waiter = asyncio.create_task(scheduler.ainvoke("waiter"))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            queued = scheduler.stats()["queued"]["interactive"]
+            release.set()
+            await holder
+            return queued
+
+        self.assertEqual(asyncio.run(run()), 0)
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+﻿from __future__ import annotations
+
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from app.tools.search_cache import SearchResultCache
+
+
+class SearchResultCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base = Path("workspace")
+        (self.base / "notes").mkdir(parents=True, exist_ok=True)
+        (self.base / "notes" / "a.md").write_text("# a\n", encoding="utf-8")
+
+    def tearDown(self) -> None:
+        if self.base.exists():
+            shutil.rmtree(self.base)
+
+    def test_repeated_search_hits_cache_with_same_etag(self) -> None:
+        cache = SearchResultCache()
+        first, etag1 = cache.search("workspace/notes", "*.md", 10)
+        second, etag2 = cache.search("./workspace/notes", "*.md", 10)
+
+        self.assertEqual(first, second)
+        self.assertEqual(etag1, etag2)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_new_file_in_result_directory_invalidates_entry(self) -> None:
+        cache = SearchResultCache()
+        _, etag1 = cache.search("workspace/notes", "*.md", 10)
+
+        notes = self.base / "notes"
+        (notes / "b.md").write_text("# b\n", encoding="utf-8")
+        stat = notes.stat()
+        os.utime(notes, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        results, etag2 = cache.search("workspace/notes", "*.md", 10)
+        self.assertEqual(len(results), 2)
+        self.assertNotEqual(etag1, etag2)
+        self.assertEqual(cache.stats()["stale"], 1)
+
+    def test_rewritten_result_invalidates_entry_and_etag(self) -> None:
+        cache = SearchResultCache()
+        _, etag1 = cache.search("workspace/notes", "*.md", 10)
+
+        notes = self.base / "notes"
+        note = notes / "a.md"
+        before = notes.stat().st_mtime_ns
+        note.write_text("# A\n", encoding="utf-8")
+        stat = note.stat()
+        os.utime(note, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        dir_stat = notes.stat()
+        os.utime(notes, ns=(dir_stat.st_atime_ns, before))
+
+        _, etag2 = cache.search("workspace/notes", "*.md", 10)
+        self.assertNotEqual(etag1, etag2)
+        self.assertEqual(cache.stats()["stale"], 1)
+
+    def test_invalidate_bumps_generation(self) -> None:
+        cache = SearchResultCache()
+        cache.search("workspace/notes", "*.md", 10)
+        cache.invalidate()
+        cache.search("workspace/notes", "*.md", 10)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_lru_eviction_bounds_entries(self) -> None:
+        cache = SearchResultCache(max_entries=2)
+        for limit in (1, 2, 3):
+            cache.search("workspace/notes", "*.md", limit)
+
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["evictions"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+﻿from __future__ import annotations
+
+import shutil
+import time
+import unittest
+from pathlib import Path
+
+from app.agent.runner import LLMToolPlanner, MVPAgent
+from app.agent.sessions import SessionStore
+from app.llm.kv_sessions import SessionKVCache
+
+
+class RecordingPlanner:
+    def __init__(self):
+        self.calls = []
+
+    def plan(self, user_prompt: str, history=None, session_id=None) -> dict:
+        self.calls.append({"prompt": user_prompt, "history": history, "session_id": session_id})
+        return {
+            "action": "use_tool",
+            "tool_name": "file_search_tool",
+            "arguments": {"root_path": "workspace/notes", "pattern": "*.md", "max_results": 5},
+        }
+
+
+class ScriptedLLM:
+    """Returns a fixed planner reply and records the history each call was given."""
+
+    def __init__(self, reply: str):
+        self.reply = reply
+        self.histories = []
+
+    def invoke(self, prompt: str, **kwargs) -> str:
+        self.histories.append(kwargs.get("history"))
+        return self.reply
+
+
+class FakeStateOps:
+    """Stand-in for OpenVINO state access; a request is a dict holding a token-length 'kv' list."""
+
+    def read(self, request):
+        return [list(request["kv"])], len(request["kv"])
+
+    def write(self, request, arrays):
+        request["kv"] = list(arrays[0])
+
+    def crop(self, request, length):
+        request["kv"] = request["kv"][:length]
+
+
+class SessionStoreTests(unittest.TestCase):
+    def test_keeps_only_recent_turns(self) -> None:
+        store = SessionStore(max_turns=2)
+        for i in range(3):
+            store.append("s1", [{"role": "user", "content": f"t{i}"}])
+        self.assertEqual([m["content"] for m in store.history("s1")], ["t1", "t2"])
+
+    def test_evicts_least_recently_used_session(self) -> None:
+        store = SessionStore(max_sessions=2)
+        store.append("a", [{"role": "user", "content": "a"}])
+        store.append("b", [{"role": "user", "content": "b"}])
+        store.history("a")
+        store.append("c", [{"role": "user", "content": "c"}])
+
+        self.assertEqual(store.history("b"), [])
+        self.assertEqual(len(store.history("a")), 1)
+        self.assertEqual(store.stats()["evictions"], 1)
+
+    def test_expires_idle_sessions(self) -> None:
+        store = SessionStore(ttl_seconds=0.01)
+        store.append("s1", [{"role": "user", "content": "x"}])
+        time.sleep(0.02)
+        self.assertEqual(store.history("s1"), [])
+
+    def test_deleted_evicted_and_expired_sessions_are_reported(self) -> None:
+        dropped = []
+        store = SessionStore(max_sessions=1, ttl_seconds=0.05, on_drop=dropped.append)
+        store.append("a", [{"role": "user", "content": "a"}])
+        store.append("b", [{"role": "user", "content": "b"}])
+        self.assertTrue(store.delete("b"))
+        self.assertFalse(store.delete("b"))
+        store.append("c", [{"role": "user", "content": "c"}])
+        time.sleep(0.06)
+        store.stats()
+
+        self.assertEqual(dropped, ["a", "b", "c"])
+
+    def test_dropped_session_releases_its_kv_snapshot(self) -> None:
+        cache = SessionKVCache(state_ops=FakeStateOps())
+        request = {"kv": [1, 2, 3]}
+        cache.commit("s1", [1, 2, 3])
+        cache.park(request)
+        store = SessionStore(on_drop=cache.drop)
+        store.append("s1", [{"role": "user", "content": "x"}])
+
+        store.delete("s1")
+        self.assertEqual(cache.stats()["parked_sessions"], 0)
+        self.assertEqual(cache.snapshot_bytes, 0)
+
+
+class AgentSessionTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base = Path("workspace")
+        (self.base / "notes").mkdir(parents=True, exist_ok=True)
+        (self.base / "notes" / "a.md").write_text("# a\n", encoding="utf-8")
+
+    def tearDown(self) -> None:
+        if self.base.exists():
+            shutil.rmtree(self.base)
+
+    def test_follow_up_turn_receives_prior_turn_and_tool_output(self) -> None:
+        planner = RecordingPlanner()
+        agent = MVPAgent(planner=planner, session_store=SessionStore())
+        agent.run_prompt("find notes", session_id="s1")
+        result = agent.run_prompt("now save those results as a memo", session_id="s1")
+
+        history = planner.calls[1]["history"]
+        self.assertEqual(planner.calls[1]["session_id"], "s1")
+        self.assertEqual([m["role"] for m in history], ["user", "assistant", "tool"])
+        self.assertIn("a.md", history[2]["content"])
+        self.assertEqual(result.data["session_id"], "s1")
+
+    def test_history_replays_the_planner_reply_verbatim(self) -> None:
+        reply = '{"action":"respond","answer":"hi"}'
+        llm = ScriptedLLM(reply)
+        agent = MVPAgent(planner=LLMToolPlanner(llm=llm), session_store=SessionStore())
+        agent.run_prompt("hello", session_id="s1")
+        agent.run_prompt("again", session_id="s1")
+
+        self.assertEqual(llm.histories[1][1], {"role": "assistant", "content": reply})
+
+    def test_stateless_call_does_not_pass_session_arguments(self) -> None:
+        planner = RecordingPlanner()
+        MVPAgent(planner=planner, session_store=SessionStore()).run_prompt("find notes")
+        self.assertIsNone(planner.calls[0]["session_id"])
+        self.assertIsNone(planner.calls[0]["history"])
+
+
+class SessionKVCacheTests(unittest.TestCase):
+    def test_reuses_shared_prefix_and_crops_divergent_tail(self) -> None:
+        cache = SessionKVCache(state_ops=FakeStateOps())
+        request = {"kv": []}
+
+        self.assertEqual(cache.prepare(request, "s1", [1, 2, 3]), 0)
+        request["kv"] = [1, 2, 3, 4]
+        cache.commit("s1", [1, 2, 3, 4])
+
+        self.assertEqual(cache.prepare(request, "s1", [1, 2, 3, 9, 9]), 3)
+        self.assertEqual(request["kv"], [1, 2, 3])
+        self.assertEqual(cache.stats()["reused_tokens"], 3)
+
+    def test_switching_sessions_parks_and_restores_state(self) -> None:
+        cache = SessionKVCache(state_ops=FakeStateOps())
+        request = {"kv": [1, 2, 3]}
+        cache.commit("a", [1, 2, 3])
+
+        self.assertEqual(cache.prepare(request, "b", [7, 8]), 0)
+        request["kv"] = [7, 8, 9]
+        cache.commit("b", [7, 8, 9])
+
+        self.assertEqual(cache.prepare(request, "a", [1, 2, 3, 4]), 3)
+        self.assertEqual(request["kv"], [1, 2, 3])
+        self.assertEqual(cache.stats()["parked_sessions"], 1)
+
+    def test_parked_snapshots_are_bounded(self) -> None:
+        cache = SessionKVCache(max_sessions=1, state_ops=FakeStateOps())
+        request = {"kv": []}
+        for sid in ("a", "b", "c"):
+            cache.prepare(request, sid, [1, 2])
+            request["kv"] = [1, 2]
+            cache.commit(sid, [1, 2])
+        cache.park(request)
+        self.assertEqual(cache.stats()["parked_sessions"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
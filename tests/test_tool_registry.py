@@ -0,0 +1,96 @@
+﻿from __future__ import annotations
+
+import importlib.util
+import json
+import unittest
+
+from pydantic import BaseModel, Field
+
+from app.agent.runner import AgentResult, LLMToolPlanner, MVPAgent
+from app.tools.registry import DOCUMENT_CREATE_TOOL, FILE_SEARCH_TOOL, ToolRegistry, ToolSpec
+
+
+class ClockInput(BaseModel):
+    zone: str = Field(default="UTC", pattern="^(UTC|JST)$")
+
+
+CLOCK_TOOL = ToolSpec(
+    name="clock_tool",
+    description="Tell the time.",
+    input_model=ClockInput,
+    execute=lambda agent, **params: AgentResult(message=f"It is noon {params['zone']}", data=params),
+    read_only=True,
+    hints=("Use clock_tool for questions about the time.",),
+)
+
+
+class StaticLLM:
+    def __init__(self, answer: dict) -> None:
+        self.answer = answer
+        self.systems: list[str] = []
+
+    def invoke(self, prompt: str, **kwargs) -> str:
+        self.systems.append(kwargs["system"])
+        return json.dumps(self.answer)
+
+
+class ToolRegistryTests(unittest.TestCase):
+    def test_prompt_lines_are_derived_from_input_models(self) -> None:
+        self.assertEqual(
+            FILE_SEARCH_TOOL.prompt_line,
+            "- file_search_tool arguments: root_path(str), pattern(str), max_results(int 1..200)",
+        )
+        self.assertEqual(
+            DOCUMENT_CREATE_TOOL.prompt_line,
+            "- document_create_tool arguments: title(str), content(str), format('md'|'txt'), output_dir(str|null)",
+        )
+
+    def test_prepare_coerces_loose_llm_arguments(self) -> None:
+        self.assertEqual(
+            FILE_SEARCH_TOOL.prepare({"root_path": "app", "max_results": "500"}),
+            {"root_path": "app", "pattern": "*.md", "max_results": 200},
+        )
+        with self.assertRaises(ValueError):
+            CLOCK_TOOL.prepare({"zone": "PST"})
+
+    def test_registration_rebuilds_the_cached_prompt_once(self) -> None:
+        registry = ToolRegistry([FILE_SEARCH_TOOL])
+        section = registry.prompt_section()
+        self.assertIs(registry.prompt_section(), section)
+        with self.assertRaises(ValueError):
+            registry.register(FILE_SEARCH_TOOL)
+
+        registry.register(CLOCK_TOOL)
+        self.assertIn("- clock_tool arguments: zone('UTC'|'JST')", registry.prompt_section())
+        self.assertEqual(registry.names(), ["file_search_tool", "clock_tool"])
+
+    def test_planner_and_agent_use_registered_tools(self) -> None:
+        registry = ToolRegistry([FILE_SEARCH_TOOL, CLOCK_TOOL])
+        llm = StaticLLM({"action": "use_tool", "tool_name": "clock_tool", "arguments": {"zone": "JST"}})
+        planner = LLMToolPlanner(llm=llm, registry=registry)
+        agent = MVPAgent(planner=planner, tools=registry)
+
+        result = agent.run_prompt("今何時?")
+        agent.run_prompt("いま何時?")
+        self.assertEqual(result.data["selected_tool"], "clock_tool")
+        self.assertEqual(result.message, "Auto selected: clock_tool. It is noon JST")
+        self.assertIn("Use clock_tool for questions about the time.", llm.systems[0])
+        self.assertIs(llm.systems[0], llm.systems[1])
+
+        with self.assertRaises(ValueError):
+            LLMToolPlanner(llm=llm).plan("今何時?")
+
+    @unittest.skipIf(importlib.util.find_spec("fastapi") is None, "fastapi is not installed")
+    def test_tools_endpoint_lists_schemas(self) -> None:
+        from fastapi.testclient import TestClient
+
+        from app.api.server import create_app
+
+        tools = TestClient(create_app()).get("/v1/tools").json()
+        self.assertEqual([tool["name"] for tool in tools], ["file_search_tool", "document_create_tool"])
+        self.assertEqual([tool["read_only"] for tool in tools], [True, False])
+        self.assertIn("max_results", tools[0]["input_schema"]["properties"])
+
+
+if __name__ == "__main__":
+    unittest.main()